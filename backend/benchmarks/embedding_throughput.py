@@ -0,0 +1,92 @@
+"""
+Embedding throughput against a local stand-in for Ollama's embedding API:
+one request per chunk (what OllamaEmbeddings did) versus OllamaBatchEmbeddings
+at a few batch sizes and concurrency levels.
+
+The stand-in answers /api/embeddings (one prompt) and /api/embed (a batch)
+with fixed vectors after a per-request plus per-text delay, which is what
+dominates a real embedding server's cost. No Ollama needed.
+
+    cd backend && python -m benchmarks.embedding_throughput --chunks 600
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ollama
+
+from utils.embeddings import OllamaBatchEmbeddings
+
+DIM = 768
+
+
+def _handler(request_ms: float, text_ms: float):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if self.path == "/api/embed":
+                inputs = body.get("input") or []
+                inputs = [inputs] if isinstance(inputs, str) else inputs
+                time.sleep((request_ms + text_ms * len(inputs)) / 1000)
+                payload = {"model": body.get("model"), "embeddings": [[0.1] * DIM for _ in inputs]}
+            elif self.path == "/api/embeddings":
+                time.sleep((request_ms + text_ms) / 1000)
+                payload = {"embedding": [0.1] * DIM}
+            else:
+                self.send_error(404)
+                return
+            data = json.dumps(payload).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def _serial(base_url: str, texts):
+    client = ollama.Client(host=base_url)
+    started = time.perf_counter()
+    for text in texts:
+        client.embeddings(model="nomic-embed-text", prompt=f"passage: {text}")
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chunks", type=int, default=600)
+    parser.add_argument("--request-ms", type=float, default=15.0, help="fixed cost of one HTTP request")
+    parser.add_argument("--text-ms", type=float, default=2.0, help="cost of embedding one text")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _handler(args.request_ms, args.text_ms))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    texts = [f"chunk {i}: " + "lorem ipsum " * 100 for i in range(args.chunks)]
+
+    try:
+        seconds = _serial(base_url, texts)
+        print(f"{args.chunks} chunks, {args.request_ms:g} ms/request + {args.text_ms:g} ms/text")
+        print(f"  one request per chunk        : {seconds:7.2f}s  {args.chunks / seconds:8.1f} chunks/s")
+        for batch_size, concurrency in ((16, 1), (32, 1), (32, 4), (64, 4)):
+            embedder = OllamaBatchEmbeddings(model="nomic-embed-text", base_url=base_url,
+                                             batch_size=batch_size, concurrency=concurrency)
+            _, stats = embedder.embed_documents_with_stats(texts)
+            print(f"  batch {batch_size:3d} x {concurrency} in flight     : {stats['embedding_seconds']:7.2f}s  "
+                  f"{stats['chunks_per_second']:8.1f} chunks/s")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Query latency of a project vector store: a fresh Chroma handle per query (as
+before the handle registry) versus load_vector_store()'s cached handle, and
+the one-off cost of reopening after another process wrote to the store.
+
+Embeddings come from a deterministic stand-in so only store handling is
+timed, not Ollama.
+
+    cd backend && python -m benchmarks.vector_store_latency --vectors 2000 --queries 200
+"""
+import os
+import sys
+import time
+import argparse
+import hashlib
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_chroma import Chroma
+from langchain_core.embeddings import Embeddings
+
+from utils import vectorbase
+
+DIM = 768
+
+
+class HashEmbeddings(Embeddings):
+    def _vector(self, text: str):
+        seed = hashlib.sha256(text.encode("utf-8")).digest()
+        return [(seed[i % len(seed)] - 128) / 128.0 for i in range(DIM)]
+
+    def embed_documents(self, texts):
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+def _percentiles(samples):
+    ms = sorted(s * 1000 for s in samples)
+    return {
+        "p50_ms": round(statistics.median(ms), 2),
+        "p95_ms": round(ms[int(len(ms) * 0.95) - 1], 2),
+        "mean_ms": round(statistics.fmean(ms), 2),
+    }
+
+
+def _time_queries(open_store, queries, k):
+    samples = []
+    for q in queries:
+        started = time.perf_counter()
+        open_store().similarity_search_with_score(q, k=k)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--vectors", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    args = parser.parse_args()
+
+    embeddings = HashEmbeddings()
+    vectorbase._embedding_fn = embeddings
+    with tempfile.TemporaryDirectory(prefix="vs_bench_") as persist_directory:
+        texts = [f"chunk {i}: " + "lorem ipsum " * 40 for i in range(args.vectors)]
+        vectorbase.add_vectors(
+            persist_directory,
+            ids=[f"v{i}" for i in range(len(texts))],
+            embeddings=embeddings.embed_documents(texts),
+            metadatas=[{"chunk_id": i} for i in range(len(texts))],
+            documents=texts,
+        )
+        queries = [f"question {i}" for i in range(args.queries)]
+
+        def fresh_handle():
+            return Chroma(embedding_function=HashEmbeddings(), persist_directory=persist_directory,
+                          collection_metadata={"hnsw:space": "cosine"})
+
+        def cached_handle():
+            return vectorbase.load_vector_store(persist_directory)
+
+        cached_handle()  # warm
+        before = _time_queries(fresh_handle, queries, args.k)
+        after = _time_queries(cached_handle, queries, args.k)
+
+        reloads = []
+        for _ in range(min(20, args.queries)):
+            with vectorbase._write_lock(persist_directory):
+                vectorbase._bump_generation(persist_directory)  # what a write from another process leaves behind
+            reloads.extend(_time_queries(cached_handle, queries[:1], args.k))
+
+    print(f"{args.vectors} vectors, {args.queries} queries, k={args.k}")
+    print(f"  new handle per query : {_percentiles(before)}")
+    print(f"  cached handle        : {_percentiles(after)}")
+    print(f"  first query after an external write (reopen): {_percentiles(reloads)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -21,6 +21,20 @@ MAX_TOKENS = int(os.getenv("MAX_TOKENS", 512))
 TEMPERATURE = float(os.getenv("TEMPERATURE", 0.7))
 TOP_K = int(os.getenv("TOP_K", 5))
 
+# Ingestion workers
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 2))  # parallel ingestion processes
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", 3))  # restarts survived per job
+METRICS_STREAM_KEEPALIVE_SECONDS = float(os.getenv("METRICS_STREAM_KEEPALIVE_SECONDS", 15))  # idle gap between SSE pings
+
+# Tabular data endpoint
+TABULAR_PAGE_ROWS = int(os.getenv("TABULAR_PAGE_ROWS", 100))  # default page size of JSON responses
+TABULAR_PAGE_MAX_ROWS = int(os.getenv("TABULAR_PAGE_MAX_ROWS", 5000))  # larger reads must stream (ndjson / arrow)
+
+# Vector store compaction (reclaims index space after deletions)
+VECTOR_COMPACT_INTERVAL_SECONDS = float(os.getenv("VECTOR_COMPACT_INTERVAL_SECONDS", 600))  # 0 disables
+VECTOR_COMPACT_MIN_DELETED = int(os.getenv("VECTOR_COMPACT_MIN_DELETED", 1000))  # deletions before a store is worth rebuilding
+VECTOR_COMPACT_RATIO = float(os.getenv("VECTOR_COMPACT_RATIO", 0.25))  # ...and as a share of the vectors still live
+
 # Create directories
 for directory in [UPLOAD_DIR, VECTOR_DB_PATH, LOGS_DIR]:
     os.makedirs(directory, exist_ok=True)
@@ -2,17 +2,35 @@
 Audio loader: uses the bundled ffmpeg (via imageio-ffmpeg) to extract/normalise
 audio, then OpenAI Whisper (local, offline) to transcribe with timestamps.
 
-Returns a list of segment dicts:
+Returns (or, from transcribe_stream, yields) segment dicts:
   { "start": float, "end": float, "text": str }
 """
 import os
+import time
+import queue
+import threading
 import subprocess
 import tempfile
 import numpy as np
-from typing import List, Dict
+from typing import Iterator, List, Dict, Tuple
 
 SUPPORTED = {".mp3", ".mp4", ".wav", ".m4a", ".ogg", ".flac", ".webm", ".aac", ".wma"}
 
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "base")
+WHISPER_THREADS = int(os.getenv("WHISPER_THREADS", 0))  # torch intra-op threads; 0 keeps the default
+WHISPER_CONCURRENCY = int(os.getenv("WHISPER_CONCURRENCY", 1))  # windows decoded at once per process, one model each
+WHISPER_QUEUE_SIZE = int(os.getenv("WHISPER_QUEUE_SIZE", 4))  # files allowed to wait for a slot
+WHISPER_PRELOAD = os.getenv("WHISPER_PRELOAD", "0") == "1"
+
+WHISPER_WINDOW_SECONDS = float(os.getenv("WHISPER_WINDOW_SECONDS", 300))  # audio decoded and transcribed per step
+
+# Whisper hooks its kv-cache into the model for every decode, so a model must
+# never run two decodes at once: each concurrent slot gets a model of its own.
+_idle_models: "queue.LifoQueue" = queue.LifoQueue()
+_models_loaded = 0
+_model_lock = threading.Lock()
+_pending = threading.BoundedSemaphore(max(1, WHISPER_CONCURRENCY) + max(0, WHISPER_QUEUE_SIZE))
+
 
 def _get_ffmpeg() -> str:
     """Return path to ffmpeg — system binary first, then bundled fallback."""
@@ -81,22 +99,151 @@ def _patch_whisper_ffmpeg():
         pass  # if patching fails, whisper will try system ffmpeg
 
 
+def _load_model():
+    """Load one Whisper model. Returns (model, seconds spent loading)."""
+    started = time.perf_counter()
+    _patch_whisper_ffmpeg()
+    import whisper
+    if WHISPER_THREADS > 0:
+        import torch
+        torch.set_num_threads(WHISPER_THREADS)
+    return whisper.load_model(WHISPER_MODEL), time.perf_counter() - started
+
+
+def _checkout_model() -> Tuple[object, float]:
+    """
+    Take a model for the exclusive use of one decode. Up to WHISPER_CONCURRENCY
+    models are loaded lazily; once they all are, callers wait for one to be
+    returned with _return_model(). Returns (model, seconds spent loading it).
+    """
+    global _models_loaded
+    with _model_lock:
+        try:
+            return _idle_models.get_nowait(), 0.0
+        except queue.Empty:
+            load = _models_loaded < max(1, WHISPER_CONCURRENCY)
+            if load:
+                _models_loaded += 1
+    if not load:
+        return _idle_models.get(), 0.0
+    try:
+        return _load_model()
+    except Exception:
+        with _model_lock:
+            _models_loaded -= 1
+        raise
+
+
+def _return_model(model):
+    _idle_models.put(model)
+
+
+def warm_up():
+    """Load a model ahead of the first audio upload (called at worker start if WHISPER_PRELOAD is set)."""
+    with _model_lock:
+        if _models_loaded or not _idle_models.empty():
+            return
+    _return_model(_checkout_model()[0])
+
+
+def _stream_pcm(file_path: str, window_seconds: float, sr: int) -> Iterator[np.ndarray]:
+    """Decode audio with ffmpeg and yield float32 mono windows of `window_seconds`."""
+    cmd = [
+        _get_ffmpeg(),
+        # errors only: stderr is drained after stdout, so chatter must not fill its pipe
+        "-hide_banner", "-loglevel", "error", "-nostats",
+        "-nostdin", "-threads", "0",
+        "-i", file_path,
+        "-f", "s16le",
+        "-ac", "1",
+        "-acodec", "pcm_s16le",
+        "-ar", str(sr),
+        "-",
+    ]
+    window_bytes = int(window_seconds * sr) * 2
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        while True:
+            data = proc.stdout.read(window_bytes)
+            if not data:
+                break
+            yield np.frombuffer(data[: len(data) - len(data) % 2], np.int16).astype(np.float32) / 32768.0
+        stderr = proc.stderr.read()
+        if proc.wait() != 0:
+            raise RuntimeError(f"Failed to load audio: {stderr.decode(errors='replace')}")
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+
+
+def transcribe_stream(file_path: str, stats: Dict = None) -> Iterator[Dict]:
+    """
+    Transcribe `file_path` window by window (WHISPER_WINDOW_SECONDS of audio at
+    a time) and yield timestamped segments as soon as each window is done, so
+    memory stays flat and callers can index the start of a long recording
+    before the end is transcribed. The tail of the previous window's text is
+    passed as Whisper's prompt to keep wording consistent across the cut.
+
+    Runs on the process-wide transcriber: up to WHISPER_CONCURRENCY windows
+    decoding at once, each on its own model, and at most WHISPER_QUEUE_SIZE
+    more files waiting (callers beyond that block until a slot frees up).
+    If `stats` is given it is filled with model load time and real-time factor.
+    """
+    _pending.acquire()
+    try:
+        import whisper.audio as wa
+
+        load_seconds = 0.0
+        offset = 0.0
+        seconds = 0.0
+        windows = 0
+        prompt = None
+        for audio in _stream_pcm(file_path, WHISPER_WINDOW_SECONDS, wa.SAMPLE_RATE):
+            model, loaded_in = _checkout_model()
+            load_seconds += loaded_in
+            started = time.perf_counter()
+            try:
+                result = model.transcribe(audio, verbose=False, word_timestamps=False, initial_prompt=prompt)
+            finally:
+                _return_model(model)
+            seconds += time.perf_counter() - started
+            windows += 1
+            texts = []
+            for seg in result.get("segments", []):
+                text = seg["text"].strip()
+                texts.append(text)
+                yield {
+                    "start": round(offset + seg["start"], 2),
+                    "end": round(offset + seg["end"], 2),
+                    "text": text,
+                }
+            prompt = " ".join(texts)[-200:] or None
+            offset += len(audio) / wa.SAMPLE_RATE
+
+        if stats is not None:
+            stats.update({
+                "whisper_model": WHISPER_MODEL,
+                "model_load_seconds": round(load_seconds, 3),
+                "transcribe_seconds": round(seconds, 3),
+                "audio_seconds": round(offset, 1),
+                "windows": windows,
+                "real_time_factor": round(seconds / offset, 3) if offset > 0 else None,
+            })
+    finally:
+        _pending.release()
+
+
+def transcribe_with_stats(file_path: str) -> Tuple[List[Dict], Dict]:
+    """Transcribe a whole file. Returns (segments, stats); see transcribe_stream."""
+    stats: Dict = {}
+    segments = list(transcribe_stream(file_path, stats=stats))
+    return segments, stats
+
+
 def transcribe(file_path: str) -> List[Dict]:
     """
     Transcribe an audio file and return timestamped segments.
     Uses the bundled ffmpeg — no system installation required.
     """
-    _patch_whisper_ffmpeg()
-    import whisper
-
-    model = whisper.load_model("base")
-    result = model.transcribe(file_path, verbose=False, word_timestamps=False)
-
-    segments = []
-    for seg in result.get("segments", []):
-        segments.append({
-            "start": round(seg["start"], 2),
-            "end": round(seg["end"], 2),
-            "text": seg["text"].strip(),
-        })
-    return segments
+    return transcribe_with_stats(file_path)[0]
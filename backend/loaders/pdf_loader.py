@@ -1,12 +1,200 @@
+"""
+PDF loader.
+
+Pages are classified first from the PDF's own objects (pdfminer, no
+rendering): text-layer density, image coverage and ruling lines as a table
+signal. Born-digital text pages go through unstructured's `fast` strategy;
+only pages with tables, images or no usable text layer (scans) pay for hi_res.
+Set PDF_ADAPTIVE_STRATEGY=0 to partition every page with hi_res.
+
+hi_res layout detection and OCR run one page at a time on one core, so PDFs of
+at least PDF_PARALLEL_MIN_PAGES pages are split into ranges of
+PDF_PAGES_PER_TASK pages and partitioned on a pool of PDF_PARTITION_WORKERS
+processes. The pool lives for the whole ingestion worker, so each partition
+process loads the layout model once. Ranges are partitioned with their real
+starting page number and merged back in page order, so the result matches a
+single-process run.
+"""
+import os
+import time
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
 from unstructured.partition.pdf import partition_pdf
 
+from config import INGEST_WORKERS
+
+PDF_PARTITION_WORKERS = int(os.getenv("PDF_PARTITION_WORKERS", max(1, (os.cpu_count() or 1) // max(1, INGEST_WORKERS))))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", 4))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", 8))
+PDF_ADAPTIVE_STRATEGY = os.getenv("PDF_ADAPTIVE_STRATEGY", "1") == "1"
+PDF_MIN_TEXT_CHARS = int(os.getenv("PDF_MIN_TEXT_CHARS", 200))  # fewer text-layer chars => treat as scanned
+PDF_MAX_IMAGE_COVERAGE = float(os.getenv("PDF_MAX_IMAGE_COVERAGE", 0.02))  # share of page area covered by images
+PDF_TABLE_RULINGS = int(os.getenv("PDF_TABLE_RULINGS", 8))  # lines/rects suggesting a ruled table
 
-def load(file_path: str):
-    """Partition a PDF into unstructured elements."""
+_pool = None
+
+
+def _partition(file_path: str, strategy: str = "hi_res", starting_page_number: int = 1, metadata_filename: str = None):
     return partition_pdf(
         filename=file_path,
-        strategy="hi_res",
+        strategy=strategy,
         infer_table_structure=True,
         extract_image_block_types=["Image"],
         extract_image_block_to_payload=True,
+        starting_page_number=starting_page_number,
+        metadata_filename=metadata_filename,
     )
+
+
+def _page_count(file_path: str) -> int:
+    from pypdf import PdfReader
+    return len(PdfReader(file_path).pages)
+
+
+def _walk(layout_obj):
+    yield layout_obj
+    if hasattr(layout_obj, "__iter__"):
+        for child in layout_obj:
+            yield from _walk(child)
+
+
+def _classify_pages(file_path: str) -> List[Tuple[str, str]]:
+    """(strategy, reason) for every page, from its text layer, images and ruling lines."""
+    from pdfminer.high_level import extract_pages
+    from pdfminer.layout import LTChar, LTImage, LTLine, LTRect
+
+    plan = []
+    for page in extract_pages(file_path, laparams=None):
+        area = max(1.0, page.width * page.height)
+        chars = images_area = rulings = 0
+        for obj in _walk(page):
+            if isinstance(obj, LTChar):
+                chars += 1
+            elif isinstance(obj, LTImage):
+                images_area += obj.width * obj.height
+            elif isinstance(obj, (LTLine, LTRect)):
+                rulings += 1
+        if chars < PDF_MIN_TEXT_CHARS:
+            plan.append(("hi_res", "scanned" if images_area else "sparse_text"))
+        elif images_area / area > PDF_MAX_IMAGE_COVERAGE:
+            plan.append(("hi_res", "images"))
+        elif rulings >= PDF_TABLE_RULINGS:
+            plan.append(("hi_res", "table"))
+        else:
+            plan.append(("fast", "text"))
+    return plan
+
+
+def _write_range(file_path: str, first: int, last: int, out_dir: str) -> str:
+    """Copy pages first..last (1-based, inclusive) into their own PDF."""
+    from pypdf import PdfReader, PdfWriter
+    reader = PdfReader(file_path)
+    writer = PdfWriter()
+    for index in range(first - 1, last):
+        writer.add_page(reader.pages[index])
+    out_path = os.path.join(out_dir, f"pages_{first:05d}_{last:05d}.pdf")
+    with open(out_path, "wb") as f:
+        writer.write(f)
+    return out_path
+
+
+def _partition_range(range_path: str, strategy: str, first: int, filename: str) -> Tuple[list, float]:
+    """Partition one page range. Executes inside a partition worker process."""
+    started = time.perf_counter()
+    elements = _partition(range_path, strategy=strategy, starting_page_number=first, metadata_filename=filename)
+    return elements, time.perf_counter() - started
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None or getattr(_pool, "_broken", False):
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def _page_tasks(strategies: List[str], per_task: int) -> List[Tuple[int, int, str]]:
+    """Group consecutive pages with the same strategy into (first, last, strategy) ranges of at most `per_task` pages."""
+    per_task = max(1, per_task)
+    tasks = []
+    for page, strategy in enumerate(strategies, start=1):
+        if tasks and tasks[-1][2] == strategy and page - tasks[-1][0] < per_task:
+            tasks[-1] = (tasks[-1][0], page, strategy)
+        else:
+            tasks.append((page, page, strategy))
+    return tasks
+
+
+def load(file_path: str, stats: Dict = None):
+    """
+    Partition a PDF into unstructured elements. If `stats` is given it is
+    filled with page count, per-page strategy and timing, and parallelism for
+    the partitioning metrics.
+    """
+    started = time.perf_counter()
+    try:
+        pages = _page_count(file_path)
+    except Exception:
+        pages = 0  # unreadable by pypdf; let unstructured deal with it
+
+    plan = [("hi_res", "default")] * pages
+    if PDF_ADAPTIVE_STRATEGY and pages:
+        try:
+            plan = _classify_pages(file_path)
+        except Exception as e:
+            print(f"[pdf] page classification failed, using hi_res throughout: {e}")
+        if len(plan) != pages:
+            plan = [("hi_res", "default")] * pages
+    classify_seconds = time.perf_counter() - started
+
+    workers = max(1, PDF_PARTITION_WORKERS)
+    parallel = workers > 1 and pages >= max(2, PDF_PARALLEL_MIN_PAGES)
+    strategies = [strategy for strategy, _ in plan]
+    tasks = _page_tasks(strategies, PDF_PAGES_PER_TASK if parallel else max(1, pages))
+    filename = os.path.basename(file_path)
+
+    if len(tasks) <= 1:
+        # One strategy for the whole file: partition it as is
+        strategy = tasks[0][2] if tasks else "hi_res"
+        task_started = time.perf_counter()
+        results = [(_partition(file_path, strategy=strategy), time.perf_counter() - task_started)]
+        tasks = tasks or [(1, 1, strategy)]
+    else:
+        with tempfile.TemporaryDirectory(prefix="pdf_pages_") as tmp_dir:
+            paths = [_write_range(file_path, first, last, tmp_dir) for first, last, _ in tasks]
+            if parallel:
+                pool = _get_pool(workers)
+                futures = [pool.submit(_partition_range, path, strategy, first, filename)
+                           for path, (first, _, strategy) in zip(paths, tasks)]
+                # Collect in submission order: ranges are ascending, so elements stay in page order
+                results = [f.result() for f in futures]
+            else:
+                results = [_partition_range(path, strategy, first, filename)
+                           for path, (first, _, strategy) in zip(paths, tasks)]
+
+    elements = []
+    task_seconds = 0.0
+    page_stats = []
+    for (first, last, strategy), (range_elements, seconds) in zip(tasks, results):
+        elements.extend(range_elements)
+        task_seconds += seconds
+        per_page = seconds / (last - first + 1)
+        for page in range(first, min(last, pages) + 1):
+            page_stats.append({"page": page, "strategy": strategy, "reason": plan[page - 1][1],
+                               "seconds": round(per_page, 3)})
+    if stats is not None:
+        wall = time.perf_counter() - started
+        stats.update({
+            "pages": pages,
+            "fast_pages": strategies.count("fast"),
+            "hi_res_pages": strategies.count("hi_res"),
+            "classify_seconds": round(classify_seconds, 3),
+            "partition_workers": min(workers, len(tasks)) if parallel else 1,
+            "page_tasks": len(tasks),
+            "partition_seconds": round(wall, 3),
+            "parallel_speedup": round(task_seconds / wall, 2) if parallel and wall > 0 else None,
+            "page_strategies": page_stats,
+        })
+    return elements
@@ -1,59 +1,711 @@
+"""
+Tabular documents (CSV / Excel).
+
+Parsed DataFrames are stored column by column under
+data/projects/{id}/tabular/, so analytical questions do not re-parse the source:
+
+- `document_{id}.arrow`: an uncompressed Arrow IPC file, read through a memory
+  map. Numeric columns come back without copying, and the pandas dtypes
+  (nullable ints, categoricals, tz-aware datetimes) round-trip.
+- `document_{id}.npcols/`: the fallback when pyarrow is not installed. It holds
+  one `.npy` file per column, opened with np.load(mmap_mode="r"), plus a NA
+  mask for columns that need one.
+- `document_{id}.meta.json`: the columns, dtypes, shape and format. It is
+  written last, so a reader never sees a half-written table.
+
+Documents saved as JSON records by earlier versions can still be read.
+
+ingest() streams a CSV or Excel file into the Arrow store in batches of
+TABULAR_BATCH_ROWS rows, so memory use does not grow with the row count. The
+encoding and delimiter are sniffed from the first bytes, and the column types
+come from the first batch. A later batch that does not fit those types widens
+them (int -> float -> string), and the file is streamed again once. Row count,
+missing values and per-column statistics (ColumnStats) are accumulated batch
+by batch.
+
+select_rows() evaluates the filters, search and sort of a table view on the
+loaded frame and returns row positions, so a page is only materialised for
+the rows it shows.
+
+get_dataframe() serves repeat questions from an in-process LRU of loaded
+frames. The LRU is bounded by TABULAR_CACHE_MB and keyed by the meta file's
+mtime, so a document reprocessed by another process is reloaded.
+"""
 import os
+import re
+import csv
 import json
+import codecs
+import shutil
+import operator
+import threading
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import numpy as np
 import pandas as pd
 
+try:
+    import pyarrow as pa
+except ImportError:  # numpy fallback
+    pa = None
+
 
 SUPPORTED = {".csv", ".xlsx", ".xls"}
+TABULAR_FORMAT = os.getenv("TABULAR_FORMAT", "arrow" if pa is not None else "numpy")
+TABULAR_BATCH_ROWS = int(os.getenv("TABULAR_BATCH_ROWS", 50000))  # rows per ingestion batch
+TABULAR_SNIFF_BYTES = 256 * 1024
+TABULAR_DISTINCT_CAP = int(os.getenv("TABULAR_DISTINCT_CAP", 50000))  # stop counting values past this many distinct
+TABULAR_TOP_VALUES = 5
+TABULAR_CACHE_MB = float(os.getenv("TABULAR_CACHE_MB", 512))  # memory budget of loaded DataFrames
+
+# (project_id, document_id) -> (version, DataFrame, bytes)
+_frames: "OrderedDict[Tuple[int, int], Tuple[int, pd.DataFrame, int]]" = OrderedDict()
+_frames_bytes = 0
+_frames_lock = threading.Lock()
+_frames_hits = 0
+_frames_misses = 0
+
+# "column:op[:value]", e.g. "price:gt:100", "city:contains:york", "email:null"
+_FILTER_RE = re.compile(r"^(.+?):(eq|ne|lt|le|gt|ge|contains|null|notnull)(?::(.*))?$", re.S)
+
+
+def _sniff_encoding(sample: bytes) -> str:
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    try:
+        # Incremental: the sample may end in the middle of a character
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    try:
+        from charset_normalizer import from_bytes
+        best = from_bytes(sample).best()
+        if best is not None:
+            return best.encoding
+    except ImportError:
+        pass
+    return "latin1"
+
+
+def sniff_csv(file_path: str) -> Dict:
+    """Encoding and delimiter of a CSV file, guessed from its first bytes."""
+    with open(file_path, "rb") as f:
+        sample = f.read(TABULAR_SNIFF_BYTES)
+    encoding = _sniff_encoding(sample)
+    text = sample.decode(encoding, errors="ignore")
+    try:
+        delimiter = csv.Sniffer().sniff(text[:64 * 1024], delimiters=",;\t|").delimiter
+    except csv.Error:
+        delimiter = ","
+    return {"encoding": encoding, "delimiter": delimiter}
+
+
+def _dedupe_headers(values) -> List[str]:
+    """Header row as pandas would name it: blanks become 'Unnamed: i', repeats get '.1', '.2'."""
+    names, seen = [], {}
+    for i, value in enumerate(values):
+        name = f"Unnamed: {i}" if value is None or str(value).strip() == "" else str(value)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def iter_batches(file_path: str, batch_rows: int = None, sniffed: Dict = None) -> Iterator[pd.DataFrame]:
+    """Read a CSV or Excel file as DataFrames of at most `batch_rows` rows."""
+    batch_rows = max(1, batch_rows or TABULAR_BATCH_ROWS)
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext == ".csv":
+        sniffed = sniffed or sniff_csv(file_path)
+        reader = pd.read_csv(file_path, chunksize=batch_rows, encoding=sniffed["encoding"],
+                             sep=sniffed["delimiter"], encoding_errors="replace")
+        with reader:
+            yield from reader
+    elif ext == ".xlsx":
+        from openpyxl import load_workbook
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            rows = workbook.worksheets[0].iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            columns = _dedupe_headers(header)
+            batch = []
+            for row in rows:
+                batch.append(row[:len(columns)])
+                if len(batch) >= batch_rows:
+                    yield pd.DataFrame.from_records(batch, columns=columns)
+                    batch = []
+            if batch:
+                yield pd.DataFrame.from_records(batch, columns=columns)
+        finally:
+            workbook.close()
+    elif ext == ".xls":
+        # The legacy format has no streaming reader; it is parsed whole
+        df = pd.read_excel(file_path)
+        for start in range(0, max(1, len(df)), batch_rows):
+            yield df.iloc[start:start + batch_rows]
+    else:
+        raise ValueError(f"Unsupported tabular format: {ext}")
 
 
 def load(file_path: str) -> pd.DataFrame:
     """Load a CSV or Excel file and return a DataFrame."""
     ext = os.path.splitext(file_path)[1].lower()
     if ext == ".csv":
-        try:
-            return pd.read_csv(file_path)
-        except UnicodeDecodeError:
-            # Try with a common alternative encoding if UTF-8 fails
-            return pd.read_csv(file_path, encoding='latin1')
+        sniffed = sniff_csv(file_path)
+        return pd.read_csv(file_path, encoding=sniffed["encoding"], sep=sniffed["delimiter"], encoding_errors="replace")
     elif ext in (".xlsx", ".xls"):
         return pd.read_excel(file_path)
     raise ValueError(f"Unsupported tabular format: {ext}")
 
 
-def save_dataframe(df: pd.DataFrame, project_id: int, document_id: int) -> str:
-    """Persist the dataframe as JSON for later querying. Returns the saved path."""
+def _plain(value):
+    """numpy / pandas scalar -> JSON-friendly Python value."""
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class ColumnStats:
+    """
+    Statistics of one column, fed batch by batch: count, nulls, min/max/mean/sum
+    for numbers, min/max for dates, and exact value counts (distinct, top values)
+    until the column has more than TABULAR_DISTINCT_CAP distinct values.
+    """
+    def __init__(self):
+        self.kind = None
+        self.count = 0
+        self.nulls = 0
+        self.min = None
+        self.max = None
+        self.sum = 0
+        self.values: Optional[Counter] = Counter()
+
+    def update(self, s: pd.Series):
+        present = s.dropna()
+        self.nulls += len(s) - len(present)
+        self.count += len(present)
+        if present.empty:
+            return
+        if self.kind is None:
+            if pd.api.types.is_bool_dtype(present.dtype) or (present.dtype == object and present.map(type).eq(bool).all()):
+                self.kind = "bool"
+            elif pd.api.types.is_numeric_dtype(present.dtype):
+                self.kind = "numeric"
+            elif pd.api.types.is_datetime64_any_dtype(present.dtype):
+                self.kind = "datetime"
+            else:
+                self.kind = "text"
+        if self.kind in ("numeric", "datetime"):
+            low, high = present.min(), present.max()
+            self.min = low if self.min is None else min(self.min, low)
+            self.max = high if self.max is None else max(self.max, high)
+        if self.kind == "numeric":
+            self.sum += _plain(present.sum())
+        if self.values is not None:
+            self.values.update(present.value_counts(sort=False).to_dict())
+            if len(self.values) > TABULAR_DISTINCT_CAP:
+                self.values = None  # high cardinality: counts stop being exact or cheap
+
+    def to_dict(self) -> Dict:
+        out = {"kind": self.kind or "empty", "count": self.count, "nulls": self.nulls}
+        if self.kind in ("numeric", "datetime") and self.count:
+            out["min"] = _plain(self.min)
+            out["max"] = _plain(self.max)
+        if self.kind == "numeric" and self.count:
+            out["sum"] = self.sum
+            out["mean"] = self.sum / self.count
+        if self.values is None:
+            out["distinct"] = None
+            out["distinct_over"] = TABULAR_DISTINCT_CAP
+        else:
+            out["distinct"] = len(self.values)
+            out["top"] = [{"value": _plain(v), "count": int(c)} for v, c in self.values.most_common(TABULAR_TOP_VALUES)]
+        return out
+
+
+def _tabular_dir(project_id: int) -> str:
     base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    tabular_dir = os.path.join(base_dir, "data", "projects", str(project_id), "tabular")
-    os.makedirs(tabular_dir, exist_ok=True)
-    path = os.path.join(tabular_dir, f"document_{document_id}.json")
+    return os.path.join(base_dir, "data", "projects", str(project_id), "tabular")
+
+
+def _paths(project_id: int, document_id: int) -> dict:
+    stem = os.path.join(_tabular_dir(project_id), f"document_{document_id}")
+    return {
+        "meta": f"{stem}.meta.json",
+        "arrow": f"{stem}.arrow",
+        "numpy": f"{stem}.npcols",
+        "json": f"{stem}.json",  # legacy records
+    }
+
+
+def _remove(path: str):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def _arrow_safe(df: pd.DataFrame) -> pd.DataFrame:
+    """Object columns mixing types (e.g. ints and strings) are stored as strings."""
+    fixed = {}
+    for i, (_, s) in enumerate(df.items()):
+        if s.dtype == object:
+            try:
+                pa.array(s, from_pandas=True)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                fixed[i] = s.where(s.isna(), s.astype(str))
+    if not fixed:
+        return df
+    df = df.copy()
+    for i, s in fixed.items():
+        df.isetitem(i, s)
+    return df
+
+
+def _write_arrow(df: pd.DataFrame, path: str):
+    table = pa.Table.from_pandas(_arrow_safe(df), preserve_index=False)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with pa.OSFile(tmp, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, path)
+
+
+def _read_arrow(path: str) -> pd.DataFrame:
+    with pa.memory_map(path, "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+    # split_blocks: one block per column, so numeric columns stay views of the map
+    return table.to_pandas(split_blocks=True)
+
+
+def _write_numpy(df: pd.DataFrame, path: str) -> list:
+    tmp = f"{path}.{os.getpid()}.tmp"
+    _remove(tmp)
+    os.makedirs(tmp)
+    files = []
+    for i, (_, s) in enumerate(df.items()):
+        entry = {"values": f"c{i}.npy", "mask": None}
+        dtype = s.dtype
+        if isinstance(dtype, pd.DatetimeTZDtype):
+            values = s.dt.tz_convert("UTC").dt.tz_localize(None).to_numpy()
+        elif isinstance(dtype, np.dtype) and dtype.kind in "biufcmM":
+            values = s.to_numpy()
+        else:
+            mask = s.isna().to_numpy()
+            numpy_dtype = getattr(dtype, "numpy_dtype", None)  # nullable Int64 / Float64 / boolean
+            if numpy_dtype is not None:
+                values = s.to_numpy(dtype=numpy_dtype, na_value=0)
+            else:
+                values = s.astype(object).where(~mask, "").astype(str).to_numpy(dtype=str)
+            if mask.any():
+                entry["mask"] = f"c{i}.mask.npy"
+                np.save(os.path.join(tmp, entry["mask"]), mask, allow_pickle=False)
+        np.save(os.path.join(tmp, entry["values"]), values, allow_pickle=False)
+        files.append(entry)
+    _remove(path)
+    os.replace(tmp, path)
+    return files
+
+
+def _read_numpy(path: str, meta: dict) -> pd.DataFrame:
+    columns = {}
+    for i, (name, entry) in enumerate(zip(meta["columns"], meta["files"])):
+        dtype = pd.api.types.pandas_dtype(meta["dtypes"][name])
+        values = np.load(os.path.join(path, entry["values"]), mmap_mode="r")
+        if entry["mask"]:
+            mask = np.load(os.path.join(path, entry["mask"]))
+            s = pd.Series(values).astype(object)
+            s[mask] = None
+            s = s if dtype == object else s.astype(dtype)
+        elif isinstance(dtype, pd.DatetimeTZDtype):
+            s = pd.Series(values).dt.tz_localize("UTC").dt.tz_convert(dtype.tz)
+        elif values.dtype.kind == "U":
+            s = pd.Series(values.astype(object))
+            s = s if dtype == object else s.astype(dtype)
+        else:
+            s = pd.Series(values, copy=False)
+        columns[i] = s
+    df = pd.DataFrame(columns, copy=False)
+    df.columns = meta["columns"]
+    return df
+
+
+def save_dataframe(df: pd.DataFrame, project_id: int, document_id: int) -> str:
+    """Persist the dataframe in a columnar format for later querying. Returns the saved path."""
+    os.makedirs(_tabular_dir(project_id), exist_ok=True)
+    paths = _paths(project_id, document_id)
+    df = df.set_axis([str(c) for c in df.columns], axis=1)
+    fmt = "arrow" if TABULAR_FORMAT == "arrow" and pa is not None else "numpy"
     meta = {
+        "format": fmt,
         "columns": list(df.columns),
         "dtypes": {c: str(t) for c, t in df.dtypes.items()},
         "shape": list(df.shape),
-        "records": df.to_dict(orient="records"),
     }
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(meta, f, ensure_ascii=False, default=str)
-    return path
+    if fmt == "arrow":
+        _write_arrow(df, paths["arrow"])
+    else:
+        meta["files"] = _write_numpy(df, paths["numpy"])
+    _commit(project_id, document_id, meta)
+    return paths[fmt]
+
+
+def _commit(project_id: int, document_id: int, meta: Dict):
+    """Publish freshly written data by writing its meta file, then drop older copies."""
+    paths = _paths(project_id, document_id)
+    fmt = meta["format"]
+    tmp = f"{paths['meta']}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp, paths["meta"])
+    invalidate_dataframe(project_id, document_id)
+    # Drop whatever an earlier save of this document left in another format
+    for key in ("arrow", "numpy", "json"):
+        if key != fmt:
+            _remove(paths[key])
+
+
+def _widen(current: "pa.DataType", seen: "pa.DataType") -> "pa.DataType":
+    """Narrowest type that holds values of both: null < int < float < string."""
+    if current == seen or pa.types.is_null(seen):
+        return current
+    if pa.types.is_null(current):
+        return seen
+    if pa.types.is_integer(current) and pa.types.is_integer(seen):
+        return pa.int64()
+    numeric = (pa.types.is_integer, pa.types.is_floating)
+    if any(f(current) for f in numeric) and any(f(seen) for f in numeric):
+        return pa.float64()
+    if pa.types.is_timestamp(current) and pa.types.is_timestamp(seen) and current.tz == seen.tz:
+        return current
+    return pa.string()
+
+
+def _pandas_dtype(arrow_type: "pa.DataType", nulls: int) -> str:
+    """dtype a column of this Arrow type comes back as from to_pandas()."""
+    if pa.types.is_null(arrow_type):
+        return "object"
+    if pa.types.is_integer(arrow_type):
+        return "float64" if nulls else np.dtype(arrow_type.to_pandas_dtype()).name
+    if pa.types.is_boolean(arrow_type):
+        return "object" if nulls else "bool"
+    if pa.types.is_floating(arrow_type) or pa.types.is_temporal(arrow_type):
+        return str(pa.array([], type=arrow_type).to_pandas().dtype)
+    return "object"
+
+
+def _write_batches(file_path: str, path: str, types: Optional[List], sniffed: Optional[Dict],
+                   on_batch: Optional[Callable[[int], None]], info: Dict) -> Optional[List]:
+    """
+    One pass over the file into an Arrow IPC file at `path`. Returns None on
+    success, or the widened column types if some batch did not fit `types`, in
+    which case the rest of the file is only scanned and the caller tries again.
+    """
+    writer = None
+    widened = None
+    info.update({"rows": 0, "batches": 0, "missing_values": {}, "column_stats": {}})
+    try:
+        for chunk in iter_batches(file_path, sniffed=sniffed):
+            chunk = chunk.set_axis([str(c) for c in chunk.columns], axis=1)
+            table = pa.Table.from_pandas(_arrow_safe(chunk), preserve_index=False).replace_schema_metadata(None)
+            if types is None:
+                types = list(table.schema.types)
+            if "columns" not in info:
+                info["columns"] = list(chunk.columns)
+                info["preview"] = json.loads(chunk.head(50).to_json(orient="records", date_format="iso"))
+            needed = [_widen(t, s) for t, s in zip(types, table.schema.types)]
+            if needed != types:
+                widened = needed if widened is None else [_widen(w, n) for w, n in zip(widened, needed)]
+            if widened is not None:
+                continue  # keep scanning for further widenings; this pass will be redone
+            schema = pa.schema([pa.field(name, t) for name, t in zip(info["columns"], types)])
+            table = pa.Table.from_arrays([col.cast(t) for col, t in zip(table.columns, types)], schema=schema)
+            if writer is None:
+                writer = pa.ipc.new_file(pa.OSFile(path, "wb"), schema)
+            writer.write_table(table)
+            info["rows"] += table.num_rows
+            info["batches"] += 1
+            for name, col in zip(info["columns"], table.columns):
+                info["missing_values"][name] = info["missing_values"].get(name, 0) + col.null_count
+                info["column_stats"].setdefault(name, ColumnStats()).update(col.to_pandas())
+            if on_batch:
+                on_batch(info["rows"])
+    finally:
+        if writer is not None:
+            writer.close()
+    if widened is not None:
+        return widened
+    info["types"] = types or []
+    if writer is None:
+        # Header only: still write an (empty) table
+        schema = pa.schema([pa.field(name, pa.string()) for name in info.get("columns", [])])
+        with pa.ipc.new_file(pa.OSFile(path, "wb"), schema):
+            pass
+        info["types"] = list(schema.types)
+    return None
+
+
+def ingest(file_path: str, project_id: int, document_id: int,
+           on_batch: Optional[Callable[[int], None]] = None) -> Dict:
+    """
+    Stream a CSV or Excel file into the tabular store. `on_batch(rows_so_far)`
+    is called after each batch. Returns columns, dtypes, shape, missing values
+    and statistics per column, a 50-row preview and how the file was read.
+    """
+    sniffed = sniff_csv(file_path) if file_path.lower().endswith(".csv") else None
+    if pa is None or TABULAR_FORMAT != "arrow":
+        # No streaming writer for the numpy layout: parse whole, as before
+        df = pd.concat(list(iter_batches(file_path, sniffed=sniffed)), ignore_index=True)
+        save_dataframe(df, project_id, document_id)
+        df = df.set_axis([str(c) for c in df.columns], axis=1)
+        stats = {}
+        for i, c in enumerate(df.columns):
+            stats[c] = ColumnStats()
+            stats[c].update(df.iloc[:, i])
+        return {
+            "columns": list(df.columns),
+            "dtypes": {c: str(t) for c, t in df.dtypes.items()},
+            "shape": list(df.shape),
+            "missing_values": {c: int(n) for c, n in df.isnull().sum().items()},
+            "column_stats": {c: st.to_dict() for c, st in stats.items()},
+            "preview": json.loads(df.head(50).to_json(orient="records", date_format="iso")),
+            "sniffed": sniffed,
+            "batches": 1,
+            "schema_restarts": 0,
+        }
+
+    os.makedirs(_tabular_dir(project_id), exist_ok=True)
+    paths = _paths(project_id, document_id)
+    tmp = f"{paths['arrow']}.{os.getpid()}.tmp"
+    info: Dict = {}
+    types, restarts = None, 0
+    try:
+        while True:
+            widened = _write_batches(file_path, tmp, types, sniffed, on_batch, info)
+            if widened is None:
+                break
+            types, restarts = widened, restarts + 1
+        os.replace(tmp, paths["arrow"])
+    finally:
+        _remove(tmp)
+
+    columns = info.get("columns", [])
+    dtypes = {c: _pandas_dtype(t, info["missing_values"].get(c, 0)) for c, t in zip(columns, info["types"])}
+    _commit(project_id, document_id, {
+        "format": "arrow", "columns": columns, "dtypes": dtypes, "shape": [info["rows"], len(columns)],
+    })
+    return {
+        "columns": columns,
+        "dtypes": dtypes,
+        "shape": [info["rows"], len(columns)],
+        "missing_values": {c: info["missing_values"].get(c, 0) for c in columns},
+        "column_stats": {c: info["column_stats"].get(c, ColumnStats()).to_dict() for c in columns},
+        "preview": info.get("preview", []),
+        "sniffed": sniffed,
+        "batches": info["batches"],
+        "schema_restarts": restarts,
+    }
+
+
+def _read_meta(project_id: int, document_id: int) -> dict:
+    try:
+        with open(_paths(project_id, document_id)["meta"], "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
 
 
 def load_dataframe(project_id: int, document_id: int) -> pd.DataFrame:
     """Load a previously saved dataframe."""
-    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    path = os.path.join(base_dir, "data", "projects", str(project_id), "tabular", f"document_{document_id}.json")
-    if not os.path.exists(path):
+    paths = _paths(project_id, document_id)
+    meta = _read_meta(project_id, document_id)
+    if meta.get("format") == "arrow":
+        if pa is None:
+            raise RuntimeError("pyarrow is required to read this tabular document")
+        return _read_arrow(paths["arrow"])
+    if meta.get("format") == "numpy":
+        return _read_numpy(paths["numpy"], meta)
+    if not os.path.exists(paths["json"]):
+        raise FileNotFoundError(f"No tabular data for document {document_id}")
+    with open(paths["json"], "r", encoding="utf-8") as f:
+        legacy = json.load(f)
+    return pd.DataFrame(legacy["records"])
+
+
+def _version(project_id: int, document_id: int) -> Optional[int]:
+    paths = _paths(project_id, document_id)
+    for key in ("meta", "json"):
+        try:
+            return os.stat(paths[key]).st_mtime_ns
+        except OSError:
+            continue
+    return None
+
+
+def get_dataframe(project_id: int, document_id: int) -> pd.DataFrame:
+    """
+    Like load_dataframe, but served from the in-process cache when the saved
+    data has not changed since it was loaded. The frame is shared between
+    callers: do not modify it in place.
+    """
+    global _frames_bytes, _frames_hits, _frames_misses
+    key = (project_id, document_id)
+    version = _version(project_id, document_id)
+    if version is None:
+        invalidate_dataframe(project_id, document_id)
         raise FileNotFoundError(f"No tabular data for document {document_id}")
-    with open(path, "r", encoding="utf-8") as f:
-        meta = json.load(f)
-    return pd.DataFrame(meta["records"])
+    with _frames_lock:
+        cached = _frames.get(key)
+        if cached is not None and cached[0] == version:
+            _frames.move_to_end(key)
+            _frames_hits += 1
+            return cached[1]
+        _frames_misses += 1
+
+    df = load_dataframe(project_id, document_id)
+    size = int(df.memory_usage(index=True, deep=True).sum())
+    budget = int(TABULAR_CACHE_MB * 1024 * 1024)
+    with _frames_lock:
+        previous = _frames.pop(key, None)
+        if previous is not None:
+            _frames_bytes -= previous[2]
+        if size <= budget:
+            _frames[key] = (version, df, size)
+            _frames_bytes += size
+            while _frames_bytes > budget:
+                _, (_, _, evicted) = _frames.popitem(last=False)
+                _frames_bytes -= evicted
+    return df
+
+
+def invalidate_dataframe(project_id: int, document_id: int):
+    """Drop a document's cached frame (after it is saved again or deleted)."""
+    global _frames_bytes
+    with _frames_lock:
+        cached = _frames.pop((project_id, document_id), None)
+        if cached is not None:
+            _frames_bytes -= cached[2]
+
+
+def dataframe_cache_stats() -> Dict:
+    with _frames_lock:
+        lookups = _frames_hits + _frames_misses
+        return {
+            "entries": len(_frames),
+            "bytes": _frames_bytes,
+            "budget_bytes": int(TABULAR_CACHE_MB * 1024 * 1024),
+            "hits": _frames_hits,
+            "misses": _frames_misses,
+            "hit_rate": round(_frames_hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def arrow_table(project_id: int, document_id: int) -> "pa.Table":
+    """The stored table as Arrow: memory-mapped if saved as Arrow, else converted from the frame."""
+    if pa is None:
+        raise RuntimeError("pyarrow is not installed")
+    meta = _read_meta(project_id, document_id)
+    if meta.get("format") == "arrow":
+        with pa.memory_map(_paths(project_id, document_id)["arrow"], "r") as source:
+            return pa.ipc.open_file(source).read_all()
+    return pa.Table.from_pandas(_arrow_safe(get_dataframe(project_id, document_id)), preserve_index=False)
+
+
+def parse_filter(expr: str) -> Tuple[str, str, Optional[str]]:
+    match = _FILTER_RE.match(expr or "")
+    if not match:
+        raise ValueError(f"Invalid filter '{expr}': expected column:op[:value]")
+    column, op, value = match.groups()
+    if op not in ("null", "notnull") and value is None:
+        raise ValueError(f"Filter '{expr}' needs a value")
+    return column, op, value
+
+
+def _coerce(s: pd.Series, value: str):
+    """Turn a filter value from the query string into the column's type."""
+    if pd.api.types.is_bool_dtype(s.dtype):
+        return value.strip().lower() in ("1", "true", "yes")
+    if pd.api.types.is_numeric_dtype(s.dtype):
+        try:
+            return float(value)
+        except ValueError:
+            raise ValueError(f"'{value}' is not a number (column '{s.name}')")
+    if pd.api.types.is_datetime64_any_dtype(s.dtype):
+        ts = pd.Timestamp(value)
+        tz = getattr(s.dtype, "tz", None)
+        if tz is not None and ts.tzinfo is None:
+            ts = ts.tz_localize(tz)
+        return ts
+    return value
+
+
+def select_rows(df: pd.DataFrame, filters: List[Tuple[str, str, Optional[str]]] = (), search: str = None,
+                sort: str = None, descending: bool = False, columns: List[str] = None) -> np.ndarray:
+    """
+    Positions of the rows matching every filter and the free-text `search`
+    (case-insensitive, over `columns` or all columns), ordered by `sort`.
+    Missing values sort last.
+    """
+    wanted = list(columns or []) + [f[0] for f in filters] + ([sort] if sort else [])
+    unknown = [c for c in wanted if c not in df.columns]
+    if unknown:
+        raise ValueError(f"Unknown column(s): {', '.join(unknown)}")
+
+    mask = np.ones(len(df), dtype=bool)
+    for column, op, value in filters:
+        s = df[column]
+        if op == "null":
+            hit = s.isna()
+        elif op == "notnull":
+            hit = s.notna()
+        elif op == "contains":
+            hit = s.notna() & s.astype(str).str.contains(value, case=False, regex=False)
+        else:
+            hit = getattr(operator, op)(s, _coerce(s, value))
+        mask &= np.asarray(pd.Series(hit).fillna(False), dtype=bool)
+    if search:
+        found = np.zeros(len(df), dtype=bool)
+        for column in (columns or df.columns):
+            s = df[column]
+            found |= np.asarray(s.notna() & s.astype(str).str.contains(search, case=False, regex=False), dtype=bool)
+        mask &= found
+
+    positions = np.flatnonzero(mask)
+    if sort:
+        keys = df[sort].take(positions).reset_index(drop=True)
+        order = keys.sort_values(ascending=not descending, kind="stable", na_position="last").index.to_numpy()
+        positions = positions[order]
+    return positions
+
+
+def delete_dataframe(project_id: int, document_id: int) -> bool:
+    """Remove a saved dataframe. Returns whether there was one."""
+    invalidate_dataframe(project_id, document_id)
+    found = False
+    for path in _paths(project_id, document_id).values():
+        if os.path.exists(path):
+            _remove(path)
+            found = True
+    return found
 
 
 def get_tabular_meta(project_id: int, document_id: int) -> dict:
     """Return schema metadata without loading full records."""
-    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    path = os.path.join(base_dir, "data", "projects", str(project_id), "tabular", f"document_{document_id}.json")
-    if not os.path.exists(path):
-        return {}
-    with open(path, "r", encoding="utf-8") as f:
-        meta = json.load(f)
+    meta = _read_meta(project_id, document_id)
+    if not meta:
+        path = _paths(project_id, document_id)["json"]
+        if not os.path.exists(path):
+            return {}
+        with open(path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
     return {"columns": meta.get("columns", []), "dtypes": meta.get("dtypes", {}), "shape": meta.get("shape", [])}
@@ -17,6 +17,11 @@ import secrets
 from google.oauth2 import id_token
 from google.auth.transport import requests as google_requests
 from database import ensure_messages_sources_column
+from utils.jobs import start_workers, stop_workers
+from utils.sandbox import stop_sandbox
+from utils.vectorbase import query_embedding_cache_stats
+from utils.summary_cache import summary_cache_stats
+from loaders.tabular_loader import dataframe_cache_stats
 from fastapi import FastAPI
 from database import Base, engine
 from models import * 
@@ -82,6 +87,15 @@ def verify_session(session_id: Optional[str] = Header(None, alias="X-Session-Id"
     db.update_session_activity(session_id)
     return session
 
+@app.on_event("startup")
+def _start_ingestion_workers():
+    start_workers()
+
+@app.on_event("shutdown")
+def _stop_ingestion_workers():
+    stop_workers()
+    stop_sandbox()
+
 app.include_router(projects_router)
 app.dependency_overrides[get_current_user_dep] = verify_session
 app.include_router(conversations_router)
@@ -95,6 +109,14 @@ async def health_ollama():
         return {"ok": True, "models": names}
     except Exception as e:
         return {"ok": False, "error": str(e)}
+@app.get("/health/caches")
+async def health_caches():
+    return {
+        "query_embeddings": query_embedding_cache_stats(),
+        "summaries": summary_cache_stats(),
+        "dataframes": dataframe_cache_stats(),
+    }
+
 def validate_password_strength(password: str) -> None:
     """
     Validate password strength:
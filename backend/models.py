@@ -66,3 +66,37 @@ class Document(Base):
     )
     def __repr__(self) -> str:
         return f"Document(id={self.id!r}, filename={self.filename!r})"
+
+class IngestionJob(Base):
+    __tablename__ = "ingestion_jobs"
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    document_id: Mapped[int] = mapped_column(ForeignKey("documents.id", ondelete="CASCADE"), nullable=False, index=True)
+    project_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    file_path: Mapped[str] = mapped_column(String(512), nullable=False)
+    status: Mapped[str] = mapped_column(String(16), nullable=False, default="queued")
+    priority: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    error_message: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
+    started_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    __table_args__ = (
+        CheckConstraint("status in ('queued','running','completed','failed')", name="ck_ingestion_jobs_status"),
+        Index("ix_ingestion_jobs_status_priority", "status", "priority"),
+    )
+    def __repr__(self) -> str:
+        return f"IngestionJob(id={self.id!r}, document_id={self.document_id!r}, status={self.status!r})"
+
+class FileFingerprint(Base):
+    __tablename__ = "file_fingerprints"
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    user_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    content_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    project_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    document_id: Mapped[int] = mapped_column(ForeignKey("documents.id", ondelete="CASCADE"), nullable=False, unique=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
+    __table_args__ = (
+        Index("ix_file_fingerprints_user_hash", "user_id", "content_hash"),
+    )
+    def __repr__(self) -> str:
+        return f"FileFingerprint(document_id={self.document_id!r}, content_hash={self.content_hash[:12]!r})"
@@ -14,6 +14,7 @@ from schemas import ConversationCreate, ConversationRead, ConversationListItem,
 from schemas import BaseModel
 from utils.pipeline import ask_question, process_document
 from utils.pipeline import load_project_vector_store
+from utils.blobstore import blob_url
 from pydantic import BaseModel as PydBaseModel
 from typing import Optional, Any, Dict as TypingDict, List as TypingList
 
@@ -186,6 +187,55 @@ class ChatStreamRequest(BaseModel):
     conversation_id: int
     message: str
 
+# Separates the streamed answer from the trailing sources JSON in chat/stream
+SOURCES_SEPARATOR = "\x1e"
+
+def _chat_sources(s: Session, project_id: int, hits: list) -> TypingDict[str, Any]:
+    """Build the sources payload from the (Document, similarity) pairs ask_question used."""
+    if not hits:
+        return {"results": [], "by_document": {}, "documents": []}
+    doc_rows = s.execute(select(Document).where(Document.project_id == project_id)).scalars().all()
+    id_to_doc = {d.id: d for d in doc_rows}
+    def parse_doc(d, score):
+        md = getattr(d, "metadata", {}) or {}
+        try:
+            raw = md.get("original_content")
+            parsed = json.loads(raw) if raw else {}
+        except Exception:
+            parsed = {}
+        doc_id = md.get("document_id")
+        name = id_to_doc.get(doc_id).filename if doc_id in id_to_doc else (md.get("filename") or "Unknown")
+        return {
+            "document_id": doc_id, "file_name": name,
+            "page": md.get("page_number"), "chunk_id": md.get("chunk_id"),
+            "score": round(score, 4),
+            "timestamp": md.get("timestamp"),
+            "text": parsed.get("raw_text") or d.page_content,
+            "tables_html": parsed.get("tables_html") or [],
+            "images_base64": parsed.get("images_base64") or [],
+            "table_urls": [blob_url(project_id, r) for r in parsed.get("table_refs") or []],
+            "image_urls": [blob_url(project_id, r) for r in parsed.get("image_refs") or []],
+        }
+    grouped = {}
+    parsed_all = []
+    for d, score in hits:
+        item = parse_doc(d, score)
+        parsed_all.append(item)
+        did = item.get("document_id")
+        if did is not None:
+            grouped.setdefault(did, []).append(item)
+    if len(doc_rows) == 1:
+        fallback_name = doc_rows[0].filename
+        for it in parsed_all:
+            if not it.get("file_name") or it.get("file_name") == "Unknown":
+                it["file_name"] = fallback_name
+    for idx, it in enumerate(parsed_all):
+        if it.get("chunk_id") is None:
+            it["chunk_id"] = idx
+    by_document = {str(k): v for k, v in grouped.items()}
+    doc_options = [{"id": d.id, "filename": d.filename} for d in doc_rows]
+    return {"results": parsed_all, "by_document": by_document, "documents": doc_options}
+
 @router.post(
     "/projects/{project_id}/chat/stream",
     response_class=StreamingResponse,
@@ -236,10 +286,20 @@ def chat_stream(
 
     def streamer():
         buf_parts: List[str] = []
+        hits: list = []
+        sources = None
         try:
-            for token in ask_question(project_id=project_id, question=payload.message):
+            for token in ask_question(project_id=project_id, question=payload.message, hits=hits):
                 buf_parts.append(token)
                 yield token
+            if hits:
+                # Trail the answer with the exact chunks it was grounded on
+                s = SessionLocal()
+                try:
+                    sources = _chat_sources(s, project_id, hits)
+                finally:
+                    s.close()
+                yield SOURCES_SEPARATOR + json.dumps(sources)
         finally:
             full = "".join(buf_parts).strip()
             if full:
@@ -267,60 +327,10 @@ def chat_stream(
                         s.commit()
                     else:
                         try:
-                            if (payload.message or "").lower().strip() in ("hi", "hello", "hey", "hlo"):
-                                msg.sources_json = json.dumps({"results": [], "by_document": {}, "documents": []})
-                                s.commit()
-                                raise Exception("Skip retrieval for greeting")
-                            vec = load_project_vector_store(project_id)
-                            default_k = 3
-                            base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-                            settings_path = os.path.join(base_dir, "data", "projects", str(project_id), "settings.json")
-                            if os.path.exists(settings_path):
-                                with open(settings_path, "r", encoding="utf-8") as sf:
-                                    cfg = json.load(sf) or {}
-                                    default_k = int(cfg.get("top_k", 3))
-                            k = max(3, default_k)
-                            retriever = vec.as_retriever(search_kwargs={"k": k})
-                            docs = retriever.invoke(payload.message)
-                            doc_rows = s.execute(select(Document).where(Document.project_id == project_id)).scalars().all()
-                            id_to_doc = {d.id: d for d in doc_rows}
-                            def parse_doc(d):
-                                md = getattr(d, "metadata", {}) or {}
-                                try:
-                                    raw = md.get("original_content")
-                                    parsed = json.loads(raw) if raw else {}
-                                except Exception:
-                                    parsed = {}
-                                doc_id = md.get("document_id")
-                                name = id_to_doc.get(doc_id).filename if doc_id in id_to_doc else (md.get("filename") or "Unknown")
-                                return {
-                                    "document_id": doc_id, "file_name": name,
-                                    "page": md.get("page_number"), "chunk_id": md.get("chunk_id"),
-                                    "text": parsed.get("raw_text") or d.page_content,
-                                    "tables_html": parsed.get("tables_html") or [],
-                                    "images_base64": parsed.get("images_base64") or [],
-                                }
-                            grouped = {}
-                            parsed_all = []
-                            for d in docs:
-                                item = parse_doc(d)
-                                parsed_all.append(item)
-                                did = item.get("document_id")
-                                if did is not None:
-                                    grouped.setdefault(did, []).append(item)
-                            if parsed_all:
-                                if len(doc_rows) == 1:
-                                    fallback_name = doc_rows[0].filename
-                                    for it in parsed_all:
-                                        if not it.get("file_name") or it.get("file_name") == "Unknown":
-                                            it["file_name"] = fallback_name
-                                for idx, it in enumerate(parsed_all):
-                                    if it.get("chunk_id") is None:
-                                        it["chunk_id"] = idx
-                            results = parsed_all[:3]
-                            by_document = {str(k): v[:3] for k, v in grouped.items()}
-                            doc_options = [{"id": d.id, "filename": d.filename} for d in doc_rows]
-                            msg.sources_json = json.dumps({"results": results, "by_document": by_document, "documents": doc_options})
+                            if sources is None:
+                                # Client went away before the trailer was sent
+                                sources = _chat_sources(s, project_id, hits)
+                            msg.sources_json = json.dumps(sources)
                             s.commit()
                         except Exception:
                             pass
@@ -408,8 +418,11 @@ def semantic_search(
             "score": round(score, 4),
             "timestamp": md.get("timestamp"),
             "text": parsed.get("raw_text") or d.page_content,
+            # Legacy chunks carry payloads inline; new ones only reference the blob store
             "tables_html": parsed.get("tables_html") or [],
             "images_base64": parsed.get("images_base64") or [],
+            "table_urls": [blob_url(project_id, r) for r in parsed.get("table_refs") or []],
+            "image_urls": [blob_url(project_id, r) for r in parsed.get("image_refs") or []],
         }
 
     grouped: TypingDict[int, TypingList[TypingDict[str, Any]]] = {}
@@ -1,18 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, BackgroundTasks, Query
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from sqlalchemy import select, func
 from sqlalchemy.orm import Session
 from typing import Optional, Dict, List
 import os
+import json
 import shutil
 
 from database import get_db, SessionLocal
 from models import Project, Conversation, Document
 from schemas import ProjectCreate, ProjectRead, ProjectListItem, ProjectListResponse
-from utils.pipeline import process_document, process_tabular_document, process_audio_document, process_image_document, is_audio, is_image
-from utils.loaders import partition_document, is_tabular
-from utils.chunking import create_chunks_by_title, separate_content_types
-from config import ALLOWED_EXTENSIONS, MAX_FILE_SIZE_MB
+from utils.pipeline import is_audio, is_image, remove_document
+from utils.jobs import enqueue_document, get_job_state
+from utils.vectorbase import invalidate_vector_store
+from utils.blobstore import get_blob, guess_media_type
+from utils.metrics import read_metrics, watch_metrics, unwatch_metrics, is_live
+from utils.loaders import is_tabular
+from config import ALLOWED_EXTENSIONS, MAX_FILE_SIZE_MB, METRICS_STREAM_KEEPALIVE_SECONDS, TABULAR_PAGE_ROWS, TABULAR_PAGE_MAX_ROWS
 
 router = APIRouter(prefix="/projects", tags=["projects"])
 
@@ -150,139 +155,32 @@ def get_project(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found")
     return project
 
-def _bg_embed_document(document_id: int, project_id: int, file_path: str):
-    db = SessionLocal()
-    try:
-        try:
-            if is_image(file_path):
-                process_image_document(file_path, project_id, document_id)
-                doc = db.get(Document, document_id)
-                if doc:
-                    doc.status = "completed"
-                    doc.error_message = None
-                    db.commit()
-            elif is_audio(file_path):
-                process_audio_document(file_path, project_id, document_id)
-                doc = db.get(Document, document_id)
-                if doc:
-                    doc.status = "completed"
-                    doc.error_message = None
-                    db.commit()
-            elif is_tabular(file_path):
-                summary, head_data = process_tabular_document(file_path, project_id, document_id)
-                
-                # Update document status in DB — do this first, independently
-                doc = db.get(Document, document_id)
-                if doc:
-                    doc.status = "completed"
-                    doc.error_message = None
-                    db.commit()
-
-                # Try to create a preview message — failure here must NOT affect doc status
-                try:
-                    conv_stmt = select(Conversation).where(Conversation.project_id == project_id).order_by(Conversation.created_at.desc())
-                    latest_conv = db.execute(conv_stmt).scalars().first()
-                    
-                    if latest_conv and head_data:
-                        preview_data = head_data[:50]
-                        payload = {
-                            "tabular_result": True,
-                            "columns": list(preview_data[0].keys()) if preview_data else [],
-                            "data": preview_data,
-                            "summary": summary,
-                            "source": os.path.basename(file_path)
-                        }
-                        msg = Message(
-                            conversation_id=latest_conv.id,
-                            role="assistant",
-                            content=summary,
-                            sources_json=json.dumps({"tabular": payload})
-                        )
-                        db.add(msg)
-                        db.commit()
-                except Exception as msg_err:
-                    db.rollback()
-                    print(f"[tabular] preview message insert skipped: {msg_err}")
-            else:
-                base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-                project_dir = os.path.join(base_dir, "data", "projects", str(project_id))
-                metrics_dir = os.path.join(project_dir, "metrics")
-                os.makedirs(metrics_dir, exist_ok=True)
-                metrics_path = os.path.join(metrics_dir, f"document_{document_id}.json")
-                import json as _json
-                metrics = {
-                    "queued": {"status": "completed"},
-                    "partitioning": {"status": "in_progress"},
-                    "chunking": {"status": "pending"},
-                }
-                try:
-                    with open(metrics_path, "w", encoding="utf-8") as mf:
-                        _json.dump(metrics, mf, ensure_ascii=False, indent=2)
-                except Exception:
-                    pass
-
-                elements = partition_document(file_path=file_path)
-                total_elements = len(elements)
-                text_count = tables_count = images_count = titles_count = others_count = 0
-                for el in elements:
-                    tname = type(el).__name__
-                    md = getattr(el, "metadata", None)
-                    if tname == "Table" or (md and getattr(md, "text_as_html", None)):
-                        tables_count += 1
-                    elif tname == "Image" or (md and getattr(md, "image_base64", None)):
-                        images_count += 1
-                    elif tname in ("Title", "Header"):
-                        titles_count += 1
-                    elif hasattr(el, "text"):
-                        text_count += 1
-                    else:
-                        others_count += 1
-                metrics["partitioning"] = {
-                    "status": "completed", "total_elements": total_elements,
-                    "text_sections": text_count, "tables": tables_count,
-                    "images": images_count, "titles_headers": titles_count,
-                    "other_elements": others_count,
-                }
-                metrics["chunking"] = {"status": "in_progress"}
-                try:
-                    with open(metrics_path, "w", encoding="utf-8") as mf:
-                        _json.dump(metrics, mf, ensure_ascii=False, indent=2)
-                except Exception:
-                    pass
-
-                chunks = create_chunks_by_title(elements)
-                chunk_count = len(chunks)
-                sizes = [len((separate_content_types(ch).get("text") or "")) for ch in chunks]
-                avg_size = int(sum(sizes) / len(sizes)) if sizes else 0
-                metrics["chunking"] = {
-                    "status": "completed", "atomic_elements": total_elements,
-                    "chunks_created": chunk_count, "average_chunk_size_chars": avg_size,
-                }
-                metrics["summarisation"] = {"status": "in_progress", "processed": 0, "total": chunk_count}
-                try:
-                    with open(metrics_path, "w", encoding="utf-8") as mf:
-                        _json.dump(metrics, mf, ensure_ascii=False, indent=2)
-                except Exception:
-                    pass
-
-                process_document(file_path=file_path, project_id=project_id, document_id=document_id)
-
-            doc = db.get(Document, document_id)
-            if doc:
-                doc.status = "completed"
-                doc.error_message = None
-                db.commit()
-        except Exception as e:
-            import traceback
-            error_trace = traceback.format_exc()
-            print(f"Embedding error for doc {document_id}: {e}\n{error_trace}")
-            doc = db.get(Document, document_id)
-            if doc:
-                doc.status = "failed"
-                doc.error_message = f"{str(e)}\n{error_trace}"
-                db.commit()
-    finally:
-        db.close()
+def _metrics_payload(db: Session, project_id: int, document_id: int) -> Dict:
+    job = get_job_state(db, document_id)
+    data = read_metrics(project_id, document_id)
+    if not data:
+        queued = {"status": "completed"}
+        if job and job["status"] == "queued":
+            queued = {"status": "pending", "position": job["position"], "queue_depth": job["queue"]["queued"]}
+        return {
+            "queued": queued,
+            "partitioning": {"status": "pending"},
+            "chunking": {"status": "pending"},
+            "summarisation": {"status": "pending", "processed": 0, "total": 0},
+            "vectorization": {"status": "pending"},
+            "job": job,
+        }
+    # Ensure summarisation has processed/total fields
+    if "summarisation" in data:
+        if "processed" not in data["summarisation"]:
+            data["summarisation"]["processed"] = 0
+        if "total" not in data["summarisation"]:
+            data["summarisation"]["total"] = data.get("chunking", {}).get("chunks_created", 0)
+    data["job"] = job
+    return data
+
+def _sse(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
 
 @router.get(
     "/{project_id}/documents/{document_id}/metrics",
@@ -303,28 +201,72 @@ def get_document_metrics(
     doc = db.get(Document, document_id)
     if not doc or doc.project_id != project_id:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
-    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    project_dir = os.path.join(base_dir, "data", "projects", str(project_id))
-    metrics_dir = os.path.join(project_dir, "metrics")
-    metrics_path = os.path.join(metrics_dir, f"document_{document_id}.json")
-    import json as _json
-    if not os.path.exists(metrics_path):
-        return {
-            "queued": {"status": "completed"},
-            "partitioning": {"status": "pending"},
-            "chunking": {"status": "pending"},
-            "summarisation": {"status": "pending", "processed": 0, "total": 0},
-            "vectorization": {"status": "pending"}
-        }
-    with open(metrics_path, "r", encoding="utf-8") as mf:
-        data = _json.load(mf)
-        # Ensure summarisation has processed/total fields
-        if "summarisation" in data:
-            if "processed" not in data["summarisation"]:
-                data["summarisation"]["processed"] = 0
-            if "total" not in data["summarisation"]:
-                data["summarisation"]["total"] = data.get("chunking", {}).get("chunks_created", 0)
-        return data
+    return _metrics_payload(db, project_id, document_id)
+
+@router.get(
+    "/{project_id}/documents/{document_id}/metrics/stream",
+    status_code=status.HTTP_200_OK,
+)
+async def stream_document_metrics(
+    project_id: int,
+    document_id: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: Dict = Depends(get_current_user_dep),
+):
+    """
+    Server-sent events for a document's ingestion progress. Sends the current
+    metrics, a `metrics` event for every snapshot pushed by the worker, and a
+    final `done` event with the complete metrics once the job has ended.
+    """
+    user_id = current_user.get("user_id") if isinstance(current_user, dict) else None
+    if not user_id:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+    project = db.execute(select(Project.id).where(Project.id == project_id, Project.user_id == user_id)).scalar_one_or_none()
+    if not project:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found")
+    doc = db.get(Document, document_id)
+    if not doc or doc.project_id != project_id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
+
+    def _snapshot():
+        s = SessionLocal()
+        try:
+            return _metrics_payload(s, project_id, document_id)
+        finally:
+            s.close()
+
+    def _finished(payload: dict) -> bool:
+        job = payload.get("job")
+        return (not job or job["status"] in ("completed", "failed")) and not is_live(project_id, document_id)
+
+    async def events():
+        # Subscribe before the first read so no update falls in between
+        watcher = watch_metrics(project_id, document_id)
+        try:
+            payload = await run_in_threadpool(_snapshot)
+            if _finished(payload):
+                yield _sse("done", payload)
+                return
+            yield _sse("metrics", payload)
+            while not await request.is_disconnected():
+                if not await watcher.wait(METRICS_STREAM_KEEPALIVE_SECONDS):
+                    payload = await run_in_threadpool(_snapshot)
+                    if _finished(payload):
+                        yield _sse("done", payload)
+                        return
+                    yield ": keepalive\n\n"
+                    continue
+                latest, watcher.latest = watcher.latest, None
+                if latest is not None:
+                    yield f"event: metrics\ndata: {latest}\n\n"
+                if watcher.ended:
+                    yield _sse("done", await run_in_threadpool(_snapshot))
+                    return
+        finally:
+            unwatch_metrics(project_id, document_id, watcher)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @router.get(
     "/{project_id}/documents/{document_id}/chunks",
@@ -356,6 +298,34 @@ def get_document_chunks(
             
     return {"chunks": []}
 
+@router.get(
+    "/{project_id}/blobs/{ref}",
+    status_code=status.HTTP_200_OK,
+)
+def get_project_blob(
+    project_id: int,
+    ref: str,
+    db: Session = Depends(get_db),
+    current_user: Dict = Depends(get_current_user_dep),
+):
+    """Return a chunk payload (table HTML or image bytes) referenced from search results."""
+    user_id = current_user.get("user_id") if isinstance(current_user, dict) else None
+    if not user_id:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+    project = db.execute(select(Project.id).where(Project.id == project_id, Project.user_id == user_id)).scalar_one_or_none()
+    if not project:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found")
+    try:
+        data = get_blob(project_id, ref)
+    except (ValueError, FileNotFoundError):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Blob not found")
+    # Content-addressed: a ref never changes meaning, so let the browser keep it
+    return Response(
+        content=data,
+        media_type=guess_media_type(data),
+        headers={"Cache-Control": "private, max-age=31536000, immutable"},
+    )
+
 @router.post(
     "/{project_id}/documents/{document_id}/retry",
     status_code=status.HTTP_202_ACCEPTED,
@@ -363,7 +333,6 @@ def get_document_chunks(
 def retry_document(
     project_id: int,
     document_id: int,
-    background: BackgroundTasks = None,
     db: Session = Depends(get_db),
     current_user: Dict = Depends(get_current_user_dep),
 ):
@@ -382,11 +351,51 @@ def retry_document(
     doc.status = "processing"
     doc.error_message = None
     db.commit()
-    if background is not None:
-        background.add_task(_bg_embed_document, doc.id, project_id, doc.file_path)
+    enqueue_document(db, doc)
     return {"id": doc.id, "status": "processing"}
 
 
+@router.delete(
+    "/{project_id}/documents/{document_id}",
+    status_code=status.HTTP_204_NO_CONTENT,
+)
+def delete_document(
+    project_id: int,
+    document_id: int,
+    db: Session = Depends(get_db),
+    current_user: Dict = Depends(get_current_user_dep),
+):
+    """Delete a document together with its vectors, chunks, metrics, tabular data and uploaded file."""
+    user_id = current_user.get("user_id") if isinstance(current_user, dict) else None
+    if not user_id:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+    project = db.execute(select(Project.id).where(Project.id == project_id, Project.user_id == user_id)).scalar_one_or_none()
+    if not project:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found")
+    doc = db.get(Document, document_id)
+    if not doc or doc.project_id != project_id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
+    job = get_job_state(db, document_id)
+    if job and job["status"] == "running":
+        # The worker would write the vectors and chunks back
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Document is still being processed")
+
+    # Queued jobs and the duplicate fingerprint go with the row (ON DELETE CASCADE)
+    file_path = doc.file_path
+    try:
+        db.delete(doc)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to delete document")
+
+    try:
+        removed = remove_document(project_id, document_id, file_path)
+        print(f"[documents] deleted document {document_id}: {removed}")
+    except Exception as e:
+        print(f"Failed to cleanup artefacts of document {document_id}: {e}")
+
+
 @router.get(
     "/{project_id}/settings",
     status_code=status.HTTP_200_OK,
@@ -498,7 +507,6 @@ def export_project_bundle(
 def upload_document(
     project_id: int,
     file: UploadFile = File(...),
-    background: BackgroundTasks = None,
     db: Session = Depends(get_db),
     current_user: Dict = Depends(get_current_user_dep),
 ):
@@ -532,25 +540,39 @@ def upload_document(
     os.makedirs(upload_dir, exist_ok=True)
     file_path = os.path.join(upload_dir, file.filename)
 
+    # Uploading a file with the same name replaces that document's file, so it
+    # is re-ingested in place: only changed chunks are re-embedded.
+    doc = db.execute(
+        select(Document).where(Document.project_id == project_id, Document.file_path == file_path)
+    ).scalars().first()
+    if doc:
+        job = get_job_state(db, doc.id)
+        if job and job["status"] in ("queued", "running"):
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"'{file.filename}' is still being processed")
+
     try:
         with open(file_path, "wb") as f:
             shutil.copyfileobj(file.file, f)
     finally:
         file.file.close()
 
-    doc = Document(
-        project_id=project_id,
-        filename=file.filename,
-        file_path=file_path,
-        status="processing",
-        error_message=None,
-    )
-    db.add(doc)
-    db.commit()
-    db.refresh(doc)
+    if doc:
+        doc.status = "processing"
+        doc.error_message = None
+        db.commit()
+    else:
+        doc = Document(
+            project_id=project_id,
+            filename=file.filename,
+            file_path=file_path,
+            status="processing",
+            error_message=None,
+        )
+        db.add(doc)
+        db.commit()
+        db.refresh(doc)
 
-    if background is not None:
-        background.add_task(_bg_embed_document, doc.id, project_id, file_path)
+    enqueue_document(db, doc)
 
     file_category = "image" if is_image(file_path) else ("audio" if is_audio(file_path) else ("tabular" if is_tabular(file_path) else "document"))
     return {
@@ -618,6 +640,48 @@ def get_tabular_schema(
     with open(schema_path, "r", encoding="utf-8") as f:
         return _json.load(f)
 
+_TABULAR_STREAM_BATCH = 2000
+
+
+def _ndjson_rows(df, positions, columns):
+    for start in range(0, len(positions), _TABULAR_STREAM_BATCH):
+        batch = df.iloc[positions[start:start + _TABULAR_STREAM_BATCH]][columns]
+        lines = batch.to_json(orient="records", lines=True, date_format="iso")
+        yield lines if lines.endswith("\n") else lines + "\n"
+
+
+class _ChunkSink:
+    """File-like target for an Arrow stream writer; hands written bytes out batch by batch."""
+    def __init__(self):
+        self.chunks = []
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+def _arrow_rows(table, positions, columns):
+    import pyarrow as pa
+    table = table.select(columns)
+    sink = _ChunkSink()
+    with pa.ipc.new_stream(pa.PythonFile(sink, mode="w"), table.schema) as writer:
+        for start in range(0, len(positions), _TABULAR_STREAM_BATCH):
+            writer.write_table(table.take(pa.array(positions[start:start + _TABULAR_STREAM_BATCH])))
+            yield sink.drain()
+    yield sink.drain()
+
+
 @router.get(
     "/{project_id}/documents/{document_id}/tabular-data",
     status_code=status.HTTP_200_OK,
@@ -625,29 +689,67 @@ def get_tabular_schema(
 def get_tabular_data(
     project_id: int,
     document_id: int,
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+    columns: Optional[List[str]] = Query(None, alias="column", description="Columns to return, repeatable; default all"),
+    filters: Optional[List[str]] = Query(None, alias="filter", description="column:op[:value], op in eq, ne, lt, le, gt, ge, contains, null, notnull"),
+    q: Optional[str] = Query(None, description="Case-insensitive text search over the returned columns"),
+    sort: Optional[str] = None,
+    desc: bool = False,
+    format: str = Query("json", pattern="^(json|ndjson|arrow)$"),
     db: Session = Depends(get_db),
     current_user: Dict = Depends(get_current_user_dep),
 ):
-    """Return full tabular records for a document."""
+    """
+    Rows of a tabular document, filtered, sorted and paged on the server.
+    `json` returns one page (at most TABULAR_PAGE_MAX_ROWS rows). `ndjson` and
+    `arrow` (an Arrow IPC stream) stream every matching row unless `limit` is given.
+    """
     user_id = current_user.get("user_id") if isinstance(current_user, dict) else None
     if not user_id:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
     project = db.execute(select(Project.id).where(Project.id == project_id, Project.user_id == user_id)).scalar_one_or_none()
     if not project:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found")
-    from loaders.tabular_loader import load_dataframe, get_tabular_meta
+    from loaders.tabular_loader import get_dataframe, get_tabular_meta, select_rows, parse_filter, arrow_table
     try:
         meta = get_tabular_meta(project_id, document_id)
-        df = load_dataframe(project_id, document_id)
-        return {
-            "columns": meta.get("columns", []),
-            "dtypes": meta.get("dtypes", {}),
-            "shape": meta.get("shape", []),
-            "records": df.to_dict(orient="records"),
-        }
+        df = get_dataframe(project_id, document_id)
     except FileNotFoundError:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No tabular data for this document")
 
+    if format == "json":
+        limit = min(limit or TABULAR_PAGE_ROWS, TABULAR_PAGE_MAX_ROWS)
+    try:
+        positions = select_rows(df, [parse_filter(f) for f in (filters or [])], search=q,
+                                sort=sort, descending=desc, columns=columns)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    matched = len(positions)
+    positions = positions[offset:offset + limit] if limit else positions[offset:]
+    columns = list(columns or df.columns)
+
+    if format == "json":
+        page = df.iloc[positions][columns]
+        return {
+            "columns": columns,
+            "dtypes": {c: meta.get("dtypes", {}).get(c) for c in columns},
+            "shape": meta.get("shape", list(df.shape)),
+            "total_rows": matched,
+            "offset": offset,
+            "limit": limit,
+            "records": json.loads(page.to_json(orient="records", date_format="iso")),
+        }
+
+    headers = {"X-Total-Count": str(matched)}
+    if format == "ndjson":
+        return StreamingResponse(_ndjson_rows(df, positions, columns), media_type="application/x-ndjson", headers=headers)
+    try:
+        table = arrow_table(project_id, document_id)
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Arrow output unavailable: {e}")
+    return StreamingResponse(_arrow_rows(table, positions, columns), media_type="application/vnd.apache.arrow.stream", headers=headers)
+
 @router.delete(
     "/{project_id}",
     status_code=status.HTTP_204_NO_CONTENT,
@@ -668,6 +770,7 @@ def delete_project(
     try:
         base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         project_dir = os.path.join(base_dir, "data", "projects", str(project_id))
+        invalidate_vector_store(os.path.join(project_dir, "vector_store"))
         if os.path.exists(project_dir):
             shutil.rmtree(project_dir)
     except Exception as e:
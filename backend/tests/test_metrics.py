@@ -0,0 +1,40 @@
+import json
+import threading
+
+from utils import metrics
+
+
+def test_older_flush_never_overwrites_newer_status(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "_metrics_path", lambda p, d: str(tmp_path / f"document_{d}.json"))
+    monkeypatch.setattr(metrics, "_ensure_flusher", lambda: None)
+    real_write = metrics._write
+    armed = threading.Event()
+    first_write_started = threading.Event()
+    release_first_write = threading.Event()
+
+    def slow_first_write(project_id, document_id, data):
+        if armed.is_set() and not first_write_started.is_set():
+            first_write_started.set()
+            release_first_write.wait(5)
+        real_write(project_id, document_id, data)
+
+    monkeypatch.setattr(metrics, "_write", slow_first_write)
+    metrics.update_metrics(1, 2, "vectorization", {"status": "processing", "embedded": 1})
+    metrics.update_metrics(1, 2, "vectorization", {"status": "processing", "embedded": 2})
+    # The periodic flusher takes the "embedded": 2 snapshot and stalls writing it
+    armed.set()
+    flusher = threading.Thread(target=metrics._flush_key, args=((1, 2),))
+    flusher.start()
+    assert first_write_started.wait(5)
+
+    done = threading.Thread(target=metrics.update_metrics,
+                            args=(1, 2, "vectorization", {"status": "completed", "embedded": 3}))
+    done.start()
+    done.join(0.2)  # without ordering, the newer status would be written now
+    release_first_write.set()
+    flusher.join(5)
+    done.join(5)
+    metrics.finish_metrics(1, 2)
+
+    with open(tmp_path / "document_2.json", encoding="utf-8") as f:
+        assert json.load(f)["vectorization"]["status"] == "completed"
@@ -0,0 +1,47 @@
+from unittest import mock
+
+import pytest
+
+pytest.importorskip("unstructured")
+pytest.importorskip("langchain_chroma")
+
+from unstructured.documents.elements import NarrativeText, Title
+
+from utils import metrics, pipeline, summarizer, vectorbase
+from loaders import pdf_loader
+
+
+class _FakeEmbeddings:
+    def embed_documents_with_stats(self, texts):
+        return [[1.0, float(len(t)), 0.5] for t in texts], {}
+
+    def embed_documents(self, texts):
+        return self.embed_documents_with_stats(texts)[0]
+
+    def embed_query(self, text):
+        return [1.0, float(len(text)), 0.5]
+
+
+@pytest.fixture
+def project_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(pipeline, "_project_base_dir", lambda project_id: str(tmp_path))
+    monkeypatch.setattr(metrics, "_metrics_path", lambda p, d: str(tmp_path / "metrics" / f"document_{d}.json"))
+    monkeypatch.setattr(vectorbase, "_embedding_fn", _FakeEmbeddings())
+    monkeypatch.setattr(summarizer, "_ai_summary", lambda text, tables, images: (f"summary of {text}", False))
+    # One born-digital page: the whole file goes through a single partition_pdf call
+    monkeypatch.setattr(pdf_loader, "_page_count", lambda path: 1)
+    monkeypatch.setattr(pdf_loader, "_classify_pages", lambda path: [("fast", "text")])
+    return tmp_path
+
+
+def test_process_document_partitions_pdf_once(project_dir):
+    pdf = project_dir / "paper.pdf"
+    pdf.write_bytes(b"%PDF-1.4\n")
+    elements = [Title("Introduction"), NarrativeText("Attention is all you need. " * 20)]
+    with mock.patch.object(pdf_loader, "partition_pdf", return_value=elements) as partition_pdf:
+        pipeline.process_document(str(pdf), project_id=1, document_id=7)
+        metrics.finish_metrics(1, 7)
+
+    assert partition_pdf.call_count == 1
+    assert vectorbase.count_vectors(str(project_dir / "vector_store")) >= 1
+    assert (project_dir / "chunks" / "document_7.json").exists()
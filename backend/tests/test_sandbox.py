@@ -0,0 +1,113 @@
+import os
+import shutil
+import threading
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+from utils import sandbox
+from utils.sandbox import UnsafeCode, evaluate, validate
+
+
+@pytest.mark.parametrize("code", [
+    "df.to_string(buf='/tmp/x')",
+    "df.values.tofile('/tmp/x')",
+    "df.values.dump('/tmp/x')",
+    "df.values.dumps()",
+    "df.to_csv('/tmp/x')",
+    "df['salary'].to_json('/tmp/x')",
+    "df.to_markdown()",
+    "pd.read_csv('/etc/passwd')",
+    "df.agg('to_pickle', path='/tmp/x')",
+    "df.__class__",
+    "df.eval('salary * 2')",
+    "open('/tmp/x', 'w')",
+    "__import__('os')",
+    "df.apply('to_' + 'csv', path_or_buf='/tmp/x')",
+    "df.agg(df.columns[0])",
+    "df.agg(**{'func': 'to_csv'})",
+    "df['salary'].transform(str(df['name'][0]))",
+    "df['name'].map('{}'.format)",
+    "'{0.__class__.__init__.__globals__}'.format(df)",
+    "'{x}'.format_map({'x': df})",
+    "df.groupby('dept').agg(total=('salary', 'to_' + 'csv'))",
+])
+def test_rejects_file_io_and_escapes(code):
+    with pytest.raises(UnsafeCode):
+        validate(code)
+
+
+@pytest.mark.parametrize("code", [
+    "df['salary'].max()",
+    "df['salary'].to_list()",
+    "df.head(5).to_dict()",
+    "df['salary'].to_frame()",
+    "df['salary'].to_numpy().mean()",
+    "pd.to_datetime(df['hired']).dt.year.value_counts()",
+    "df[df['to_date'] > 1]",
+    "df.groupby('dept')['salary'].agg(['mean', 'max'])",
+    "df.groupby('dept').agg(total=('salary', 'sum'), n=('salary', len))",
+    "df['salary'].apply(lambda s: s * 2)",
+    "df['dept'].map({'Sales': 1, 'IT': 2})",
+    "df.agg({'salary': 'mean', 'age': ['min', 'max']}, numeric_only=True)",
+    "df['salary'].transform(abs)",
+])
+def test_allows_in_memory_pandas(code):
+    validate(code)
+
+
+def test_evaluate_runs_allowed_code():
+    df = pd.DataFrame({"salary": [1, 2, 3], "to_date": [0, 2, 3]})
+    assert evaluate("df[df['to_date'] > 1]['salary'].to_list()", df) == [2, 3]
+
+
+_PROJECT = 990001
+
+
+@pytest.fixture
+def stored(monkeypatch):
+    """A stored document, and sandbox workers spawned with small limits."""
+    pytest.importorskip("resource")
+    from loaders import tabular_loader
+    monkeypatch.setenv("TABULAR_SANDBOX_CPU_SECONDS", "1")
+    monkeypatch.setenv("TABULAR_SANDBOX_CPU_GRACE_SECONDS", "1")
+    monkeypatch.setenv("TABULAR_SANDBOX_MEMORY_MB", "1024")
+    sandbox.stop_sandbox()
+    tabular_loader.save_dataframe(pd.DataFrame({"salary": [50000, 72000, 61000]}), _PROJECT, 1)
+    yield _PROJECT, 1
+    sandbox.stop_sandbox()
+    tabular_loader.delete_dataframe(_PROJECT, 1)
+    shutil.rmtree(os.path.dirname(tabular_loader._tabular_dir(_PROJECT)), ignore_errors=True)
+
+
+def test_execute_runs_in_a_worker(stored):
+    reply = sandbox.execute(*stored, "df['salary'].max()")
+    assert reply["ok"] and reply["data"] == "72000"
+
+
+def test_execute_stops_python_loops_at_the_cpu_limit(stored):
+    reply = sandbox.execute(*stored, "sum(i for i in range(10 ** 10))", timeout=30)
+    assert not reply["ok"] and "CPU time limit" in reply["error"]
+
+
+def test_execute_kills_a_worker_stuck_in_c_code(stored):
+    # sum() over a range never returns to the interpreter, so only the hard limit stops it
+    reply = sandbox.execute(*stored, "sum(range(10 ** 12))", timeout=30)
+    assert not reply["ok"] and "Sandbox worker died" in reply["error"]
+    assert sandbox.execute(*stored, "df['salary'].max()")["ok"]
+
+
+def test_execute_reports_the_memory_limit(stored):
+    reply = sandbox.execute(*stored, "[0] * 10 ** 10", timeout=30)
+    assert not reply["ok"] and "Memory limit" in reply["error"]
+
+
+def test_execute_timeout_and_cancel(stored):
+    reply = sandbox.execute(*stored, "sum(range(10 ** 12))", timeout=0.5)
+    assert not reply["ok"] and "exceeded 0.5s" in reply["error"]
+
+    cancel = threading.Event()
+    threading.Timer(0.3, cancel.set).start()
+    reply = sandbox.execute(*stored, "sum(range(10 ** 12))", timeout=30, cancel=cancel)
+    assert reply == {"ok": False, "error": "Query cancelled"}
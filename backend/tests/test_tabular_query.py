@@ -0,0 +1,83 @@
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("ollama")
+
+from utils.tabular_query import answer_from_stats
+
+DF = pd.DataFrame({
+    "name": ["Ann", "Bob", "Cid", "Dee", "Eve"],
+    "department": ["Sales", "Sales", "IT", "HR", "Sales"],
+    "age": [34, 51, 28, 45, None],
+    "salary": [50000, 72000, 61000, 58000, 66000],
+    "hired": pd.to_datetime(["2019-03-01", "2011-07-15", "2021-01-04", "2015-09-30", "2023-05-22"]),
+})
+
+META = {
+    "columns": list(DF.columns),
+    "shape": list(DF.shape),
+    "column_stats": {
+        "name": {"kind": "text", "count": 5, "nulls": 0, "distinct": 5,
+                 "top": [{"value": "Ann", "count": 1}]},
+        "department": {"kind": "text", "count": 5, "nulls": 0, "distinct": 3,
+                       "top": [{"value": "Sales", "count": 3}, {"value": "IT", "count": 1}]},
+        "age": {"kind": "numeric", "count": 4, "nulls": 1, "min": 28, "max": 51, "sum": 158, "mean": 39.5,
+                "distinct": 4, "top": [{"value": 34, "count": 1}]},
+        "salary": {"kind": "numeric", "count": 5, "nulls": 0, "min": 50000, "max": 72000, "sum": 307000,
+                   "mean": 61400.0, "distinct": 5, "top": [{"value": 50000, "count": 1}]},
+        "hired": {"kind": "datetime", "count": 5, "nulls": 0, "min": "2011-07-15T00:00:00",
+                  "max": "2023-05-22T00:00:00", "distinct": 5, "top": [{"value": "2019-03-01T00:00:00", "count": 1}]},
+    },
+}
+
+
+@pytest.fixture(params=["stats", "scan"])
+def meta(request):
+    """Answer from the stored statistics, and again from a pass over the column."""
+    if request.param == "stats":
+        return META
+    return {**META, "column_stats": {}}
+
+
+@pytest.mark.parametrize("question, data, code", [
+    ("How many rows are there?", "5", "len(df)"),
+    ("How many columns?", "5", "len(df.columns)"),
+    ("How many departments are there?", "3", "df['department'].nunique()"),
+    ("Number of unique departments", "3", "df['department'].nunique()"),
+    ("How many recorded ages?", "4", "df['age'].count()"),
+    ("How many non-null ages?", "4", "df['age'].count()"),
+    ("What is the highest salary?", "72000", "df['salary'].max()"),
+    ("lowest salary", "50000", "df['salary'].min()"),
+    ("average age", "39.5", "df['age'].mean()"),
+    ("total salary", "307000", "df['salary'].sum()"),
+    ("most common department", "Sales", "df['department'].mode()[0]"),
+    ("latest hired date", "2023-05-22", "df['hired'].max()"),
+    ("earliest hired", "2011-07-15", "df['hired'].min()"),
+])
+def test_simple_aggregates(meta, question, data, code):
+    result = answer_from_stats(question, meta, lambda: DF)
+    assert result is not None, question
+    assert result["fast_path"] and result["type"] == "scalar"
+    assert result["data"].startswith(data)
+    assert result["code"] == code
+
+
+@pytest.mark.parametrize("question", [
+    "What is the oldest age?",               # oldest/earliest only apply to dates
+    "newest name",
+    "average department",                    # not numeric
+    "average salary in sales",               # scoped
+    "highest salary by department",          # grouped
+    "How many employees earn more than 60000?",
+    "Which department has the highest salary?",
+    "highest salary and lowest age",         # two columns
+    "What is the median?",                   # no column
+    "how many people earn max salary",       # a count, not the max
+    "how many salaries are the highest",
+    "number of ages above average",
+    "how many null salary",                  # missing values, not distinct ones
+    "how many missing ages",
+    "number of empty departments",
+])
+def test_left_to_the_llm(meta, question):
+    assert answer_from_stats(question, meta, lambda: DF) is None
@@ -0,0 +1,26 @@
+import pytest
+
+pytest.importorskip("langchain_chroma")
+
+from langchain_core.documents import Document
+
+from utils.vectorbase import chunk_vector_id
+
+
+def _chunk(summary: str, original: str = '{"raw_text": "Revenue table"}') -> Document:
+    return Document(page_content=summary, metadata={"document_id": 3, "original_content": original})
+
+
+def test_chunk_vector_id_is_stable():
+    assert chunk_vector_id(3, _chunk("Quarterly revenue")) == chunk_vector_id(3, _chunk("Quarterly revenue"))
+
+
+def test_changed_summary_gets_a_new_vector_id():
+    # e.g. an Ollama-error fallback (raw text) replaced by a real summary on re-ingest
+    assert chunk_vector_id(3, _chunk("Revenue table")) != chunk_vector_id(3, _chunk("Quarterly revenue by region"))
+
+
+def test_repeated_chunks_stay_distinct():
+    seen = {}
+    first, second = (chunk_vector_id(3, _chunk("Same"), seen) for _ in range(2))
+    assert second == f"{first}-1"
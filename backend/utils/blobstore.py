@@ -0,0 +1,113 @@
+"""
+Per-project content-addressed blob store for chunk payloads.
+
+Table HTML and extracted images used to be serialised into every chunk's
+Chroma `original_content` metadata, so each similarity search dragged
+megabytes of base64 back through JSON. They now live under
+data/projects/{id}/blobs/, keyed by SHA-256 of their bytes, and Chroma only
+keeps the refs. Payloads are read back lazily: tables when building LLM
+context, images only when the sources UI requests them.
+"""
+import os
+import re
+import json
+import base64
+import hashlib
+from typing import List
+
+_REF_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def _blob_dir(project_id: int) -> str:
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base_dir, "data", "projects", str(project_id), "blobs")
+
+
+def _blob_path(project_id: int, ref: str) -> str:
+    if not _REF_RE.match(ref or ""):
+        raise ValueError(f"Invalid blob ref: {ref!r}")
+    return os.path.join(_blob_dir(project_id), ref[:2], ref)
+
+
+def put_blob(project_id: int, data: bytes) -> str:
+    """Store `data` (idempotently) and return its ref."""
+    ref = hashlib.sha256(data).hexdigest()
+    path = _blob_path(project_id, ref)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    return ref
+
+
+def get_blob(project_id: int, ref: str) -> bytes:
+    """Read a blob. Raises ValueError for malformed refs, FileNotFoundError if absent."""
+    with open(_blob_path(project_id, ref), "rb") as f:
+        return f.read()
+
+
+def blob_url(project_id: int, ref: str) -> str:
+    return f"/projects/{project_id}/blobs/{ref}"
+
+
+def guess_media_type(data: bytes) -> str:
+    if data.startswith(b"\x89PNG"):
+        return "image/png"
+    if data.startswith(b"\xff\xd8"):
+        return "image/jpeg"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data.startswith(b"BM"):
+        return "image/bmp"
+    if data[:4] in (b"II*\x00", b"MM\x00*"):
+        return "image/tiff"
+    if data.lstrip()[:1] == b"<":
+        return "text/html; charset=utf-8"
+    return "application/octet-stream"
+
+
+def _image_bytes(b64: str) -> bytes:
+    try:
+        return base64.b64decode(b64, validate=True)
+    except Exception:
+        return b64.encode("utf-8")
+
+
+def pack_original_content(project_id: int, raw_text: str, tables: List[str] = None, images: List[str] = None, **extra) -> str:
+    """
+    Build the `original_content` metadata string for a chunk: raw text inline,
+    tables and images (base64) moved to the blob store and kept as refs.
+    """
+    return json.dumps({
+        "raw_text": raw_text,
+        "table_refs": [put_blob(project_id, t.encode("utf-8")) for t in (tables or [])],
+        "image_refs": [put_blob(project_id, _image_bytes(b)) for b in (images or [])],
+        **extra,
+    })
+
+
+def load_tables(project_id: int, data: dict) -> List[str]:
+    """Table HTML for a parsed `original_content`, including legacy inline tables."""
+    tables = list(data.get("tables_html") or [])
+    for ref in data.get("table_refs") or []:
+        try:
+            tables.append(get_blob(project_id, ref).decode("utf-8"))
+        except (OSError, ValueError):
+            pass
+    return tables
+
+
+def copy_blob(src_project_id: int, dst_project_id: int, ref: str):
+    """Make `ref` available in another project's store (hard link when possible)."""
+    src, dst = _blob_path(src_project_id, ref), _blob_path(dst_project_id, ref)
+    if os.path.exists(dst):
+        return
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        put_blob(dst_project_id, get_blob(src_project_id, ref))
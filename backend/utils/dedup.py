@@ -0,0 +1,138 @@
+"""
+Whole-file deduplication of uploads.
+
+Every successfully ingested document is fingerprinted by the SHA-256 of its
+bytes. When the same user uploads identical bytes again — in the same project
+or another one — the worker clones the earlier document's chunk JSON, metrics,
+blobs and stored embeddings instead of re-running partitioning, summarisation
+and embedding. Tabular files are not deduplicated; their pipeline is cheap.
+"""
+import os
+import json
+import shutil
+import hashlib
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from langchain_core.documents import Document as LCDocument
+
+from models import Document, FileFingerprint, Project
+from utils.metrics import update_metrics, read_metrics
+from utils.vectorbase import sync_document_vectors, get_document_vectors, count_vectors
+from utils.blobstore import copy_blob
+
+_READ_SIZE = 1024 * 1024
+
+
+def _project_dir(project_id: int) -> str:
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base_dir, "data", "projects", str(project_id))
+
+
+def _chunks_path(project_id: int, document_id: int) -> str:
+    return os.path.join(_project_dir(project_id), "chunks", f"document_{document_id}.json")
+
+
+def file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(_READ_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def project_owner(db: Session, project_id: int) -> Optional[int]:
+    return db.execute(select(Project.user_id).where(Project.id == project_id)).scalar_one_or_none()
+
+
+def find_duplicate(db: Session, user_id: int, content_hash: str, exclude_document_id: int) -> Optional[Tuple[int, int]]:
+    """(project_id, document_id) of a completed upload with the same bytes whose artefacts still exist."""
+    rows = db.execute(
+        select(FileFingerprint.project_id, FileFingerprint.document_id)
+        .join(Document, Document.id == FileFingerprint.document_id)
+        .where(
+            FileFingerprint.user_id == user_id,
+            FileFingerprint.content_hash == content_hash,
+            FileFingerprint.document_id != exclude_document_id,
+            Document.status == "completed",
+        )
+        .order_by(FileFingerprint.id.desc())
+    ).all()
+    for project_id, document_id in rows:
+        if os.path.exists(_chunks_path(project_id, document_id)):
+            return project_id, document_id
+    return None
+
+
+def record_fingerprint(db: Session, user_id: int, content_hash: str, project_id: int, document_id: int):
+    existing = db.execute(
+        select(FileFingerprint).where(FileFingerprint.document_id == document_id)
+    ).scalar_one_or_none()
+    if existing:
+        existing.content_hash = content_hash
+    else:
+        db.add(FileFingerprint(user_id=user_id, content_hash=content_hash, project_id=project_id, document_id=document_id))
+    db.commit()
+
+
+def _clone_metadata(meta: dict, src_project_id: int, project_id: int, document_id: int, filename: str) -> dict:
+    meta = dict(meta or {})
+    meta["project_id"] = project_id
+    meta["document_id"] = document_id
+    meta["source"] = filename
+    meta["filename"] = filename
+    if src_project_id != project_id and meta.get("original_content"):
+        try:
+            data = json.loads(meta["original_content"])
+        except (TypeError, ValueError):
+            data = {}
+        for ref in (data.get("table_refs") or []) + (data.get("image_refs") or []):
+            try:
+                copy_blob(src_project_id, project_id, ref)
+            except (OSError, ValueError):
+                pass
+    return meta
+
+
+def clone_document(src_project_id: int, src_document_id: int, project_id: int, document_id: int, filename: str) -> int:
+    """Copy a processed document's artefacts to a new document. Returns the number of vectors cloned."""
+    started = datetime.utcnow()
+    src_vec_dir = os.path.join(_project_dir(src_project_id), "vector_store")
+    vec_dir = os.path.join(_project_dir(project_id), "vector_store")
+    found = get_document_vectors(src_vec_dir, src_document_id)
+    if not found.get("ids"):
+        raise RuntimeError(f"No stored vectors for document {src_document_id}")
+
+    os.makedirs(os.path.dirname(_chunks_path(project_id, document_id)), exist_ok=True)
+    shutil.copyfile(_chunks_path(src_project_id, src_document_id), _chunks_path(project_id, document_id))
+    for step, data in (read_metrics(src_project_id, src_document_id) or {}).items():
+        update_metrics(project_id, document_id, step, data)
+
+    documents = [
+        LCDocument(page_content=text, metadata=_clone_metadata(m, src_project_id, project_id, document_id, filename))
+        for text, m in zip(found["documents"], found["metadatas"])
+    ]
+    before_count = count_vectors(persist_directory=vec_dir)
+    sync_stats = {}
+    sync_document_vectors(documents, vec_dir, document_id, stats=sync_stats,
+                          embeddings=[list(e) for e in found["embeddings"]])
+    duration_ms = int((datetime.utcnow() - started).total_seconds() * 1000)
+    update_metrics(project_id, document_id, "vectorization", {
+        "status": "completed",
+        "embedded": len(found["ids"]),
+        "total": len(found["ids"]),
+        "collection_count_before": before_count,
+        "collection_count_after": count_vectors(persist_directory=vec_dir),
+        "persist_directory": vec_dir,
+        "ended_at": datetime.utcnow().isoformat() + "Z",
+        **sync_stats,
+    })
+    update_metrics(project_id, document_id, "deduplication", {
+        "status": "completed",
+        "source_project_id": src_project_id,
+        "source_document_id": src_document_id,
+        "duration_ms": duration_ms,
+    })
+    return len(found["ids"])
@@ -0,0 +1,228 @@
+"""
+Embedding helpers shared by ingestion, chat and semantic search.
+
+OllamaBatchEmbeddings sends documents to Ollama's /api/embed in batches of
+EMBED_BATCH_SIZE with up to EMBED_CONCURRENCY requests in flight, retrying
+transient failures, instead of one HTTP request per chunk. Texts get the same
+"passage: " / "query: " instructions langchain_community's OllamaEmbeddings
+prepended, so new vectors and queries stay comparable with existing stores.
+
+CachedQueryEmbeddings wraps it so repeated questions and searches skip the
+embedding round-trip: query vectors are kept in an in-process LRU keyed by
+(embedding model, normalised text), optionally backed by a SQLite file so they
+survive restarts. Document embedding is passed straight through.
+"""
+import os
+import re
+import time
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import ollama
+from langchain_core.embeddings import Embeddings
+
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 32))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", 4))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", 3))
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", 2048))
+# Path to a SQLite file for the on-disk tier; empty keeps the cache in memory only
+QUERY_EMBEDDING_CACHE_PATH = os.getenv("QUERY_EMBEDDING_CACHE_PATH", "")
+
+# Prepended by langchain_community's OllamaEmbeddings, which built the existing stores
+DOCUMENT_INSTRUCTION = "passage: "
+QUERY_INSTRUCTION = "query: "
+
+_WS_RE = re.compile(r"\s+")
+
+
+def _normalise(text: str) -> str:
+    return _WS_RE.sub(" ", (text or "").strip()).casefold()
+
+
+class OllamaBatchEmbeddings(Embeddings):
+    def __init__(self, model: str, base_url: str, batch_size: int = EMBED_BATCH_SIZE,
+                 concurrency: int = EMBED_CONCURRENCY, max_retries: int = EMBED_MAX_RETRIES,
+                 embed_instruction: str = DOCUMENT_INSTRUCTION, query_instruction: str = QUERY_INSTRUCTION):
+        self.model = model
+        self.embed_instruction = embed_instruction
+        self.query_instruction = query_instruction
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max(0, max_retries)
+        self._client = ollama.Client(host=base_url)
+
+    def _embed_batch(self, texts: List[str]) -> Tuple[List[List[float]], int]:
+        """Embed one batch, retrying transient errors. Returns (vectors, retries used)."""
+        attempt = 0
+        while True:
+            try:
+                response = self._client.embed(model=self.model, input=texts)
+                vectors = [list(v) for v in response["embeddings"]]
+                if len(vectors) != len(texts):
+                    raise RuntimeError(f"Expected {len(texts)} embeddings, got {len(vectors)}")
+                return vectors, attempt
+            except ollama.ResponseError as e:
+                # 4xx (bad model name, oversized input) will not fix itself
+                if 400 <= getattr(e, "status_code", 500) < 500 or attempt >= self.max_retries:
+                    raise
+            except Exception:
+                if attempt >= self.max_retries:
+                    raise
+            attempt += 1
+            time.sleep(0.5 * 2 ** (attempt - 1))
+
+    def embed_documents_with_stats(self, texts: List[str]) -> Tuple[List[List[float]], Dict]:
+        started = time.perf_counter()
+        texts = [f"{self.embed_instruction}{text}" for text in texts]
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        vectors: List[List[float]] = []
+        retries = 0
+        if batches:
+            workers = min(self.concurrency, len(batches))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                # map() keeps batch order, so vectors line up with texts
+                for batch_vectors, batch_retries in pool.map(self._embed_batch, batches):
+                    vectors.extend(batch_vectors)
+                    retries += batch_retries
+        seconds = time.perf_counter() - started
+        return vectors, {
+            "embedding_batch_size": self.batch_size,
+            "embedding_concurrency": self.concurrency,
+            "embedding_batches": len(batches),
+            "embedding_retries": retries,
+            "embedding_seconds": round(seconds, 3),
+            "chunks_per_second": round(len(texts) / seconds, 2) if seconds > 0 else None,
+        }
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents_with_stats(texts)[0]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed_batch([f"{self.query_instruction}{text}"])[0][0]
+
+
+class CachedQueryEmbeddings(Embeddings):
+    def __init__(self, inner: Embeddings, model_name: str, max_entries: int = QUERY_EMBEDDING_CACHE_SIZE,
+                 path: Optional[str] = QUERY_EMBEDDING_CACHE_PATH or None):
+        self._inner = inner
+        self._model = model_name
+        # Vectors on disk are only valid for the instruction they were embedded with
+        self._disk_model = f"{model_name}|{getattr(inner, 'query_instruction', '')}"
+        self._max_entries = max(1, max_entries)
+        self._path = path
+        self._lru: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if self._path:
+            self._init_disk()
+
+    # --- on-disk tier -----------------------------------------------------
+
+    def _connect(self):
+        return sqlite3.connect(self._path, timeout=5)
+
+    def _init_disk(self):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self._path)), exist_ok=True)
+            conn = self._connect()
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS query_embeddings (
+                    model TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    PRIMARY KEY (model, text)
+                )
+            """)
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"[embeddings] disk cache disabled: {e}")
+            self._path = None
+
+    def _disk_get(self, key: str) -> Optional[tuple]:
+        if not self._path:
+            return None
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT vector FROM query_embeddings WHERE model = ? AND text = ?", (self._disk_model, key)
+            ).fetchone()
+            conn.close()
+        except Exception:
+            return None
+        if not row:
+            return None
+        vec = array("d")
+        vec.frombytes(row[0])
+        return tuple(vec)
+
+    def _disk_put(self, key: str, vector: tuple):
+        if not self._path:
+            return
+        try:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO query_embeddings (model, text, vector) VALUES (?, ?, ?)",
+                (self._disk_model, key, array("d", vector).tobytes()),
+            )
+            conn.commit()
+            conn.close()
+        except Exception:
+            pass
+
+    # --- Embeddings interface ----------------------------------------------
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._inner.embed_documents(texts)
+
+    def embed_documents_with_stats(self, texts: List[str]) -> Tuple[List[List[float]], Dict]:
+        if hasattr(self._inner, "embed_documents_with_stats"):
+            return self._inner.embed_documents_with_stats(texts)
+        return self._inner.embed_documents(texts), {}
+
+    def embed_query(self, text: str) -> List[float]:
+        key = _normalise(text)
+        with self._lock:
+            cached = self._lru.get(key)
+            if cached is not None:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                return list(cached)
+
+        vector = self._disk_get(key)
+        if vector is not None:
+            with self._lock:
+                self.hits += 1
+                self.disk_hits += 1
+        else:
+            vector = tuple(self._inner.embed_query(text))
+            with self._lock:
+                self.misses += 1
+            self._disk_put(key, vector)
+
+        with self._lock:
+            self._lru[key] = vector
+            self._lru.move_to_end(key)
+            while len(self._lru) > self._max_entries:
+                self._lru.popitem(last=False)
+        return list(vector)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "model": self._model,
+                "entries": len(self._lru),
+                "max_entries": self._max_entries,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "disk_path": self._path,
+            }
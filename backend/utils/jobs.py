@@ -0,0 +1,510 @@
+"""
+Durable ingestion job queue.
+
+Uploads and retries insert a row into `ingestion_jobs` instead of running the
+pipeline inside the request's BackgroundTasks. A dispatcher thread in the API
+process claims queued jobs in priority order and runs them on a bounded
+process pool (INGEST_WORKERS), so concurrent uploads no longer fight over CPU.
+Jobs left `running` by a previous process are re-queued on startup, up to
+INGEST_MAX_ATTEMPTS times, so a restart does not lose work in flight. If a
+worker dies and breaks the pool, the jobs that were in flight are re-queued
+the same way.
+
+Workers write to the project vector stores that chat and search read in the
+API process. utils.vectorbase serialises those writes per store with a
+cross-process lock and reopens the API's handles after each one.
+
+A second thread compacts project vector stores that have accumulated many
+deletions. While a project is being compacted no job for it is claimed, and a
+project with a running job is not compacted.
+"""
+import os
+import json
+import time
+import queue
+import threading
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from sqlalchemy import select, update, func, or_, and_
+from sqlalchemy.orm import Session
+
+from config import (
+    INGEST_WORKERS, INGEST_MAX_ATTEMPTS,
+    VECTOR_COMPACT_INTERVAL_SECONDS, VECTOR_COMPACT_MIN_DELETED, VECTOR_COMPACT_RATIO,
+)
+from database import SessionLocal
+from models import Conversation, Document, IngestionJob, Message
+from utils.pipeline import process_document, process_tabular_document, process_audio_document, process_image_document, is_audio, is_image
+from utils.loaders import is_tabular
+from loaders.audio_loader import WHISPER_PRELOAD, warm_up as warm_up_whisper
+from utils.llm import new_shared_slots, share_slots
+from utils.metrics import set_publisher, reset_metrics, finish_metrics, apply_snapshot
+from utils.dedup import file_sha256, project_owner, find_duplicate, record_fingerprint, clone_document
+from utils.vectorbase import count_vectors, deletions_since_compaction, compact_vector_store
+
+_POLL_SECONDS = 1.0
+
+_wakeup = threading.Event()
+_stop = threading.Event()
+_executor: Optional[ProcessPoolExecutor] = None
+_dispatcher: Optional[threading.Thread] = None
+_slots: Optional[threading.BoundedSemaphore] = None
+# Metrics snapshots flow from worker processes to the API process through this queue
+_metrics_queue = None
+_relay: Optional[threading.Thread] = None
+_compactor: Optional[threading.Thread] = None
+# Projects whose vector store is being compacted; their jobs wait
+_compacting: set = set()
+_claim_lock = threading.Lock()
+_executor_lock = threading.Lock()
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _job_priority(file_path: str) -> int:
+    """Cheap jobs (spreadsheets, single images) jump ahead of PDFs and audio."""
+    if is_tabular(file_path):
+        return 2
+    if is_image(file_path):
+        return 1
+    return 0
+
+
+def _clone_duplicate(db, user_id: Optional[int], content_hash: str, project_id: int, document_id: int, file_path: str) -> bool:
+    """Reuse the artefacts of an identical earlier upload by the same user, if there is one."""
+    duplicate = find_duplicate(db, user_id, content_hash, document_id) if user_id else None
+    if not duplicate:
+        return False
+    try:
+        clone_document(duplicate[0], duplicate[1], project_id, document_id, os.path.basename(file_path))
+        print(f"[jobs] document {document_id} cloned from document {duplicate[1]} (identical upload)")
+        return True
+    except Exception as e:
+        print(f"[jobs] clone of document {duplicate[1]} failed, processing normally: {e}")
+        return False
+
+
+def _embed_document(document_id: int, project_id: int, file_path: str) -> str:
+    """Run the ingestion pipeline for one document. Executes inside a worker process."""
+    db = SessionLocal()
+    if db.get(Document, document_id) is None:
+        db.close()
+        return "failed"  # deleted while its job was queued
+    reset_metrics(project_id, document_id)
+    try:
+        try:
+            if is_tabular(file_path):
+                summary, head_data = process_tabular_document(file_path, project_id, document_id)
+
+                # Update document status in DB — do this first, independently
+                doc = db.get(Document, document_id)
+                if doc:
+                    doc.status = "completed"
+                    doc.error_message = None
+                    db.commit()
+
+                # Try to create a preview message — failure here must NOT affect doc status
+                try:
+                    conv_stmt = select(Conversation).where(Conversation.project_id == project_id).order_by(Conversation.created_at.desc())
+                    latest_conv = db.execute(conv_stmt).scalars().first()
+
+                    if latest_conv and head_data:
+                        preview_data = head_data[:50]
+                        payload = {
+                            "tabular_result": True,
+                            "columns": list(preview_data[0].keys()) if preview_data else [],
+                            "data": preview_data,
+                            "summary": summary,
+                            "source": os.path.basename(file_path)
+                        }
+                        msg = Message(
+                            conversation_id=latest_conv.id,
+                            role="assistant",
+                            content=summary,
+                            sources_json=json.dumps({"tabular": payload}, default=str)
+                        )
+                        db.add(msg)
+                        db.commit()
+                except Exception as msg_err:
+                    db.rollback()
+                    print(f"[tabular] preview message insert skipped: {msg_err}")
+            else:
+                user_id = project_owner(db, project_id)
+                content_hash = file_sha256(file_path)
+                if not _clone_duplicate(db, user_id, content_hash, project_id, document_id, file_path):
+                    if is_image(file_path):
+                        process_image_document(file_path, project_id, document_id)
+                    elif is_audio(file_path):
+                        process_audio_document(file_path, project_id, document_id)
+                    else:
+                        process_document(file_path=file_path, project_id=project_id, document_id=document_id)
+                if user_id:
+                    record_fingerprint(db, user_id, content_hash, project_id, document_id)
+
+            doc = db.get(Document, document_id)
+            if doc:
+                doc.status = "completed"
+                doc.error_message = None
+                db.commit()
+            return "completed"
+        except Exception as e:
+            error_trace = traceback.format_exc()
+            print(f"Embedding error for doc {document_id}: {e}\n{error_trace}")
+            doc = db.get(Document, document_id)
+            if doc:
+                doc.status = "failed"
+                doc.error_message = f"{str(e)}\n{error_trace}"
+                db.commit()
+            return "failed"
+    finally:
+        finish_metrics(project_id, document_id)
+        db.close()
+
+
+def enqueue_document(db: Session, document: Document, priority: Optional[int] = None) -> IngestionJob:
+    """
+    Persist an ingestion job for `document` and wake the dispatcher.
+    If the document already has a queued or running job, that job is returned.
+    """
+    existing = db.execute(
+        select(IngestionJob)
+        .where(IngestionJob.document_id == document.id, IngestionJob.status.in_(("queued", "running")))
+        .limit(1)
+    ).scalar_one_or_none()
+    if existing:
+        return existing
+    job = IngestionJob(
+        document_id=document.id,
+        project_id=document.project_id,
+        file_path=document.file_path,
+        status="queued",
+        priority=_job_priority(document.file_path) if priority is None else priority,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    _wakeup.set()
+    return job
+
+
+def queue_depth(db: Session) -> Dict[str, int]:
+    queued = db.execute(select(func.count(IngestionJob.id)).where(IngestionJob.status == "queued")).scalar_one()
+    running = db.execute(select(func.count(IngestionJob.id)).where(IngestionJob.status == "running")).scalar_one()
+    return {"queued": queued, "running": running, "workers": INGEST_WORKERS}
+
+
+def get_job_state(db: Session, document_id: int) -> Optional[Dict]:
+    """Latest job for a document plus its place in the queue, or None if it never had one."""
+    job = db.execute(
+        select(IngestionJob)
+        .where(IngestionJob.document_id == document_id)
+        .order_by(IngestionJob.id.desc())
+        .limit(1)
+    ).scalar_one_or_none()
+    if not job:
+        return None
+    position = None
+    if job.status == "queued":
+        ahead = db.execute(
+            select(func.count(IngestionJob.id)).where(
+                IngestionJob.status == "queued",
+                or_(
+                    IngestionJob.priority > job.priority,
+                    and_(IngestionJob.priority == job.priority, IngestionJob.id < job.id),
+                ),
+            )
+        ).scalar_one()
+        position = ahead + 1
+    return {
+        "id": job.id,
+        "status": job.status,
+        "priority": job.priority,
+        "attempts": job.attempts,
+        "position": position,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "error_message": job.error_message,
+        "queue": queue_depth(db),
+    }
+
+
+def _claim_next_job() -> Optional[Dict]:
+    """Atomically move the highest-priority queued job to `running`."""
+    db = SessionLocal()
+    try:
+        while True:
+            job = db.execute(
+                select(IngestionJob)
+                .where(IngestionJob.status == "queued", IngestionJob.project_id.notin_(tuple(_compacting)))
+                .order_by(IngestionJob.priority.desc(), IngestionJob.id.asc())
+                .limit(1)
+            ).scalar_one_or_none()
+            if job is None:
+                return None
+            with _claim_lock:
+                if job.project_id in _compacting:
+                    return None
+                claimed = db.execute(
+                    update(IngestionJob)
+                    .where(IngestionJob.id == job.id, IngestionJob.status == "queued")
+                    .values(status="running", attempts=IngestionJob.attempts + 1, started_at=_now())
+                ).rowcount
+                db.commit()
+            if claimed:
+                return {"id": job.id, "document_id": job.document_id, "project_id": job.project_id, "file_path": job.file_path}
+            # Another dispatcher won the race; try the next one.
+    finally:
+        db.close()
+
+
+def _finish_job(job_id: int, document_id: int, status: str, error: Optional[str] = None):
+    db = SessionLocal()
+    try:
+        job = db.get(IngestionJob, job_id)
+        if job:
+            job.status = status
+            job.error_message = error
+            job.finished_at = _now()
+        if error:
+            # The worker died before it could record the failure itself
+            doc = db.get(Document, document_id)
+            if doc and doc.status == "processing":
+                doc.status = "failed"
+                doc.error_message = error
+        db.commit()
+    finally:
+        db.close()
+
+
+def _requeue(db: Session, job: IngestionJob, reason: str, refund: bool = False):
+    """
+    Put a job whose worker went away back in the queue, or fail it once it has
+    used INGEST_MAX_ATTEMPTS attempts. `refund` gives back the attempt of a job
+    that never started.
+    """
+    if refund:
+        job.attempts = max(0, job.attempts - 1)
+    if job.attempts >= INGEST_MAX_ATTEMPTS:
+        job.status = "failed"
+        job.error_message = f"{reason} {job.attempts} times; giving up"
+        job.finished_at = _now()
+        doc = db.get(Document, job.document_id)
+        if doc:
+            doc.status = "failed"
+            doc.error_message = job.error_message
+    else:
+        job.status = "queued"
+        job.started_at = None
+
+
+def _requeue_job(job_id: int, reason: str, refund: bool = False):
+    db = SessionLocal()
+    try:
+        job = db.get(IngestionJob, job_id)
+        if job and job.status == "running":
+            _requeue(db, job, reason, refund=refund)
+            db.commit()
+    finally:
+        db.close()
+
+
+def _requeue_interrupted_jobs():
+    """Jobs still `running` belong to a process that is gone — put them back in the queue."""
+    db = SessionLocal()
+    try:
+        jobs = db.execute(select(IngestionJob).where(IngestionJob.status == "running")).scalars().all()
+        for job in jobs:
+            _requeue(db, job, "Interrupted")
+        db.commit()
+        if jobs:
+            print(f"[jobs] recovered {len(jobs)} interrupted ingestion job(s)")
+    finally:
+        db.close()
+
+
+def _init_worker(metrics_queue, llm_slots):
+    set_publisher(metrics_queue)
+    share_slots(llm_slots)
+    if WHISPER_PRELOAD:
+        try:
+            warm_up_whisper()
+        except Exception as e:
+            print(f"[jobs] whisper preload failed: {e}")
+
+
+def _relay_metrics():
+    """Mirror worker metrics snapshots in this process so the API can serve them from memory."""
+    while not _stop.is_set():
+        try:
+            project_id, document_id, snapshot = _metrics_queue.get(timeout=_POLL_SECONDS)
+        except queue.Empty:
+            continue
+        except (EOFError, OSError):
+            return
+        apply_snapshot(project_id, document_id, snapshot)
+
+
+def _projects_root() -> str:
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base_dir, "data", "projects")
+
+
+def _compaction_due(vec_dir: str) -> bool:
+    deleted = deletions_since_compaction(vec_dir)
+    if deleted < VECTOR_COMPACT_MIN_DELETED:
+        return False
+    return deleted >= VECTOR_COMPACT_RATIO * max(1, count_vectors(vec_dir))
+
+
+def _compact_project(project_id: int, vec_dir: str):
+    """Rebuild one project's vector store unless it has a job running."""
+    db = SessionLocal()
+    try:
+        with _claim_lock:
+            running = db.execute(
+                select(func.count(IngestionJob.id))
+                .where(IngestionJob.project_id == project_id, IngestionJob.status == "running")
+            ).scalar_one()
+            if running:
+                return
+            _compacting.add(project_id)
+    finally:
+        db.close()
+    try:
+        started = time.perf_counter()
+        result = compact_vector_store(vec_dir)
+        print(f"[jobs] compacted vector store of project {project_id}: {result['vectors']} vectors kept, "
+              f"{result['deletions_reclaimed']} deletions reclaimed in {time.perf_counter() - started:.1f}s")
+    except Exception as e:
+        print(f"[jobs] compaction of project {project_id} failed: {e}")
+    finally:
+        with _claim_lock:
+            _compacting.discard(project_id)
+        _wakeup.set()
+
+
+def _compaction_loop():
+    while not _stop.wait(VECTOR_COMPACT_INTERVAL_SECONDS):
+        root = _projects_root()
+        if not os.path.isdir(root):
+            continue
+        for name in os.listdir(root):
+            vec_dir = os.path.join(root, name, "vector_store")
+            if not name.isdigit() or not os.path.isdir(vec_dir):
+                continue
+            try:
+                if _compaction_due(vec_dir):
+                    _compact_project(int(name), vec_dir)
+            except Exception as e:
+                print(f"[jobs] compaction check failed for project {name}: {e}")
+
+
+def _new_executor() -> ProcessPoolExecutor:
+    # spawn: workers must not inherit the API process's threads or open SQLite handles
+    ctx = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(
+        max_workers=INGEST_WORKERS,
+        mp_context=ctx,
+        initializer=_init_worker,
+        # Ollama slots are shared so OLLAMA_MAX_CONCURRENCY caps all workers together.
+        # Fresh ones per pool: a worker that died holding a slot never gives it back.
+        initargs=(_metrics_queue, new_shared_slots(ctx)),
+    )
+
+
+def _replace_broken_executor():
+    global _executor
+    with _executor_lock:
+        if not _stop.is_set() and getattr(_executor, "_broken", False):
+            _executor = _new_executor()
+
+
+def _on_job_done(future, job: Dict):
+    try:
+        status = future.result()
+        _finish_job(job["id"], job["document_id"], status)
+    except BrokenProcessPool as e:
+        # One worker died and took the pool with it. Every job in flight lands
+        # here and there is no telling which one crashed, so all of them go
+        # back to the queue; a job that keeps crashing runs out of attempts.
+        print(f"[jobs] worker pool broke under job {job['id']}, re-queueing it: {e}")
+        _requeue_job(job["id"], "Ingestion worker crashed")
+        # The worker never sent its end-of-job snapshot
+        apply_snapshot(job["project_id"], job["document_id"], None)
+        _replace_broken_executor()
+    except Exception as e:
+        print(f"[jobs] job {job['id']} failed in the pool: {e}")
+        _finish_job(job["id"], job["document_id"], "failed", error=f"Ingestion worker crashed: {e}")
+        apply_snapshot(job["project_id"], job["document_id"], None)
+    finally:
+        _slots.release()
+        _wakeup.set()
+
+
+def _dispatch_loop():
+    while not _stop.is_set():
+        if not _slots.acquire(timeout=_POLL_SECONDS):
+            continue
+        try:
+            job = _claim_next_job()
+        except Exception as e:
+            print(f"[jobs] failed to claim job: {e}")
+            job = None
+        if job is None:
+            _slots.release()
+            _wakeup.wait(_POLL_SECONDS)
+            _wakeup.clear()
+            continue
+        try:
+            future = _executor.submit(_embed_document, job["document_id"], job["project_id"], job["file_path"])
+        except BrokenProcessPool:
+            # Claimed just as the pool broke: the job never ran
+            _slots.release()
+            _requeue_job(job["id"], "Ingestion worker crashed", refund=True)
+            _replace_broken_executor()
+            continue
+        except Exception as e:
+            _slots.release()
+            _finish_job(job["id"], job["document_id"], "failed", error=f"Could not schedule ingestion: {e}")
+            continue
+        future.add_done_callback(lambda f, job=job: _on_job_done(f, job))
+
+
+def start_workers():
+    """Recover interrupted jobs and start the dispatcher. Safe to call more than once."""
+    global _executor, _dispatcher, _slots, _metrics_queue, _relay, _compactor
+    if _dispatcher is not None and _dispatcher.is_alive():
+        return
+    _stop.clear()
+    _requeue_interrupted_jobs()
+    _slots = threading.BoundedSemaphore(max(1, INGEST_WORKERS))
+    if _metrics_queue is None:
+        _metrics_queue = multiprocessing.get_context("spawn").Queue()
+    _executor = _new_executor()
+    _relay = threading.Thread(target=_relay_metrics, name="metrics-relay", daemon=True)
+    _relay.start()
+    _dispatcher = threading.Thread(target=_dispatch_loop, name="ingestion-dispatcher", daemon=True)
+    _dispatcher.start()
+    if VECTOR_COMPACT_INTERVAL_SECONDS > 0:
+        _compactor = threading.Thread(target=_compaction_loop, name="vector-compactor", daemon=True)
+        _compactor.start()
+
+
+def stop_workers():
+    """Stop claiming jobs. Jobs still running are re-queued by the next start_workers()."""
+    global _dispatcher
+    _stop.set()
+    _wakeup.set()
+    if _dispatcher is not None:
+        _dispatcher.join(timeout=_POLL_SECONDS * 2)
+        _dispatcher = None
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
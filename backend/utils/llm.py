@@ -1,5 +1,17 @@
+import os
+import threading
+from contextlib import contextmanager
+
 import ollama
 
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+LLM_MODEL = "llama3.2:3b"
+# Max concurrent generations sent to one Ollama host, across all ingestion workers
+OLLAMA_MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", 2))
+
+_host_slots = {}
+_host_slots_lock = threading.Lock()
+
 system_prompt = """
 You are an AI assistant tasked with providing detailed answers based solely on the given context. Your goal is to analyze the information provided and formulate a comprehensive, well-structured response to the question.
 
@@ -24,10 +36,38 @@ Important: Base your entire response solely on the information provided in the c
 """
 
 
+def new_shared_slots(ctx) -> dict:
+    """
+    Generation slots for OLLAMA_HOST that processes of multiprocessing context
+    `ctx` can share; hand them to each worker's share_slots().
+    """
+    return {OLLAMA_HOST: ctx.BoundedSemaphore(max(1, OLLAMA_MAX_CONCURRENCY))}
+
+
+def share_slots(slots: dict):
+    """Make llm_slot() in this process use `slots`, shared with sibling processes."""
+    with _host_slots_lock:
+        _host_slots.update(slots)
+
+
+@contextmanager
+def llm_slot(host: str = OLLAMA_HOST):
+    """
+    Hold one of the OLLAMA_MAX_CONCURRENCY generation slots for `host`. Slots
+    are per process unless share_slots() installed shared ones.
+    """
+    with _host_slots_lock:
+        slot = _host_slots.get(host)
+        if slot is None:
+            slot = _host_slots[host] = threading.BoundedSemaphore(max(1, OLLAMA_MAX_CONCURRENCY))
+    with slot:
+        yield
+
+
 def call_llm(context: str, prompt: str):
     try:
         response = ollama.chat(
-            model="llama3.2:3b",
+            model=LLM_MODEL,
             stream=True,
             messages=[
                 {"role": "system", "content": system_prompt},
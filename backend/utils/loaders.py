@@ -18,11 +18,12 @@ def is_tabular(file_path: str) -> bool:
     return os.path.splitext(file_path)[1].lower() in TABULAR_EXTENSIONS
 
 
-def partition_document(file_path: str):
+def partition_document(file_path: str, stats: dict = None):
     """
     Dispatch to the correct loader and return unstructured elements.
     Raises ValueError for unsupported or tabular formats (tabular files
     must be handled separately via the tabular pipeline).
+    PDF partitioning fills `stats`, if given, with page and timing figures.
     """
     ext = os.path.splitext(file_path)[1].lower()
     if ext in TABULAR_EXTENSIONS:
@@ -32,4 +33,6 @@ def partition_document(file_path: str):
     loader_fn = _UNSTRUCTURED_LOADERS.get(ext)
     if loader_fn is None:
         raise ValueError(f"Unsupported file type: {ext}")
+    if ext == ".pdf":
+        return loader_fn(file_path, stats=stats)
     return loader_fn(file_path)
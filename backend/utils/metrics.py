@@ -0,0 +1,252 @@
+"""
+Per-document ingestion metrics.
+
+Workers keep each document's metrics in memory and write
+data/projects/{id}/metrics/document_{id}.json atomically (temp file + rename)
+only when a step changes status or every METRICS_FLUSH_SECONDS, instead of
+re-reading and rewriting the file on every progress tick.
+
+Every update is also published as a snapshot to the API process (see
+utils.jobs), which mirrors live documents in memory so the metrics endpoint
+does not touch the disk while a job is running. Progress streams subscribe to
+that mirror with watch_metrics(): each document has one channel, and every
+viewer of it only keeps a reference to the latest snapshot.
+"""
+import os
+import json
+import time
+import atexit
+import asyncio
+import threading
+from typing import Dict, List, Optional, Tuple
+
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", 2.0))
+
+_lock = threading.Lock()
+# Documents updated in this process: key -> metrics dict
+_state: Dict[Tuple[int, int], dict] = {}
+_dirty: Dict[Tuple[int, int], float] = {}
+# Held from taking a document's snapshot until it is on disk, so flushes of one
+# document land in order and an older snapshot never replaces a newer one
+_write_locks: Dict[Tuple[int, int], threading.Lock] = {}
+_flusher: Optional[threading.Thread] = None
+_publisher = None
+# Snapshots received from worker processes (API process only)
+_live: Dict[Tuple[int, int], dict] = {}
+# Progress stream viewers per document (API process only)
+_watchers: Dict[Tuple[int, int], List["MetricsWatcher"]] = {}
+
+
+class MetricsWatcher:
+    """
+    One viewer of a document's progress. Holds only the newest snapshot (as
+    JSON serialised once for all viewers), so a slow viewer skips intermediate
+    ticks instead of queueing them.
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._changed = asyncio.Event()
+        self.latest: Optional[str] = None
+        self.ended = False
+
+    def _notify(self, payload: Optional[str]):
+        if payload is None:
+            self.ended = True
+        else:
+            self.latest = payload
+        try:
+            self._loop.call_soon_threadsafe(self._changed.set)
+        except RuntimeError:
+            pass  # loop closed; the viewer has gone
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait for a new snapshot or the end of the job. False on timeout."""
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        self._changed.clear()
+        return True
+
+
+def _metrics_path(project_id: int, document_id: int) -> str:
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base_dir, "data", "projects", str(project_id), "metrics", f"document_{document_id}.json")
+
+
+def _load(project_id: int, document_id: int) -> Optional[dict]:
+    try:
+        with open(_metrics_path(project_id, document_id), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write(project_id: int, document_id: int, data: dict):
+    path = _metrics_path(project_id, document_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _flush_key(key: Tuple[int, int]):
+    with _lock:
+        write_lock = _write_locks.setdefault(key, threading.Lock())
+    with write_lock:
+        with _lock:
+            if _dirty.pop(key, None) is None or key not in _state:
+                return
+            snapshot = json.loads(json.dumps(_state[key], default=str))
+        _write(key[0], key[1], snapshot)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(METRICS_FLUSH_SECONDS)
+        now = time.monotonic()
+        with _lock:
+            due = [k for k, since in _dirty.items() if now - since >= METRICS_FLUSH_SECONDS]
+        for key in due:
+            try:
+                _flush_key(key)
+            except OSError as e:
+                print(f"[metrics] flush failed for document {key[1]}: {e}")
+
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is None or not _flusher.is_alive():
+        _flusher = threading.Thread(target=_flush_loop, name="metrics-flusher", daemon=True)
+        _flusher.start()
+
+
+def _publish(key: Tuple[int, int], snapshot: Optional[dict]):
+    if _publisher is None:
+        return
+    try:
+        _publisher.put((key[0], key[1], snapshot))
+    except Exception:
+        pass
+
+
+def set_publisher(queue):
+    """Send every metrics snapshot produced in this process to `queue`."""
+    global _publisher
+    _publisher = queue
+
+
+def update_metrics(project_id: int, document_id: int, step: str, data: dict):
+    """Replace one pipeline step's metrics. Written to disk now on a status change, else coalesced."""
+    key = (project_id, document_id)
+    with _lock:
+        current = _state.get(key)
+        if current is None:
+            current = _load(project_id, document_id) or {}
+            _state[key] = current
+        previous = current.get(step) or {}
+        current[step] = data
+        transition = previous.get("status") != data.get("status")
+        _dirty.setdefault(key, time.monotonic())
+        snapshot = dict(current)
+    _publish(key, snapshot)
+    if transition:
+        _flush_key(key)
+    else:
+        _ensure_flusher()
+
+
+def reset_metrics(project_id: int, document_id: int):
+    """Start a document's metrics afresh, e.g. before it is processed again."""
+    key = (project_id, document_id)
+    with _lock:
+        _state[key] = {}
+        _dirty[key] = time.monotonic()
+    _publish(key, {})
+    _flush_key(key)
+
+
+def finish_metrics(project_id: int, document_id: int):
+    """Flush a document's metrics and drop it from memory once its job has ended."""
+    key = (project_id, document_id)
+    _flush_key(key)
+    with _lock:
+        _state.pop(key, None)
+        if key not in _dirty:
+            _write_locks.pop(key, None)
+    _publish(key, None)
+
+
+def delete_metrics(project_id: int, document_id: int):
+    """Forget a document's metrics, in memory and on disk, once the document is deleted."""
+    key = (project_id, document_id)
+    with _lock:
+        _state.pop(key, None)
+        _dirty.pop(key, None)
+        _write_locks.pop(key, None)
+    apply_snapshot(project_id, document_id, None)
+    try:
+        os.remove(_metrics_path(project_id, document_id))
+    except FileNotFoundError:
+        pass
+
+
+def apply_snapshot(project_id: int, document_id: int, snapshot: Optional[dict]):
+    """Mirror a snapshot published by a worker; None means the job has ended."""
+    key = (project_id, document_id)
+    with _lock:
+        if snapshot is None:
+            _live.pop(key, None)
+        else:
+            _live[key] = snapshot
+        watchers = list(_watchers.get(key, ()))
+    if not watchers:
+        return
+    payload = None if snapshot is None else json.dumps(snapshot, default=str)
+    for watcher in watchers:
+        watcher._notify(payload)
+
+
+def watch_metrics(project_id: int, document_id: int) -> MetricsWatcher:
+    """Subscribe the calling event loop to a document's metrics snapshots."""
+    watcher = MetricsWatcher(asyncio.get_running_loop())
+    with _lock:
+        _watchers.setdefault((project_id, document_id), []).append(watcher)
+    return watcher
+
+
+def unwatch_metrics(project_id: int, document_id: int, watcher: MetricsWatcher):
+    key = (project_id, document_id)
+    with _lock:
+        viewers = _watchers.get(key)
+        if viewers and watcher in viewers:
+            viewers.remove(watcher)
+            if not viewers:
+                del _watchers[key]
+
+
+def is_live(project_id: int, document_id: int) -> bool:
+    with _lock:
+        return (project_id, document_id) in _live
+
+
+def read_metrics(project_id: int, document_id: int) -> Optional[dict]:
+    """Current metrics for a document: from memory while it is being processed, else from disk."""
+    key = (project_id, document_id)
+    with _lock:
+        current = _state.get(key) or _live.get(key)
+        if current is not None:
+            return json.loads(json.dumps(current, default=str))
+    return _load(project_id, document_id)
+
+
+@atexit.register
+def _flush_all():
+    with _lock:
+        keys = list(_dirty)
+    for key in keys:
+        try:
+            _flush_key(key)
+        except OSError:
+            pass
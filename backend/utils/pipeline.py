@@ -4,9 +4,15 @@ from datetime import datetime
 
 from utils.loaders import partition_document, is_tabular
 from utils.chunking import create_chunks_by_title, separate_content_types
-from utils.summarizer import summarise_chunks, update_metrics
-from utils.vectorbase import create_vector_store, load_vector_store, count_vectors
+from utils.summarizer import summarise_chunks
+from utils.metrics import update_metrics, delete_metrics
+from utils.vectorbase import (
+    create_vector_store, load_vector_store, count_vectors,
+    sync_document_vectors, document_vector_ids, upsert_chunks, delete_vectors,
+    delete_document_vectors,
+)
 from utils.qa import build_context_from_chunks
+from utils.blobstore import pack_original_content
 from utils.llm import call_llm
 from loaders import tabular_loader
 from loaders.audio_loader import SUPPORTED as AUDIO_EXTENSIONS
@@ -28,26 +34,83 @@ def _project_base_dir(project_id: int) -> str:
     return proj_dir
 
 
+def _count_elements(elements) -> dict:
+    """Break partitioned elements down by kind for the partitioning metrics."""
+    counts = {"total_elements": len(elements), "text_sections": 0, "tables": 0,
+              "images": 0, "titles_headers": 0, "other_elements": 0}
+    for el in elements:
+        tname = type(el).__name__
+        md = getattr(el, "metadata", None)
+        if tname == "Table" or (md and getattr(md, "text_as_html", None)):
+            counts["tables"] += 1
+        elif tname == "Image" or (md and getattr(md, "image_base64", None)):
+            counts["images"] += 1
+        elif tname in ("Title", "Header"):
+            counts["titles_headers"] += 1
+        elif hasattr(el, "text"):
+            counts["text_sections"] += 1
+        else:
+            counts["other_elements"] += 1
+    return counts
+
+
+def _vectorize(lc_docs, project_id: int, document_id: int, vec_dir: str):
+    """Embed and store `lc_docs`, recording the vectorization metrics step."""
+    if document_id:
+        update_metrics(project_id, document_id, "vectorization", {
+            "status": "processing", "started_at": datetime.utcnow().isoformat() + "Z",
+        })
+    before_count = count_vectors(persist_directory=vec_dir)
+    started = datetime.utcnow()
+    embed_stats = {}
+    if document_id:
+        # Re-ingesting a document only embeds new or changed chunks and drops removed ones
+        sync_document_vectors(lc_docs, vec_dir, document_id, stats=embed_stats)
+    else:
+        create_vector_store(lc_docs, persist_directory=vec_dir, stats=embed_stats)
+    after_count = count_vectors(persist_directory=vec_dir)
+    duration_ms = int((datetime.utcnow() - started).total_seconds() * 1000)
+    if document_id:
+        update_metrics(project_id, document_id, "vectorization", {
+            "status": "completed",
+            "embedded": len(lc_docs),
+            "total": len(lc_docs),
+            "model": "nomic-embed-text",
+            "distance_metric": "cosine",
+            "collection_count_before": before_count,
+            "collection_count_after": after_count,
+            "persist_directory": vec_dir,
+            "ended_at": datetime.utcnow().isoformat() + "Z",
+            "duration_ms": duration_ms,
+            **embed_stats,
+        })
+
+
 def process_tabular_document(file_path: str, project_id: int, document_id: int = None):
     if document_id:
         update_metrics(project_id, document_id, "queued", {"status": "completed"})
         update_metrics(project_id, document_id, "partitioning", {"status": "processing"})
     
-    # 1. Partitioning: parse the CSV header and extract metadata
-    df = tabular_loader.load(file_path)
-    tabular_loader.save_dataframe(df, project_id, document_id)
-    rows, cols = df.shape
-    
+    # 1. Partitioning: stream the file into the columnar store, gathering
+    # schema and missing values batch by batch
+    def _progress(rows_read: int):
+        if document_id:
+            update_metrics(project_id, document_id, "partitioning", {"status": "processing", "rows_read": rows_read})
+
+    info = tabular_loader.ingest(file_path, project_id, document_id, on_batch=_progress)
+    rows, cols = info["shape"]
+    columns = info["columns"]
+
     # Extract data types and missing values info
-    dtypes = {c: str(t) for c, t in df.dtypes.items()}
-    missing_stats = df.isnull().sum().to_dict()
+    dtypes = info["dtypes"]
+    missing_stats = info["missing_values"]
     
     # 2. Summary (metadata): generate a concise metadata block
     summary_text = (
         f" **Tabular Data Summary: {os.path.basename(file_path)}**\n\n"
         f"- **Rows:** {rows}\n"
         f"- **Columns:** {cols}\n"
-        f"- **Column Names:** {', '.join(df.columns)}\n"
+        f"- **Column Names:** {', '.join(columns)}\n"
         f"- **Data Types:** {', '.join([f'{c} ({t})' for c, t in dtypes.items()])}\n"
         f"- **Missing Values:** {sum(missing_stats.values())} total"
     )
@@ -57,8 +120,12 @@ def process_tabular_document(file_path: str, project_id: int, document_id: int =
             "status": "completed", 
             "rows": rows, 
             "columns": cols,
-            "column_names": list(df.columns),
-            "missing_values": missing_stats
+            "column_names": columns,
+            "missing_values": missing_stats,
+            "encoding": (info["sniffed"] or {}).get("encoding"),
+            "delimiter": (info["sniffed"] or {}).get("delimiter"),
+            "batches": info["batches"],
+            "schema_restarts": info["schema_restarts"],
         })
         
         # 4. Skip Chunking, Summarisation, Vectorization entirely by marking them as completed for tabular data
@@ -79,17 +146,18 @@ def process_tabular_document(file_path: str, project_id: int, document_id: int =
     existing[str(document_id)] = {
         "file_path": file_path,
         "filename": os.path.basename(file_path),
-        "columns": list(df.columns),
+        "columns": columns,
         "dtypes": dtypes,
+        "column_stats": info["column_stats"],
         "shape": [rows, cols],
         "summary": summary_text
     }
     with open(schema_path, "w", encoding="utf-8") as f:
-        json.dump(existing, f, ensure_ascii=False, indent=2)
+        json.dump(existing, f, ensure_ascii=False, indent=2, default=str)
 
-    # 5. Return metadata summary and interactive table
-    # Return more rows for client-side interaction (e.g., first 500 rows)
-    return summary_text, df.head(500).to_dict(orient="records")
+    # 5. Return metadata summary and a small preview for the chat message;
+    # the full table is paged from the tabular-data endpoint
+    return summary_text, info["preview"]
 
 
 def process_image_document(file_path: str, project_id: int, document_id: int = None):
@@ -151,71 +219,51 @@ def process_image_document(file_path: str, project_id: int, document_id: int = N
             "filename": fname,
             "page_number": 1,
             "chunk_id": 0,
-            "original_content": json.dumps({
-                "raw_text": text,
-                "tables_html": [],
-                "images_base64": [b64],
-            }),
+            "original_content": pack_original_content(project_id, text, images=[b64]),
         },
     )
 
-    if document_id:
-        update_metrics(project_id, document_id, "vectorization", {
-            "status": "processing", "started_at": datetime.utcnow().isoformat() + "Z",
-        })
-
-    before_count = count_vectors(persist_directory=vec_dir)
-    started = datetime.utcnow()
-    create_vector_store([lc_doc], persist_directory=vec_dir)
-    after_count = count_vectors(persist_directory=vec_dir)
-    duration_ms = int((datetime.utcnow() - started).total_seconds() * 1000)
-
-    if document_id:
-        update_metrics(project_id, document_id, "vectorization", {
-            "status": "completed",
-            "embedded": 1, "total": 1,
-            "model": "nomic-embed-text",
-            "distance_metric": "cosine",
-            "collection_count_before": before_count,
-            "collection_count_after": after_count,
-            "persist_directory": vec_dir,
-            "ended_at": datetime.utcnow().isoformat() + "Z",
-            "duration_ms": duration_ms,
-        })
+    _vectorize([lc_doc], project_id, document_id, vec_dir)
 
 
 def process_audio_document(file_path: str, project_id: int, document_id: int = None):
     """
-    Transcribe audio with Whisper, chunk the transcript by time window,
-    embed each chunk exactly like a PDF text chunk.
+    Transcribe audio with Whisper window by window and chunk the transcript as
+    segments arrive. Each ~2400-char chunk is embedded as soon as it is complete,
+    exactly like a PDF text chunk, so the start of a long recording is
+    searchable before transcription finishes.
     """
-    from loaders.audio_loader import transcribe
+    from loaders.audio_loader import transcribe_stream
     from langchain_core.documents import Document as LCDocument
 
     if document_id:
         update_metrics(project_id, document_id, "queued", {"status": "completed"})
         update_metrics(project_id, document_id, "partitioning", {"status": "processing"})
 
-    # 1. Transcribe
-    segments = transcribe(file_path)
-    total_segments = len(segments)
-    full_text = " ".join(s["text"] for s in segments)
-
-    if document_id:
-        update_metrics(project_id, document_id, "partitioning", {
-            "status": "completed",
-            "segments": total_segments,
-            "duration_seconds": round(segments[-1]["end"], 1) if segments else 0,
-            "characters": len(full_text),
-        })
-        update_metrics(project_id, document_id, "chunking", {"status": "processing"})
+    fname = os.path.basename(file_path)
+    project_dir = _project_base_dir(project_id)
+    vec_dir = os.path.join(project_dir, "vector_store")
+    chunks_dir = os.path.join(project_dir, "chunks")
+    os.makedirs(chunks_dir, exist_ok=True)
+    before_count = count_vectors(persist_directory=vec_dir)
+    started = datetime.utcnow()
+    # Vectors from a previous run of this document: unchanged chunks are kept,
+    # whatever is not re-emitted is deleted at the end.
+    existing_ids = document_vector_ids(vec_dir, document_id) if document_id else set()
+    seen_ids = {}
+    written_ids = set()
 
-    # 2. Chunk: group segments into ~2400-char windows (mirrors PDF chunking)
+    # Chunk: group segments into ~2400-char windows (mirrors PDF chunking)
     CHUNK_TARGET = 2400
     chunks_data = []
     buf_text = []
-    buf_start = segments[0]["start"] if segments else 0.0
+    buf_start = None
     buf_chars = 0
+    total_segments = 0
+    total_chars = 0
+    last_end = 0.0
+    embed_seconds = 0.0
+    reused_chunks = 0
 
     def _flush(buf_text, buf_start, buf_end, idx):
         return {
@@ -230,28 +278,83 @@ def process_audio_document(file_path: str, project_id: int, document_id: int = N
             },
         }
 
-    chunk_idx = 0
-    for seg in segments:
+    def _emit(chunk: dict):
+        """Embed one finished chunk (no AI summary needed — transcript is already clean text)."""
+        nonlocal embed_seconds, reused_chunks
+        i = chunk["id"]
+        chunks_data.append(chunk)
+        lc_doc = LCDocument(
+            page_content=chunk["content"],
+            metadata={
+                "project_id": project_id if project_id is not None else -1,
+                "document_id": document_id if document_id is not None else -1,
+                "source": fname,
+                "filename": fname,
+                "page_number": None,
+                "chunk_id": i,
+                "timestamp": chunk["metadata"]["timestamp"],
+                "start": chunk["metadata"]["start"],
+                "end": chunk["metadata"]["end"],
+                "original_content": pack_original_content(
+                    project_id, chunk["content"], timestamp=chunk["metadata"]["timestamp"]
+                ),
+            },
+        )
+        embed_stats = {}
+        if document_id:
+            written_ids.update(upsert_chunks([lc_doc], vec_dir, document_id, existing_ids, seen_ids, stats=embed_stats))
+        else:
+            create_vector_store([lc_doc], persist_directory=vec_dir, stats=embed_stats)
+        embed_seconds += embed_stats.get("embedding_seconds") or 0.0
+        reused_chunks += embed_stats.get("chunks_unchanged", 0)
+        if document_id:
+            # Rewritten per chunk so the pipeline modal shows chunks while audio is still transcribing
+            with open(os.path.join(chunks_dir, f"document_{document_id}.json"), "w") as f:
+                json.dump(chunks_data, f)
+            update_metrics(project_id, document_id, "partitioning", {
+                "status": "processing",
+                "segments": total_segments,
+                "transcribed_seconds": round(last_end, 1),
+                "characters": total_chars,
+            })
+            update_metrics(project_id, document_id, "chunking", {"status": "processing", "chunks_created": len(chunks_data)})
+            update_metrics(project_id, document_id, "summarisation", {
+                "status": "processing", "processed": len(chunks_data), "total": len(chunks_data)
+            })
+            update_metrics(project_id, document_id, "vectorization", {
+                "status": "processing", "embedded": len(chunks_data), "total": len(chunks_data),
+            })
+
+    # 1. Transcribe, 2. chunk and 3. embed as segments arrive
+    transcribe_stats = {}
+    for seg in transcribe_stream(file_path, stats=transcribe_stats):
+        total_segments += 1
+        total_chars += len(seg["text"])
+        last_end = seg["end"]
+        if buf_start is None:
+            buf_start = seg["start"]
         buf_text.append(seg["text"])
         buf_chars += len(seg["text"])
         if buf_chars >= CHUNK_TARGET:
-            chunks_data.append(_flush(buf_text, buf_start, seg["end"], chunk_idx))
-            chunk_idx += 1
+            _emit(_flush(buf_text, buf_start, seg["end"], len(chunks_data)))
             buf_text = []
             buf_start = seg["end"]
             buf_chars = 0
 
     if buf_text:
-        last_end = segments[-1]["end"] if segments else 0.0
-        chunks_data.append(_flush(buf_text, buf_start, last_end, chunk_idx))
+        _emit(_flush(buf_text, buf_start, last_end, len(chunks_data)))
+    deleted_chunks = delete_vectors(vec_dir, existing_ids - written_ids)
 
-    # Save chunks JSON (for pipeline modal)
     if document_id:
-        project_dir = _project_base_dir(project_id)
-        chunks_dir = os.path.join(project_dir, "chunks")
-        os.makedirs(chunks_dir, exist_ok=True)
         with open(os.path.join(chunks_dir, f"document_{document_id}.json"), "w") as f:
             json.dump(chunks_data, f)
+        update_metrics(project_id, document_id, "partitioning", {
+            "status": "completed",
+            "segments": total_segments,
+            "duration_seconds": round(last_end, 1),
+            "characters": total_chars,
+            **transcribe_stats,
+        })
         update_metrics(project_id, document_id, "chunking", {
             "status": "completed",
             "atomic_elements": total_segments,
@@ -259,65 +362,23 @@ def process_audio_document(file_path: str, project_id: int, document_id: int = N
             "average_chunk_size_chars": int(sum(len(c["content"]) for c in chunks_data) / len(chunks_data)) if chunks_data else 0,
         })
         update_metrics(project_id, document_id, "summarisation", {
-            "status": "processing", "processed": 0, "total": len(chunks_data)
+            "status": "completed", "processed": len(chunks_data), "total": len(chunks_data)
         })
-
-    # 3. Build LangChain Documents and embed (no AI summary needed — transcript is already clean text)
-    fname = os.path.basename(file_path)
-    project_dir = _project_base_dir(project_id)
-    vec_dir = os.path.join(project_dir, "vector_store")
-    lc_docs = []
-    for i, c in enumerate(chunks_data):
-        lc_docs.append(LCDocument(
-            page_content=c["content"],
-            metadata={
-                "project_id": project_id if project_id is not None else -1,
-                "document_id": document_id if document_id is not None else -1,
-                "source": fname,
-                "filename": fname,
-                "page_number": None,
-                "chunk_id": i,
-                "timestamp": c["metadata"]["timestamp"],
-                "start": c["metadata"]["start"],
-                "end": c["metadata"]["end"],
-                "original_content": json.dumps({
-                    "raw_text": c["content"],
-                    "tables_html": [],
-                    "images_base64": [],
-                    "timestamp": c["metadata"]["timestamp"],
-                }),
-            },
-        ))
-        if document_id:
-            update_metrics(project_id, document_id, "summarisation", {
-                "status": "processing" if i < len(chunks_data) - 1 else "completed",
-                "processed": i + 1,
-                "total": len(chunks_data),
-            })
-
-    if document_id:
-        update_metrics(project_id, document_id, "vectorization", {
-            "status": "processing", "started_at": datetime.utcnow().isoformat() + "Z",
-        })
-
-    before_count = count_vectors(persist_directory=vec_dir)
-    started = datetime.utcnow()
-    create_vector_store(lc_docs, persist_directory=vec_dir)
-    after_count = count_vectors(persist_directory=vec_dir)
-    duration_ms = int((datetime.utcnow() - started).total_seconds() * 1000)
-
-    if document_id:
         update_metrics(project_id, document_id, "vectorization", {
             "status": "completed",
-            "embedded": len(lc_docs),
-            "total": len(lc_docs),
+            "embedded": len(chunks_data),
+            "total": len(chunks_data),
             "model": "nomic-embed-text",
             "distance_metric": "cosine",
             "collection_count_before": before_count,
-            "collection_count_after": after_count,
+            "collection_count_after": count_vectors(persist_directory=vec_dir),
             "persist_directory": vec_dir,
             "ended_at": datetime.utcnow().isoformat() + "Z",
-            "duration_ms": duration_ms,
+            "duration_ms": int((datetime.utcnow() - started).total_seconds() * 1000),
+            "embedding_seconds": round(embed_seconds, 3),
+            "chunks_embedded": len(chunks_data) - reused_chunks,
+            "chunks_unchanged": reused_chunks,
+            "chunks_deleted": deleted_chunks,
         })
 
 
@@ -330,26 +391,21 @@ def process_document(file_path: str, project_id: int, document_id: int = None):
     if document_id:
         update_metrics(project_id, document_id, "queued", {"status": "completed"})
         update_metrics(project_id, document_id, "partitioning", {"status": "processing"})
-    elements = partition_document(file_path)
+    # Partition and chunk exactly once; everything below (metrics, chunk JSON,
+    # summarisation, vectorization) reuses these objects.
+    partition_stats = {}
+    elements = partition_document(file_path, stats=partition_stats)
     if document_id:
-        counts = {"text_sections": 0, "tables": 0, "images": 0, "titles_headers": 0, "other_elements": 0}
-        for el in elements:
-            t = el.__class__.__name__.lower()
-            if "table" in t: counts["tables"] += 1
-            elif "image" in t: counts["images"] += 1
-            elif "title" in t: counts["titles_headers"] += 1
-            elif "text" in t: counts["text_sections"] += 1
-            else: counts["other_elements"] += 1
-        update_metrics(project_id, document_id, "partitioning", {"status": "completed", **counts})
+        update_metrics(project_id, document_id, "partitioning", {"status": "completed", **_count_elements(elements), **partition_stats})
         update_metrics(project_id, document_id, "chunking", {"status": "processing"})
     chunks = create_chunks_by_title(elements)
+    contents = [separate_content_types(chunk) for chunk in chunks]
     if document_id:
         chunks_dir = os.path.join(project_dir, "chunks")
         os.makedirs(chunks_dir, exist_ok=True)
         chunks_data = []
         total_chars = 0
-        for i, chunk in enumerate(chunks):
-            content = separate_content_types(chunk)
+        for i, (chunk, content) in enumerate(zip(chunks, contents)):
             chunk_type = "table" if "table" in content["types"] else ("image" if "image" in content["types"] else "text")
             entry = {
                 "id": i, "type": chunk_type,
@@ -370,29 +426,42 @@ def process_document(file_path: str, project_id: int, document_id: int = None):
             "average_chunk_size_chars": int(total_chars / len(chunks)) if chunks else 0,
         })
     fname = os.path.basename(file_path) if isinstance(file_path, str) else None
-    summarised_chunks = summarise_chunks(chunks, project_id, document_id, fname)
-    if document_id:
-        update_metrics(project_id, document_id, "vectorization", {
-            "status": "processing", "started_at": datetime.utcnow().isoformat() + "Z",
-        })
-    before_count = count_vectors(persist_directory=vec_dir)
-    started = datetime.utcnow()
-    create_vector_store(summarised_chunks, persist_directory=vec_dir)
-    after_count = count_vectors(persist_directory=vec_dir)
-    duration_ms = int((datetime.utcnow() - started).total_seconds() * 1000)
-    if document_id:
-        update_metrics(project_id, document_id, "vectorization", {
-            "status": "completed",
-            "embedded": len(summarised_chunks),
-            "total": len(summarised_chunks),
-            "model": "nomic-embed-text",
-            "distance_metric": "cosine",
-            "collection_count_before": before_count,
-            "collection_count_after": after_count,
-            "persist_directory": vec_dir,
-            "ended_at": datetime.utcnow().isoformat() + "Z",
-            "duration_ms": duration_ms,
-        })
+    summarised_chunks = summarise_chunks(chunks, project_id, document_id, fname, contents=contents)
+    _vectorize(summarised_chunks, project_id, document_id, vec_dir)
+
+
+def remove_document(project_id: int, document_id: int, file_path: str = None) -> dict:
+    """
+    Delete everything ingestion produced for a document: its vectors, chunk
+    JSON, metrics, tabular data and schema entry, and the uploaded file if
+    given. Blobs are content-addressed and may be shared, so they stay.
+    """
+    project_dir = _project_base_dir(project_id)
+    removed = {"vectors": delete_document_vectors(os.path.join(project_dir, "vector_store"), document_id)}
+
+    chunks_path = os.path.join(project_dir, "chunks", f"document_{document_id}.json")
+    removed["chunks"] = os.path.exists(chunks_path)
+    if removed["chunks"]:
+        os.remove(chunks_path)
+
+    delete_metrics(project_id, document_id)
+    removed["tabular"] = tabular_loader.delete_dataframe(project_id, document_id)
+
+    schema_path = os.path.join(project_dir, "tabular_schema.json")
+    if os.path.exists(schema_path):
+        with open(schema_path, "r", encoding="utf-8") as f:
+            schema = json.load(f)
+        if schema.pop(str(document_id), None) is not None:
+            if schema:
+                with open(schema_path, "w", encoding="utf-8") as f:
+                    json.dump(schema, f, ensure_ascii=False, indent=2)
+            else:
+                os.remove(schema_path)  # no tabular documents left: stop routing to the tabular path
+
+    removed["upload"] = bool(file_path) and os.path.exists(file_path)
+    if removed["upload"]:
+        os.remove(file_path)
+    return removed
 
 
 def load_project_vector_store(project_id: int):
@@ -401,9 +470,14 @@ def load_project_vector_store(project_id: int):
     return load_vector_store(persist_directory=vec_dir)
 
 
-def ask_question(project_id: int, question: str, model: str = "llama3.2:3b"):
+def ask_question(project_id: int, question: str, model: str = "llama3.2:3b", hits: list = None):
+    """
+    Stream an answer to `question`. If `hits` is given, it is filled with the
+    (Document, similarity) pairs the answer's context was built from, so callers
+    can show exactly those sources without retrieving a second time.
+    """
     from utils.query_router import classify_query
-    from utils.tabular_query import run_tabular_query
+    from utils.tabular_query import run_document_query, answer_from_stats
 
     qnorm = (question or "").lower().strip()
     if qnorm in ("hi", "hello", "hey", "hlo"):
@@ -421,10 +495,19 @@ def ask_question(project_id: int, question: str, model: str = "llama3.2:3b"):
     if query_type == "analytical" and has_tabular:
         with open(schema_path, "r", encoding="utf-8") as f:
             schema = json.load(f)
+        # Simple aggregates are answered from column statistics, without the LLM
+        fast = None
         for doc_id_str, meta in schema.items():
             try:
-                df = tabular_loader.load_dataframe(project_id, int(doc_id_str))
-                result = run_tabular_query(df, question, model=model)
+                fast = answer_from_stats(question, meta, lambda d=int(doc_id_str): tabular_loader.get_dataframe(project_id, d))
+            except Exception as e:
+                print(f"[tabular] fast path failed for document {doc_id_str}: {e}")
+            if fast:
+                break
+        for doc_id_str, meta in ([(doc_id_str, meta)] if fast else schema.items()):
+            try:
+                # Generated code runs in a limited sandbox worker that maps the stored table itself
+                result = fast or run_document_query(project_id, int(doc_id_str), meta.get("columns", []), question, model=model)
                 if result["type"] == "error":
                     # Fall through to RAG silently
                     break
@@ -440,7 +523,7 @@ def ask_question(project_id: int, question: str, model: str = "llama3.2:3b"):
                         "summary": summary,
                         "source": meta["filename"],
                         "code": result.get("code", ""),
-                    })
+                    }, default=str)  # typed columns: timestamps etc.
                     yield f"__TABULAR__{payload}"
                     return
                 else:
@@ -455,7 +538,7 @@ def ask_question(project_id: int, question: str, model: str = "llama3.2:3b"):
                         "raw": result["data"],
                         "source": meta["filename"],
                         "code": result.get("code", ""),
-                    })
+                    }, default=str)
                     yield f"__TABULAR__{payload}"
                     return
             except Exception:
@@ -481,15 +564,18 @@ def ask_question(project_id: int, question: str, model: str = "llama3.2:3b"):
     # Use similarity_search_with_score for score-filtered retrieval
     SIMILARITY_THRESHOLD = 0.30
     raw = db.similarity_search_with_score(question, k=top_k)
-    chunks = []
+    scored = []
     for doc, dist in raw:
         similarity = max(0.0, 1.0 - (dist / 2.0))
         if similarity >= SIMILARITY_THRESHOLD:
-            chunks.append(doc)
+            scored.append((doc, similarity))
     # Sort best-first (raw already sorted by distance ascending, so this is already best-first)
-    if not chunks:
+    if not scored and raw:
         # Fall back to top result even if below threshold rather than returning nothing
-        chunks = [raw[0][0]] if raw else []
+        scored = [(raw[0][0], max(0.0, 1.0 - (raw[0][1] / 2.0)))]
+    if hits is not None:
+        hits.extend(scored)
+    chunks = [doc for doc, _ in scored]
 
     context_text = build_context_from_chunks(chunks)
     for token in call_llm(context_text, question):
@@ -1,5 +1,6 @@
 import json
 from utils.llm import call_llm
+from utils.blobstore import load_tables
 
 
 def build_context_from_chunks(chunks):
@@ -31,7 +32,7 @@ def build_context_from_chunks(chunks):
             if raw_text:
                 parts.append(f"TEXT:\n{raw_text}\n\n")
             
-            tables = data.get("tables_html", [])
+            tables = load_tables(chunk.metadata.get("project_id"), data)
             if tables:
                 parts.append("TABLES:\n")
                 for j, table in enumerate(tables):
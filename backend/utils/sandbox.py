@@ -0,0 +1,376 @@
+"""
+Sandboxed execution of LLM-generated pandas expressions.
+
+Generated code is parsed and checked against an AST allow-list first: a single
+expression over `df` and a whitelist of `pd` functions, no dunder access, no
+file I/O (`read_*`, `to_*` except a few in-memory conversions, numpy's
+`tofile`/`dump`), no `eval`/`query`, no `str.format`, only harmless builtins,
+and the function given to `apply`/`agg`/`transform`/`map` must be a lambda, a
+builtin or a literal, allow-listed method name (pandas resolves strings, so a
+name built at runtime could reach any method). It is then run on a small pool
+of SANDBOX_WORKERS spawn processes, each limited by:
+
+- memory: RLIMIT_DATA of SANDBOX_MEMORY_MB, so a runaway join raises
+  MemoryError in the worker instead of starving the API;
+- CPU: a soft RLIMIT_CPU SANDBOX_CPU_SECONDS ahead before every query; the
+  SIGXCPU it raises aborts the expression and the worker lives on. SIGXCPU is
+  only handled between bytecodes, so a single long C call (most pandas work)
+  ignores it: the hard limit, SANDBOX_CPU_GRACE_SECONDS later, has the kernel
+  kill the worker. The hard limit can only be lowered, so later queries get
+  what is left under it, and a worker with less than half a query's budget
+  left is replaced;
+- files: RLIMIT_FSIZE of 0, in an empty read-only working directory, so a
+  write the allow-list missed fails;
+- wall clock: the caller stops waiting after SANDBOX_TIMEOUT_SECONDS (or
+  when `cancel` is set) and kills the worker, whatever it is stuck in.
+
+Workers do not receive the DataFrame over a pipe. They open the document's
+stored columnar file through a memory map (tabular_loader.get_dataframe), so
+the data is shared through the page cache, nothing is pickled, and each
+worker keeps its own warm frame cache. Only the normalised, row-capped result
+travels back.
+
+Resource limits need the POSIX `resource` module; elsewhere only the wall
+clock timeout applies.
+"""
+import os
+import ast
+import json
+import builtins
+import time
+import signal
+import threading
+import traceback
+import multiprocessing
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SANDBOX_WORKERS = int(os.getenv("TABULAR_SANDBOX_WORKERS", 2))
+SANDBOX_TIMEOUT_SECONDS = float(os.getenv("TABULAR_SANDBOX_TIMEOUT_SECONDS", 15))
+SANDBOX_CPU_SECONDS = int(os.getenv("TABULAR_SANDBOX_CPU_SECONDS", 10))
+SANDBOX_CPU_GRACE_SECONDS = int(os.getenv("TABULAR_SANDBOX_CPU_GRACE_SECONDS", 3))  # soft -> hard CPU limit
+SANDBOX_MEMORY_MB = int(os.getenv("TABULAR_SANDBOX_MEMORY_MB", 2048))
+SANDBOX_MAX_ROWS = int(os.getenv("TABULAR_SANDBOX_MAX_ROWS", 5000))  # rows of a table result sent back
+
+_SAFE_BUILTINS = {
+    name: getattr(builtins, name)
+    for name in ("abs", "all", "any", "bool", "dict", "enumerate", "float", "int", "len", "list", "max",
+                 "min", "range", "round", "set", "sorted", "str", "sum", "tuple", "zip")
+}
+_PD_ALLOWED = {
+    "DataFrame", "Series", "Timestamp", "Timedelta", "DateOffset", "Grouper", "NA", "NaT",
+    "concat", "crosstab", "cut", "date_range", "isna", "isnull", "merge", "notna", "notnull",
+    "pivot_table", "qcut", "to_datetime", "to_numeric", "to_timedelta", "unique", "value_counts",
+}
+_BLOCKED_ATTRS = {
+    "eval", "query", "pipe", "plot", "hist", "boxplot", "style", "tofile", "dump", "dumps",
+    "format", "format_map",
+}
+# Most `to_*` methods can write files (to_csv, to_string(buf=...), ...); only these may be called
+_TO_ALLOWED = {
+    "to_dict", "to_list", "to_frame", "to_numpy", "to_records", "to_period", "to_timestamp",
+    "to_pydatetime", "to_pytimedelta", "to_datetime", "to_numeric", "to_timedelta",
+}
+# Methods that take a function, which pandas also accepts as a method name
+_FUNC_METHODS = {"apply", "agg", "aggregate", "transform", "map", "applymap"}
+_FUNC_NAMES = {
+    "all", "any", "count", "cummax", "cummin", "cumprod", "cumsum", "describe", "first", "idxmax", "idxmin",
+    "kurt", "last", "max", "mean", "median", "min", "mode", "nunique", "prod", "quantile", "rank", "sem",
+    "size", "skew", "std", "sum", "unique", "value_counts", "var", "abs", "round",
+}
+_ALLOWED_NODES = (
+    ast.Expression, ast.Call, ast.Attribute, ast.Name, ast.Load, ast.Store, ast.Constant, ast.Subscript,
+    ast.Slice, ast.Tuple, ast.List, ast.Dict, ast.Set, ast.Compare, ast.BinOp, ast.UnaryOp, ast.BoolOp,
+    ast.IfExp, ast.keyword, ast.Lambda, ast.arguments, ast.arg, ast.ListComp, ast.SetComp, ast.DictComp,
+    ast.GeneratorExp, ast.comprehension, ast.JoinedStr, ast.FormattedValue,
+    ast.operator, ast.unaryop, ast.cmpop, ast.boolop, ast.expr_context,
+) + tuple(n for n in (getattr(ast, "Index", None),) if n is not None)
+
+_lock = threading.Lock()
+_idle: List["_Worker"] = []
+_slots = threading.BoundedSemaphore(max(1, SANDBOX_WORKERS))
+
+
+class UnsafeCode(ValueError):
+    """Generated code that the allow-list rejects."""
+
+
+def _blocked(name: str) -> bool:
+    if name.startswith(("_", "read_")) or name in _BLOCKED_ATTRS:
+        return True
+    return name.startswith("to_") and name not in _TO_ALLOWED
+
+
+def _is_pandas_method(name: str) -> bool:
+    return any(hasattr(cls, name) for cls in (pd.DataFrame, pd.Series, pd.Index))
+
+
+def _check_func(node: ast.AST, mapping: bool):
+    """
+    The function argument of an apply/agg/transform/map call: a lambda, a safe
+    builtin, an allowed pd function or a literal name from _FUNC_NAMES, or
+    lists and dicts of those. `mapping` (map/applymap) also allows a literal
+    value mapping ({"a": 1}).
+    """
+    if isinstance(node, ast.Lambda):
+        return
+    if isinstance(node, ast.Constant) and isinstance(node.value, str) and node.value in _FUNC_NAMES:
+        return
+    if isinstance(node, ast.Name) and node.id in _SAFE_BUILTINS:
+        return
+    if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id == "pd":
+        return  # checked against _PD_ALLOWED with the other attributes
+    if isinstance(node, (ast.List, ast.Tuple)):
+        for item in node.elts:
+            _check_func(item, False)
+        return
+    if isinstance(node, ast.Dict):
+        if mapping and all(isinstance(v, ast.Constant) for v in node.values):
+            return
+        for value in node.values:
+            _check_func(value, False)
+        return
+    raise UnsafeCode(f"Unsupported function argument: {ast.unparse(node)}")
+
+
+def _check_func_call(node: ast.Call):
+    method = node.func.attr
+    mapping = method in ("map", "applymap")
+    if node.args:
+        _check_func(node.args[0], mapping)
+    for kw in node.keywords:
+        if kw.arg is None:
+            raise UnsafeCode(f"Keyword unpacking is not allowed in .{method}()")
+        if kw.arg in ("func", "arg"):
+            _check_func(kw.value, mapping)
+        elif method in ("agg", "aggregate"):
+            # named aggregation (total=("salary", "sum")) or a literal option (numeric_only=True)
+            if isinstance(kw.value, ast.Tuple) and len(kw.value.elts) == 2:
+                _check_func(kw.value.elts[1], False)
+            elif not isinstance(kw.value, ast.Constant):
+                raise UnsafeCode(f"Unsupported argument {kw.arg}= in .{method}()")
+
+
+def validate(code: str) -> ast.Expression:
+    """Parse `code` as one expression and reject anything outside the allow-list."""
+    try:
+        tree = ast.parse(code, mode="eval")
+    except SyntaxError as e:
+        raise UnsafeCode(f"Not a single Python expression: {e.msg}")
+    bound = {n.arg for n in ast.walk(tree) if isinstance(n, ast.arg)}
+    bound |= {n.id for n in ast.walk(tree) if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Store)}
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise UnsafeCode(f"{type(node).__name__} is not allowed")
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load):
+            if node.id not in ("df", "pd") and node.id not in _SAFE_BUILTINS and node.id not in bound:
+                raise UnsafeCode(f"Name '{node.id}' is not allowed")
+        elif isinstance(node, ast.Attribute):
+            if _blocked(node.attr):
+                raise UnsafeCode(f"Attribute '{node.attr}' is not allowed")
+            if isinstance(node.value, ast.Name) and node.value.id == "pd" and node.attr not in _PD_ALLOWED:
+                raise UnsafeCode(f"pd.{node.attr} is not allowed")
+        elif isinstance(node, ast.Call):
+            if isinstance(node.func, ast.Attribute) and node.func.attr in _FUNC_METHODS:
+                _check_func_call(node)
+        elif isinstance(node, ast.Constant) and isinstance(node.value, str):
+            # pandas resolves method names given as strings (df.agg("to_pickle", ...));
+            # other strings (column names like "to_date") are fine
+            if node.value.startswith("_") or (_blocked(node.value) and _is_pandas_method(node.value)):
+                raise UnsafeCode(f"String '{node.value}' is not allowed")
+    return tree
+
+
+def evaluate(code: str, df: pd.DataFrame) -> Any:
+    """Validate and evaluate `code` against `df` in this process, without resource limits."""
+    tree = validate(code)
+    return eval(compile(tree, "<generated>", "eval"), {"__builtins__": _SAFE_BUILTINS, "df": df, "pd": pd})  # noqa: S307
+
+
+def _records(df: pd.DataFrame) -> list:
+    return json.loads(df.to_json(orient="records", date_format="iso"))
+
+
+def normalise(result: Any, max_rows: int = SANDBOX_MAX_ROWS) -> Dict:
+    """
+    Turn an evaluation result into plain data: a table (records, columns,
+    capped at `max_rows`) or a scalar, plus a short text preview for the summary.
+    """
+    if isinstance(result, pd.DataFrame):
+        # If the index has a name or is not the default RangeIndex, include it
+        table = result.reset_index() if result.index.name or not isinstance(result.index, pd.RangeIndex) else result
+        preview = result.to_string(max_rows=20)
+    elif isinstance(result, pd.Series):
+        table = result.reset_index()
+        preview = result.to_string(max_rows=50)
+    else:
+        return {"type": "scalar", "data": str(result), "preview": str(result)}
+    table = table.set_axis([str(c) for c in table.columns], axis=1)
+    return {
+        "type": "table",
+        "data": _records(table.head(max_rows)),
+        "columns": list(table.columns),
+        "rows": len(table),
+        "truncated": len(table) > max_rows,
+        "preview": preview,
+    }
+
+
+def _on_cpu_limit(signum, frame):
+    raise TimeoutError(f"CPU time limit of {SANDBOX_CPU_SECONDS}s exceeded")
+
+
+def _cpu_used() -> int:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return int(usage.ru_utime + usage.ru_stime) + 1
+
+
+def _cpu_budget() -> int:
+    """CPU seconds the next query may use before SIGXCPU."""
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if hard == resource.RLIM_INFINITY:
+        return SANDBOX_CPU_SECONDS
+    return min(SANDBOX_CPU_SECONDS, hard - SANDBOX_CPU_GRACE_SECONDS - _cpu_used())
+
+
+def _limit_cpu():
+    """
+    Set the soft CPU limit up to SANDBOX_CPU_SECONDS past what this process has
+    used so far. The hard limit (kernel kill) goes SANDBOX_CPU_GRACE_SECONDS
+    above it on the first query; it cannot be raised again after that.
+    """
+    used = _cpu_used()
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if hard == resource.RLIM_INFINITY:
+        hard = used + SANDBOX_CPU_SECONDS + max(1, SANDBOX_CPU_GRACE_SECONDS)
+    soft = max(used, min(used + SANDBOX_CPU_SECONDS, hard - max(1, SANDBOX_CPU_GRACE_SECONDS)))
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _isolate_files():
+    """No file may grow past 0 bytes, and the working directory is empty and read-only."""
+    import tempfile
+    workdir = tempfile.mkdtemp(prefix="tabular-sandbox-")
+    os.chmod(workdir, 0o500)
+    os.chdir(workdir)
+    # Python ignores SIGXFSZ, so writes fail with EFBIG instead of killing the worker
+    resource.setrlimit(resource.RLIMIT_FSIZE, (0, 0))
+
+
+def _worker_main(conn):
+    """Serve queries from the parent until the pipe closes. Executes inside a sandbox worker."""
+    # One thread per worker: CPU limits are per process, and RLIMIT_DATA counts
+    # every pool thread's stack. Arrow's default allocator reserves ~1 GB of
+    # address space up front, so use the system one to keep the limit meaningful.
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = "1"
+    from loaders import tabular_loader
+    if tabular_loader.pa is not None:
+        tabular_loader.pa.set_memory_pool(tabular_loader.pa.system_memory_pool())
+        tabular_loader.pa.set_cpu_count(1)
+        tabular_loader.pa.set_io_thread_count(1)
+    if resource is not None:
+        limit = SANDBOX_MEMORY_MB * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_DATA, (limit, limit))
+        signal.signal(signal.SIGXCPU, _on_cpu_limit)
+        _isolate_files()
+    while True:
+        try:
+            project_id, document_id, code = conn.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            df = tabular_loader.get_dataframe(project_id, document_id)
+            if resource is not None:
+                _limit_cpu()
+            reply = {"ok": True, **normalise(evaluate(code, df))}
+        except UnsafeCode as e:
+            reply = {"ok": False, "error": f"Rejected generated code: {e}"}
+        except MemoryError:
+            reply = {"ok": False, "error": f"Memory limit of {SANDBOX_MEMORY_MB} MB exceeded"}
+        except TimeoutError as e:
+            reply = {"ok": False, "error": str(e)}
+        except Exception:
+            reply = {"ok": False, "error": f"Code execution failed:\n{traceback.format_exc()}"}
+        # Less than half a query's CPU left under the hard limit: let a fresh worker take over
+        retire = resource is not None and _cpu_budget() < max(1, SANDBOX_CPU_SECONDS // 2)
+        try:
+            conn.send({**reply, "retire": True} if retire else reply)
+        except (EOFError, OSError):
+            return
+        if retire:
+            return
+
+
+class _Worker:
+    def __init__(self):
+        ctx = multiprocessing.get_context("spawn")
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child,), name="tabular-sandbox", daemon=True)
+        self.process.start()
+        child.close()
+
+    def kill(self):
+        try:
+            self.process.kill()
+            self.process.join(timeout=1)
+        finally:
+            self.conn.close()
+
+
+def execute(project_id: int, document_id: int, code: str, timeout: float = None,
+            cancel: Optional[threading.Event] = None) -> Dict:
+    """
+    Evaluate generated `code` against a stored tabular document in a sandbox
+    worker. Returns normalise()'s result with "ok": True, or {"ok": False,
+    "error": ...} if the code was rejected, failed, ran out of CPU, memory or
+    time, or `cancel` was set.
+    """
+    try:
+        validate(code)  # reject early, without a round trip
+    except UnsafeCode as e:
+        return {"ok": False, "error": f"Rejected generated code: {e}"}
+    timeout = SANDBOX_TIMEOUT_SECONDS if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    if not _slots.acquire(timeout=timeout):
+        return {"ok": False, "error": "Sandbox busy; try again"}
+    worker = None
+    try:
+        with _lock:
+            worker = _idle.pop() if _idle else None
+        if worker is None or not worker.process.is_alive():
+            worker = _Worker()
+        worker.conn.send((project_id, document_id, code))
+        while not worker.conn.poll(0.05):
+            if cancel is not None and cancel.is_set():
+                raise InterruptedError("Query cancelled")
+            if time.monotonic() > deadline:
+                raise InterruptedError(f"Query exceeded {timeout:g}s")
+            if not worker.process.is_alive():
+                raise InterruptedError("Sandbox worker died (resource limit)")
+        reply = worker.conn.recv()
+        if not reply.pop("retire", False):
+            with _lock:
+                _idle.append(worker)
+            worker = None
+        return reply
+    except (InterruptedError, EOFError, OSError) as e:
+        return {"ok": False, "error": str(e) or "Sandbox worker died"}
+    finally:
+        if worker is not None:
+            worker.kill()  # stuck, cancelled or dead: never reuse
+        _slots.release()
+
+
+def stop_sandbox():
+    """Kill idle sandbox workers (e.g. on shutdown)."""
+    with _lock:
+        workers, _idle[:] = list(_idle), []
+    for worker in workers:
+        worker.kill()
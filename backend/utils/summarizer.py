@@ -1,11 +1,25 @@
-import json
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from langchain_core.documents import Document
-from utils.llm import call_llm
+from typing import Optional
+from utils.llm import call_llm, llm_slot, LLM_MODEL
 from utils.chunking import separate_content_types
+from utils.blobstore import pack_original_content
+from utils.summary_cache import summary_key, get_summary, put_summary
+from utils.metrics import update_metrics
 
+SUMMARY_WORKERS = int(os.getenv("SUMMARY_WORKERS", 4))
+# Bump when the summary prompt changes so cached summaries are regenerated
+SUMMARY_PROMPT_VERSION = 1
+
+
+def _ai_summary(text: str, tables: list[str], images: list[str]) -> tuple[str, bool]:
+    """Return (summary, cache_hit). Only successful LLM summaries are cached."""
+    key = summary_key(text, tables, SUMMARY_PROMPT_VERSION, LLM_MODEL)
+    cached = get_summary(key)
+    if cached is not None:
+        return cached, True
 
-def create_ai_enhanced_summary(text: str, tables: list[str], images: list[str]) -> str:
     prompt_text = "You are creating a searchable description for document content retrieval.\n\n"
     prompt_text += "CONTENT TO ANALYZE:\n"
     prompt_text += "TEXT CONTENT:\n"
@@ -16,32 +30,78 @@ def create_ai_enhanced_summary(text: str, tables: list[str], images: list[str])
             prompt_text += f"Table {i+1}:\n{table}\n\n"
     prompt = "Generate a comprehensive, searchable description that covers key facts, topics, questions the content could answer, and alternative search terms users might use."
     parts = []
-    for token in call_llm(prompt_text, prompt):
-        parts.append(token)
-    return "".join(parts) if parts else text
+    with llm_slot():
+        for token in call_llm(prompt_text, prompt):
+            parts.append(token)
+    summary = "".join(parts)
+    if not summary or summary.startswith("[ollama-error]"):
+        return text, False
+    put_summary(key, summary)
+    return summary, False
 
 
-def summarise_chunks(chunks, project_id: int = None, document_id: int = None, filename: str = None):
-    docs = []
+def create_ai_enhanced_summary(text: str, tables: list[str], images: list[str]) -> str:
+    return _ai_summary(text, tables, images)[0]
+
+
+def _enhance(content: dict) -> tuple[str, Optional[bool]]:
+    """
+    Searchable text for a chunk: AI summary when it has tables/images, else its
+    text. The second element is the summary-cache hit flag (None if no AI summary).
+    """
+    if not (content["tables"] or content["images"]):
+        return content["text"], None
+    try:
+        return _ai_summary(content["text"], content["tables"], content["images"])
+    except Exception:
+        return content["text"], False
+
+
+def summarise_chunks(chunks, project_id: int = None, document_id: int = None, filename: str = None, contents: list = None):
+    """
+    Turn chunks into LangChain Documents, AI-summarising those with tables/images.
+    `contents` may carry the chunks' already separated content (as returned by
+    separate_content_types) so callers that computed it don't pay for it twice.
+
+    Summaries run on SUMMARY_WORKERS threads, further capped per Ollama host by
+    llm_slot(); results are placed back by index so chunk order and chunk_id
+    are unaffected by completion order.
+    """
     total = len(chunks)
-    
+    if contents is None:
+        contents = [separate_content_types(chunk) for chunk in chunks]
+
     # Update initial metrics if document_id is provided
     if project_id and document_id:
         update_metrics(project_id, document_id, "summarisation", {"status": "processing", "processed": 0, "total": total})
 
-    for i, chunk in enumerate(chunks):
-        content = separate_content_types(chunk)
-        if content["tables"] or content["images"]:
-            try:
-                enhanced = create_ai_enhanced_summary(content["text"], content["tables"], content["images"])
-            except Exception:
-                enhanced = content["text"]
-        else:
-            enhanced = content["text"]
-        
+    enhanced = [None] * total
+    processed = cache_hits = cache_misses = 0
+    with ThreadPoolExecutor(max_workers=max(1, SUMMARY_WORKERS)) as pool:
+        futures = {pool.submit(_enhance, content): i for i, content in enumerate(contents)}
+        for future in as_completed(futures):
+            enhanced[futures[future]], cache_hit = future.result()
+            if cache_hit is not None:
+                cache_hits += int(cache_hit)
+                cache_misses += int(not cache_hit)
+            processed += 1
+            # Update progress metrics
+            if project_id and document_id:
+                lookups = cache_hits + cache_misses
+                update_metrics(project_id, document_id, "summarisation", {
+                    "status": "processing" if processed < total else "completed",
+                    "processed": processed,
+                    "total": total,
+                    "cache_hits": cache_hits,
+                    "cache_misses": cache_misses,
+                    "cache_hit_rate": round(cache_hits / lookups, 4) if lookups else None,
+                })
+
+    docs = []
+    for i, (chunk, content) in enumerate(zip(chunks, contents)):
         page_number = getattr(getattr(chunk, "metadata", {}), "page_number", None)
-        doc = Document(
-            page_content=enhanced,
+        docs.append(Document(
+            page_content=enhanced[i],
             metadata={
                 "project_id": project_id if project_id is not None else -1,
                 "document_id": document_id if document_id is not None else -1,
@@ -49,41 +109,9 @@ def summarise_chunks(chunks, project_id: int = None, document_id: int = None, fi
                 "filename": filename if filename else "Unknown",
                 "page_number": page_number if page_number is not None else 1,
                 "chunk_id": i,
-                "original_content": json.dumps(
-                    {
-                        "raw_text": content["text"],
-                        "tables_html": content["tables"],
-                        "images_base64": content["images"],
-                    }
+                "original_content": pack_original_content(
+                    project_id, content["text"], content["tables"], content["images"]
                 )
             },
-        )
-        docs.append(doc)
-        
-        # Update progress metrics
-        if project_id and document_id:
-            update_metrics(project_id, document_id, "summarisation", {
-                "status": "processing" if i < total - 1 else "completed",
-                "processed": i + 1,
-                "total": total
-            })
-            
+        ))
     return docs
-
-def update_metrics(project_id: int, document_id: int, step: str, data: dict):
-    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    metrics_dir = os.path.join(base_dir, "data", "projects", str(project_id), "metrics")
-    os.makedirs(metrics_dir, exist_ok=True)
-    metrics_path = os.path.join(metrics_dir, f"document_{document_id}.json")
-
-    current_metrics = {}
-    if os.path.exists(metrics_path):
-        with open(metrics_path, "r", encoding="utf-8") as f:
-            try:
-                current_metrics = json.load(f)
-            except Exception:
-                current_metrics = {}
-
-    current_metrics[step] = data
-    with open(metrics_path, "w", encoding="utf-8") as f:
-        json.dump(current_metrics, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,155 @@
+"""
+Persistent cache of AI chunk summaries.
+
+Keys hash everything that determines a summary — chunk text, tables HTML,
+prompt version and model name — so retrying a document or uploading the same
+file to another project reuses earlier summaries instead of calling the LLM.
+Stored in one SQLite file (WAL mode) shared by all ingestion workers; least
+recently used rows are evicted once SUMMARY_CACHE_MAX_ENTRIES is exceeded.
+
+Each thread keeps one connection and the schema is created once per process.
+Lookups are read-only: hits only note their access time in memory, and those
+times are written in batches with the next insert, or every _TOUCH_BATCH hits,
+so cache hits never queue workers on SQLite's write lock.
+"""
+import os
+import time
+import json
+import atexit
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, List, Optional
+
+SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", 20000))
+# Evict in bulk every this many writes rather than on every insert
+_EVICT_EVERY = 100
+# Access times of hits held in memory before they are written
+_TOUCH_BATCH = 100
+
+_writes = 0
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = False
+_touch_lock = threading.Lock()
+_touched: Dict[str, float] = {}
+
+
+def _db_path() -> str:
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    data_dir = os.path.join(base_dir, "data")
+    os.makedirs(data_dir, exist_ok=True)
+    return os.path.join(data_dir, "summary_cache.db")
+
+
+def _ensure_schema(conn):
+    global _schema_ready
+    with _schema_lock:
+        if _schema_ready:
+            return
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS summaries (
+                key TEXT PRIMARY KEY,
+                summary TEXT NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_summaries_last_used ON summaries (last_used)")
+        conn.commit()
+        _schema_ready = True
+
+
+def _connect():
+    """This thread's connection to the cache, opened on first use."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(_db_path(), timeout=10)
+        _local.conn = conn
+    _ensure_schema(conn)
+    return conn
+
+
+def _take_touched() -> Dict[str, float]:
+    global _touched
+    with _touch_lock:
+        touched, _touched = _touched, {}
+    return touched
+
+
+def _write_touched(conn, touched: Dict[str, float]):
+    if touched:
+        conn.executemany(
+            "UPDATE summaries SET last_used = MAX(last_used, ?) WHERE key = ?",
+            [(used, key) for key, used in touched.items()],
+        )
+
+
+def summary_key(text: str, tables: List[str], prompt_version: int, model: str) -> str:
+    payload = json.dumps([text, tables or [], prompt_version, model], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get_summary(key: str) -> Optional[str]:
+    try:
+        row = _connect().execute("SELECT summary FROM summaries WHERE key = ?", (key,)).fetchone()
+    except sqlite3.Error:
+        return None
+    if not row:
+        return None
+    with _touch_lock:
+        _touched[key] = time.time()
+        flush = len(_touched) >= _TOUCH_BATCH
+    if flush:
+        flush_access_times()
+    return row[0]
+
+
+@atexit.register
+def flush_access_times():
+    """Write the access times of recent hits, so eviction keeps what is still in use."""
+    touched = _take_touched()
+    if not touched:
+        return
+    try:
+        conn = _connect()
+        _write_touched(conn, touched)
+        conn.commit()
+    except sqlite3.Error:
+        pass  # only affects which rows are evicted first
+
+
+def put_summary(key: str, summary: str):
+    global _writes
+    try:
+        conn = _connect()
+        try:
+            _write_touched(conn, _take_touched())
+            conn.execute(
+                "INSERT OR REPLACE INTO summaries (key, summary, last_used) VALUES (?, ?, ?)",
+                (key, summary, time.time()),
+            )
+            _writes += 1
+            if _writes % _EVICT_EVERY == 0:
+                conn.execute(
+                    "DELETE FROM summaries WHERE key IN ("
+                    " SELECT key FROM summaries ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (max(1, SUMMARY_CACHE_MAX_ENTRIES),),
+                )
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+    except sqlite3.Error as e:
+        print(f"[summary-cache] write skipped: {e}")
+
+
+def summary_cache_stats() -> Dict:
+    try:
+        entries, chars = _connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(summary)), 0) FROM summaries"
+        ).fetchone()
+    except sqlite3.Error:
+        entries, chars = 0, 0
+    return {"entries": entries, "max_entries": SUMMARY_CACHE_MAX_ENTRIES, "summary_chars": chars}
+
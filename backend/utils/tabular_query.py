@@ -1,12 +1,22 @@
 """
 Tabular query engine: uses Ollama to generate and execute pandas code
-against a loaded DataFrame. Fully offline, no external API calls.
+against a loaded DataFrame. Fully offline, no external API calls. Generated
+code runs through utils.sandbox (AST allow-list, resource-limited workers).
+
+Simple aggregate questions ("max salary", "how many rows", "average age",
+"most common city") skip the LLM. answer_from_stats() matches them with rules
+and answers from the column statistics in tabular_schema.json, or with one
+vectorised pass over the column when the statistics do not hold the answer.
 """
 import re
-import traceback
+import threading
+from typing import Callable, Dict, Optional
+
 import pandas as pd
 import ollama
 
+from utils import sandbox
+
 
 _CODE_SYSTEM = """You are a Python/pandas expert. Given a DataFrame named `df` and a user question,
 write a single Python expression (no imports, no assignments, no print) that evaluates to the answer.
@@ -61,53 +71,172 @@ def _ask_ollama_for_summary(question: str, result_text: str, model: str = "llama
         return f"The computed result is: **{result_text}**"
 
 
-def _df_to_result(df: pd.DataFrame, code: str) -> dict:
-    """Convert a DataFrame result, preserving index as a column when meaningful."""
-    # If the index has a name or is not the default RangeIndex, include it
-    if df.index.name or not isinstance(df.index, pd.RangeIndex):
-        df = df.reset_index()
-    return {
-        "type": "table",
-        "data": df.to_dict(orient="records"),
-        "columns": list(df.columns),
-        "code": code,
-    }
+def _finish(out: dict, question: str, code: str, model: str) -> dict:
+    """Turn a sandbox reply into the query result, with an LLM summary of its preview."""
+    if not out.get("ok"):
+        return {"type": "error", "data": out.get("error", "Code execution failed"), "code": code}
+    result = {k: v for k, v in out.items() if k not in ("ok", "preview")}
+    result["code"] = code
+    result["summary"] = _ask_ollama_for_summary(question, out["preview"], model)
+    return result
 
 
-def run_tabular_query(df: pd.DataFrame, question: str, model: str = "llama3.2:3b") -> dict:
+def run_document_query(project_id: int, document_id: int, columns: list, question: str,
+                       model: str = "llama3.2:3b", cancel: Optional[threading.Event] = None) -> dict:
     """
-    Execute a natural-language query against a DataFrame.
+    Execute a natural-language query against a stored tabular document. The
+    generated code runs in a sandbox worker with CPU, memory and time limits,
+    so the calling process never loads the DataFrame.
     Returns {"type": "table"|"scalar"|"error", "data": ..., "summary": str, "code": str}
     """
     try:
-        code = _ask_ollama_for_code(list(df.columns), question, model)
+        code = _ask_ollama_for_code(list(columns), question, model)
     except Exception as e:
         return {"type": "error", "data": f"LLM error: {e}", "code": ""}
+    return _finish(sandbox.execute(project_id, document_id, code, cancel=cancel), question, code, model)
 
-    try:
-        result = eval(code, {"df": df, "pd": pd})  # noqa: S307
-    except Exception:
-        return {"type": "error", "data": f"Code execution failed:\n{traceback.format_exc()}", "code": code}
-
-    # Normalise result
-    if isinstance(result, pd.DataFrame):
-        out = _df_to_result(result, code)
-        # Build a text preview for the LLM summary
-        preview = result.to_string(max_rows=20)
-        out["summary"] = _ask_ollama_for_summary(question, preview, model)
-        return out
-
-    if isinstance(result, pd.Series):
-        reset = result.reset_index()
-        out = {
-            "type": "table",
-            "data": reset.to_dict(orient="records"),
-            "columns": list(reset.columns),
-            "code": code,
-        }
-        out["summary"] = _ask_ollama_for_summary(question, result.to_string(), model)
-        return out
-
-    # Scalar
-    summary = _ask_ollama_for_summary(question, str(result), model)
-    return {"type": "scalar", "data": str(result), "summary": summary, "code": code}
+
+# Questions with any of these need filtering, grouping or row lookups: leave them to the LLM
+_NOT_SIMPLE = re.compile(
+    r"\b(where|by|per|each|group|grouped|greater|less|more than|fewer|above|below|between|than|"
+    r"except|excluding|without|and|or|vs|versus|compared|ratio|percent|percentage|"
+    r"top|bottom|first|last|sort|sorted|rank|list|show|which|who|whose|least common|least frequent)\b"
+    # Missing values and earnings: "how many null salary" is not nunique(), "how many earn max" not max()
+    r"|(?<!non )(?<!non-)\b(null|nulls|empty|missing|blank|nan|earn|earns|earned|earning)\b"
+)
+# Scoping words: fine in "how many rows in the table", not in "average salary in sales"
+_SCOPED = re.compile(r"\b(in|for|from|with|having|when|during|since|before|after|if|among|within)\b")
+_ROWS_Q = re.compile(r"\b(how many|number of|count of|count the|total)\s+(rows|records|entries|lines)\b")
+_COLUMNS_Q = re.compile(r"\b(how many|number of|count of|count the)\s+(columns|fields)\b")
+# Checked in order; the first operation whose pattern matches wins
+_OPERATIONS = [
+    ("count", r"\b(how many|number of|count of|count the)\s+(non null|non-null|non empty|non-empty|recorded|filled)\b"),
+    ("distinct", r"\b(how many|number of|count of|count the)\s+(distinct|unique|different)\b|\b(distinct|unique) count\b"),
+    ("mode", r"\b(most common|most frequent|mode)\b"),
+    ("max", r"\b(max|maximum|highest|largest|biggest|greatest)\b"),
+    ("min", r"\b(min|minimum|lowest|smallest|least)\b"),
+    # Only meaningful for dates: "oldest age" is not the smallest age
+    ("latest", r"\b(latest|most recent|newest)\b"),
+    ("earliest", r"\b(earliest|oldest)\b"),
+    ("mean", r"\b(average|avg|mean)\b"),
+    ("median", r"\bmedian\b"),
+    ("sum", r"\b(sum|total)\b"),
+    # "how many departments" asks for the departments, not the filled-in rows
+    ("distinct", r"\b(how many|number of|count of|count the)\b"),
+]
+_COUNT_Q = re.compile(r"\b(how many|number of|count of|count the)\b")
+_DATE_OPERATIONS = {"latest": "max", "earliest": "min"}
+_LABELS = {
+    "distinct": "number of distinct values of", "mode": "most common", "max": "highest", "min": "lowest",
+    "latest": "latest", "earliest": "earliest",
+    "mean": "average", "median": "median", "sum": "total", "count": "number of recorded",
+}
+_CODE = {
+    "distinct": "nunique()", "mode": "mode()[0]", "max": "max()", "min": "min()",
+    "latest": "max()", "earliest": "min()",
+    "mean": "mean()", "median": "median()", "sum": "sum()", "count": "count()",
+}
+
+
+def _normalise_question(question: str) -> str:
+    return " ".join(re.sub(r"[^\w\s.-]", " ", (question or "").lower()).split())
+
+
+def _find_column(q: str, columns: list) -> Optional[str]:
+    """The one column the question names (also as a plural), or None if none or several."""
+    found = {}
+    for column in columns:
+        name = " ".join(re.sub(r"[_\-]+", " ", str(column).lower()).split())
+        if not name:
+            continue
+        plural = rf"|{re.escape(name[:-1])}ies" if name.endswith("y") else ""
+        if re.search(rf"\b({re.escape(name)}(s|es)?{plural})\b", q):
+            found[column] = name
+    # "salary" inside "base salary": keep the longest, reject unrelated pairs
+    for column, name in list(found.items()):
+        if any(other != name and name in other for other in found.values()):
+            del found[column]
+    return next(iter(found)) if len(found) == 1 else None
+
+
+def _format(value) -> str:
+    if isinstance(value, bool) or value is None:
+        return str(value)
+    if isinstance(value, int):
+        return f"{value:,}"
+    if isinstance(value, float):
+        return f"{int(value):,}" if value.is_integer() else f"{round(value, 4):,}"
+    return str(value)
+
+
+def _compute(op: str, stats: Optional[Dict], load_column: Callable[[], pd.Series]):
+    """Answer from the statistics where they hold it, else with one pass over the column."""
+    kind = (stats or {}).get("kind")
+    if op in ("mean", "sum", "median") and stats and kind != "numeric":
+        return None
+    if op in ("max", "min") and stats and kind not in ("numeric", "datetime"):
+        return None
+    dates_only = op in _DATE_OPERATIONS
+    if dates_only:
+        if stats and kind != "datetime":
+            return None
+        op = _DATE_OPERATIONS[op]
+    if stats:
+        if op == "count":
+            return stats["count"]
+        if op in ("max", "min", "mean", "sum") and op in stats:
+            return stats[op]
+        if op == "distinct" and stats.get("distinct") is not None:
+            return stats["distinct"]
+        if op == "mode" and stats.get("top"):
+            return stats["top"][0]["value"]
+    s = load_column()
+    if dates_only and not pd.api.types.is_datetime64_any_dtype(s.dtype):
+        return None
+    if op == "mode":
+        counts = s.value_counts()
+        return counts.index[0] if len(counts) else None
+    if op in ("mean", "sum", "median", "max", "min") and not pd.api.types.is_numeric_dtype(s.dtype) \
+            and not (op in ("max", "min") and pd.api.types.is_datetime64_any_dtype(s.dtype)):
+        return None
+    value = getattr(s, _CODE[op].rstrip("()"))()
+    return value.item() if hasattr(value, "item") else value
+
+
+def answer_from_stats(question: str, meta: Dict, load_df: Callable[[], pd.DataFrame]) -> Optional[Dict]:
+    """
+    Answer a simple aggregate question about one tabular document without the
+    LLM. `meta` is the document's tabular_schema.json entry. `load_df` is only
+    called when the statistics are not enough. Returns a scalar result like
+    run_document_query, or None if the question is not a simple aggregate.
+    """
+    q = _normalise_question(question)
+    shape = meta.get("shape") or [None, None]
+    if _ROWS_Q.search(q) and not _NOT_SIMPLE.search(_ROWS_Q.sub("", q)) and shape[0] is not None:
+        return {"type": "scalar", "data": str(shape[0]), "code": "len(df)", "fast_path": True,
+                "summary": f"The table has **{_format(shape[0])}** rows."}
+    if _COLUMNS_Q.search(q) and not _NOT_SIMPLE.search(_COLUMNS_Q.sub("", q)) and shape[1] is not None:
+        return {"type": "scalar", "data": str(shape[1]), "code": "len(df.columns)", "fast_path": True,
+                "summary": f"The table has **{shape[1]}** columns: {', '.join(map(str, meta.get('columns', [])))}."}
+    if _NOT_SIMPLE.search(q) or _SCOPED.search(q):
+        return None
+
+    ops = [name for name, pattern in _OPERATIONS if re.search(pattern, q)]
+    # A count phrase next to another aggregate ("how many people earn the max salary") counts rows
+    if _COUNT_Q.search(q) and any(name not in ("count", "distinct") for name in ops):
+        return None
+    op = ops[0] if ops else None
+    column = _find_column(q, meta.get("columns", [])) if op else None
+    if column is None:
+        return None
+    value = _compute(op, (meta.get("column_stats") or {}).get(column), lambda: load_df()[column])
+    if value is None:
+        return None
+    value = value.isoformat() if isinstance(value, pd.Timestamp) else value
+    return {
+        "type": "scalar",
+        "data": str(value),
+        "code": f"df[{column!r}].{_CODE[op]}",
+        "fast_path": True,
+        "summary": f"The {_LABELS[op]} **{column}** is **{_format(value)}**.",
+    }
@@ -1,36 +1,331 @@
 from langchain_chroma import Chroma
-from langchain_community.embeddings import OllamaEmbeddings
+from collections import OrderedDict
 import os
+import uuid
+import hashlib
+import threading
+
+from filelock import FileLock
+
+from utils.embeddings import CachedQueryEmbeddings, OllamaBatchEmbeddings
 
 OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+VECTOR_STORE_CACHE_SIZE = int(os.getenv("VECTOR_STORE_CACHE_SIZE", 16))
+
+# Write counter bumped after every write so other processes (ingestion workers
+# vs. the API) notice their cached handle is stale.
+_GENERATION_FILE = ".generation"
+# Held across every write and every reopen: chromadb's embedded client is not
+# safe for concurrent writers in several processes.
+_WRITE_LOCK_FILE = ".write.lock"
+# Append-only tally of deleted vectors since the last compaction
+_DELETIONS_FILE = ".deletions"
+_COMPACT_BATCH = 1000
+
+_embedding_fn = None
+_stores: "OrderedDict[str, tuple]" = OrderedDict()
+_stores_lock = threading.Lock()
+_write_locks: dict = {}
+_write_locks_lock = threading.Lock()
 
 
 def _embedding():
-    return OllamaEmbeddings(model="nomic-embed-text", base_url=OLLAMA_HOST)
+    global _embedding_fn
+    if _embedding_fn is None:
+        _embedding_fn = CachedQueryEmbeddings(
+            OllamaBatchEmbeddings(model="nomic-embed-text", base_url=OLLAMA_HOST),
+            model_name="nomic-embed-text",
+        )
+    return _embedding_fn
+
+
+def query_embedding_cache_stats() -> dict:
+    """Hit/miss counters of the query-embedding cache used by chat and search."""
+    return _embedding().stats()
+
+
+def _write_lock(persist_directory: str) -> FileLock:
+    """Cross-process lock of one store; re-entrant within a thread."""
+    key = os.path.abspath(persist_directory)
+    with _write_locks_lock:
+        lock = _write_locks.get(key)
+        if lock is None:
+            os.makedirs(key, exist_ok=True)
+            lock = _write_locks[key] = FileLock(os.path.join(key, _WRITE_LOCK_FILE))
+    return lock
+
 
-def create_vector_store(documents, persist_directory="dbv1/chroma_db"):
+def _generation(persist_directory: str) -> int:
+    try:
+        with open(os.path.join(persist_directory, _GENERATION_FILE), "r", encoding="utf-8") as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def _bump_generation(persist_directory: str) -> int:
+    """Advance the store's write counter. Call with its write lock held."""
+    generation = _generation(persist_directory) + 1
+    marker = os.path.join(persist_directory, _GENERATION_FILE)
+    tmp = f"{marker}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(str(generation))
+    os.replace(tmp, marker)
+    return generation
+
+
+def create_vector_store(documents, persist_directory="dbv1/chroma_db", stats: dict = None):
+    """
+    Embed `documents` in batches and add them to the store. If `stats` is given
+    it is filled with embedding throughput figures for the vectorization metrics.
+    """
     os.makedirs(persist_directory, exist_ok=True)
+    if not documents:
+        return load_vector_store(persist_directory=persist_directory)
+    texts = [d.page_content for d in documents]
+    vectors, embed_stats = _embedding().embed_documents_with_stats(texts)
+    store = add_vectors(
+        persist_directory,
+        ids=[getattr(d, "id", None) or str(uuid.uuid4()) for d in documents],
+        embeddings=vectors,
+        metadatas=[d.metadata for d in documents],
+        documents=texts,
+    )
+    if stats is not None:
+        stats.update(embed_stats)
+    return store
+
+def chunk_vector_id(document_id: int, document, seen: dict = None) -> str:
+    """
+    Deterministic vector id for a chunk: the document id plus a hash of the
+    chunk's source content (its `original_content` metadata) and of the text
+    that gets embedded, so a chunk whose summary changed is embedded again.
+    `seen` counts repeats so identical chunks within one document stay distinct.
+    """
+    source = (document.metadata or {}).get("original_content") or ""
+    digest = hashlib.sha256(f"{source}\0{document.page_content}".encode("utf-8")).hexdigest()[:32]
+    vector_id = f"doc{document_id}-{digest}"
+    if seen is not None:
+        n = seen.get(vector_id, 0)
+        seen[vector_id] = n + 1
+        if n:
+            vector_id = f"{vector_id}-{n}"
+    return vector_id
+
+def document_vector_ids(persist_directory, document_id: int) -> set:
     store = load_vector_store(persist_directory=persist_directory)
-    if documents:
-        store.add_documents(documents)
+    return set(store._collection.get(where={"document_id": document_id}, include=[])["ids"])
+
+def upsert_chunks(documents, persist_directory, document_id: int, existing: set, seen: dict,
+                  stats: dict = None, embeddings=None) -> list:
+    """
+    Store `documents` under deterministic ids. Chunks already present in
+    `existing` only get their metadata refreshed; the rest are embedded (or use
+    the given `embeddings`) and added. Returns the ids written.
+    """
+    os.makedirs(persist_directory, exist_ok=True)
+    ids = [chunk_vector_id(document_id, d, seen) for d in documents]
+    fresh = [i for i, vector_id in enumerate(ids) if vector_id not in existing]
+    kept = [i for i, vector_id in enumerate(ids) if vector_id in existing]
+    texts = [documents[i].page_content for i in fresh]
+    vectors, embed_stats = [], {}
+    if fresh:
+        # Embed before taking the write lock so workers only queue for the write itself
+        if embeddings is not None:
+            vectors = [embeddings[i] for i in fresh]
+        else:
+            vectors, embed_stats = _embedding().embed_documents_with_stats(texts)
+    with _write_lock(persist_directory):
+        store = load_vector_store(persist_directory=persist_directory)
+        if kept:
+            store._collection.update(ids=[ids[i] for i in kept], metadatas=[documents[i].metadata for i in kept])
+        if fresh:
+            add_vectors(persist_directory, ids=[ids[i] for i in fresh], embeddings=vectors,
+                        metadatas=[documents[i].metadata for i in fresh], documents=texts)
+        elif kept:
+            _touch(persist_directory, store)
+    if stats is not None:
+        stats.update(embed_stats)
+    if stats is not None:
+        stats["chunks_embedded"] = stats.get("chunks_embedded", 0) + len(fresh)
+        stats["chunks_unchanged"] = stats.get("chunks_unchanged", 0) + len(kept)
+    return ids
+
+def delete_vectors(persist_directory, ids) -> int:
+    ids = list(ids)
+    if not ids:
+        return 0
+    with _write_lock(persist_directory):
+        store = load_vector_store(persist_directory=persist_directory)
+        store._collection.delete(ids=ids)
+        _record_deletions(persist_directory, len(ids))
+        _touch(persist_directory, store)
+    return len(ids)
+
+def delete_document_vectors(persist_directory, document_id: int) -> int:
+    """Remove every vector whose `document_id` metadata matches. Returns how many were removed."""
+    if not os.path.isdir(persist_directory):
+        return 0
+    return delete_vectors(persist_directory, document_vector_ids(persist_directory, document_id))
+
+def _record_deletions(persist_directory, n: int):
+    path = os.path.join(persist_directory, _DELETIONS_FILE)
+    try:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(f"{n}\n")
+    except OSError:
+        pass
+
+def deletions_since_compaction(persist_directory) -> int:
+    try:
+        with open(os.path.join(persist_directory, _DELETIONS_FILE), "r", encoding="utf-8") as f:
+            return sum(int(line) for line in f if line.strip())
+    except (OSError, ValueError):
+        return 0
+
+def compact_vector_store(persist_directory) -> dict:
+    """
+    Reclaim index space left by deletions: copy the live vectors into a fresh
+    collection, drop the old one and give the new one its name. Callers must
+    make sure no ingestion job for this project is running meanwhile.
+    """
+    with _write_lock(persist_directory):
+        return _compact_locked(persist_directory)
+
+def _compact_locked(persist_directory) -> dict:
+    store = load_vector_store(persist_directory=persist_directory)
+    client, old = store._client, store._collection
+    name = old.name
+    live = old.count()
+    tmp_name = f"{name}__compact"
+    try:
+        client.delete_collection(tmp_name)
+    except Exception:
+        pass
+    fresh = client.create_collection(tmp_name, metadata=old.metadata or {"hnsw:space": "cosine"})
+    for offset in range(0, live, _COMPACT_BATCH):
+        batch = old.get(limit=_COMPACT_BATCH, offset=offset, include=["embeddings", "metadatas", "documents"])
+        if batch["ids"]:
+            fresh.add(ids=batch["ids"], embeddings=batch["embeddings"],
+                      metadatas=batch["metadatas"], documents=batch["documents"])
+    client.delete_collection(name)
+    fresh.modify(name=name)
+    reclaimed = deletions_since_compaction(persist_directory)
+    try:
+        os.remove(os.path.join(persist_directory, _DELETIONS_FILE))
+    except OSError:
+        pass
+    invalidate_vector_store(persist_directory)
+    _bump_generation(persist_directory)
+    return {"vectors": live, "deletions_reclaimed": reclaimed}
+
+def sync_document_vectors(documents, persist_directory, document_id: int, stats: dict = None, embeddings=None):
+    """
+    Make the store hold exactly `documents` for `document_id`: new or changed
+    chunks are embedded, unchanged ones are kept, removed ones are deleted.
+    """
+    existing = document_vector_ids(persist_directory, document_id)
+    written = upsert_chunks(documents, persist_directory, document_id, existing, {}, stats=stats, embeddings=embeddings)
+    deleted = delete_vectors(persist_directory, existing - set(written))
+    if stats is not None:
+        stats["chunks_deleted"] = deleted
+    return load_vector_store(persist_directory=persist_directory)
+
+def _touch(persist_directory, store):
+    """Record a write made through `store`. Call with the store's write lock held."""
+    generation = _bump_generation(persist_directory)
+    # Our own handle already sees the write; don't reopen it on next load.
+    with _stores_lock:
+        key = os.path.abspath(persist_directory)
+        if key in _stores:
+            _stores[key] = (store, generation)
+
+def add_vectors(persist_directory, ids, embeddings, metadatas, documents):
+    """Add precomputed embeddings to the store and mark it as changed."""
+    os.makedirs(persist_directory, exist_ok=True)
+    with _write_lock(persist_directory):
+        store = load_vector_store(persist_directory=persist_directory)
+        if not ids:
+            return store
+        store._collection.add(ids=ids, embeddings=embeddings, metadatas=metadatas, documents=documents)
+        _touch(persist_directory, store)
     return store
 
+def get_document_vectors(persist_directory, document_id: int) -> dict:
+    """Stored embeddings, metadata and texts of one document's chunks."""
+    store = load_vector_store(persist_directory=persist_directory)
+    return store._collection.get(
+        where={"document_id": document_id},
+        include=["embeddings", "metadatas", "documents"],
+    )
+
+def _drop_chroma_system(key: str):
+    """
+    Forget chromadb's shared System for the store at absolute path `key`.
+    chromadb keeps one System per path for the life of the process and hands it
+    to every new client, index and all, so without this a reopened handle would
+    still not see what other processes wrote. Handles already in use keep the
+    old System until they are released.
+    """
+    try:
+        from chromadb.api.shared_system_client import SharedSystemClient
+    except ImportError:
+        return
+    systems = SharedSystemClient._identifier_to_system
+    for identifier in list(systems):
+        if os.path.abspath(identifier) == key:
+            systems.pop(identifier, None)
+
 def load_vector_store(persist_directory="dbv1/chroma_db"):
+    """
+    Return an open Chroma store for `persist_directory`.
+    Handles are kept in a process-wide LRU (VECTOR_STORE_CACHE_SIZE entries).
+    When another process has written to the store since (its generation
+    changed), chromadb's cached System is dropped and the store reopened from
+    disk, so the new handle serves the current index. Reopening waits for any
+    write in progress, so it never loads a half-persisted index.
+    """
     os.makedirs(persist_directory, exist_ok=True)
-    return Chroma(
-        embedding_function=_embedding(),
-        persist_directory=persist_directory,
-        collection_metadata={"hnsw:space": "cosine"},
-    )
+    key = os.path.abspath(persist_directory)
+    with _stores_lock:
+        cached = _stores.get(key)
+        if cached is not None and cached[1] == _generation(persist_directory):
+            _stores.move_to_end(key)
+            return cached[0]
+    # Lock order: store write lock, then _stores_lock (writers call back in here)
+    with _write_lock(persist_directory), _stores_lock:
+        generation = _generation(persist_directory)
+        cached = _stores.get(key)
+        if cached is not None and cached[1] == generation:
+            _stores.move_to_end(key)
+            return cached[0]
+        _stores.pop(key, None)
+        _drop_chroma_system(key)
+        store = Chroma(
+            embedding_function=_embedding(),
+            persist_directory=persist_directory,
+            collection_metadata={"hnsw:space": "cosine"},
+        )
+        _stores[key] = (store, generation)
+        while len(_stores) > max(1, VECTOR_STORE_CACHE_SIZE):
+            evicted, _ = _stores.popitem(last=False)
+            _drop_chroma_system(evicted)
+    return store
+
+def invalidate_vector_store(persist_directory="dbv1/chroma_db"):
+    """Drop the cached handle for `persist_directory` (e.g. before deleting it)."""
+    key = os.path.abspath(persist_directory)
+    with _stores_lock:
+        _stores.pop(key, None)
+        _drop_chroma_system(key)
 
 def count_vectors(persist_directory="dbv1/chroma_db"):
     """
     Best-effort count of vectors stored in the Chroma collection.
+    Asks the collection for its cardinality instead of fetching every record.
     """
     try:
         store = load_vector_store(persist_directory=persist_directory)
-        data = store.get()
-        ids = data.get("ids") if isinstance(data, dict) else None
-        return len(ids) if ids is not None else 0
+        return int(store._collection.count())
     except Exception:
         return 0
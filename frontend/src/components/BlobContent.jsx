@@ -0,0 +1,56 @@
+import React, { useEffect, useState } from 'react'
+import api from '../api/axios'
+
+// Chunk payloads (images, table HTML) live in the backend blob store and are
+// only fetched when a source is actually rendered. Refs are content hashes, so
+// a fetched payload never goes stale and is shared by every component using it.
+const cache = new Map()
+
+function fetchBlob(url, responseType) {
+  const key = `${responseType}:${url}`
+  if (!cache.has(key)) {
+    const pending = api.get(url, { responseType }).then(res =>
+      responseType === 'blob' ? URL.createObjectURL(res.data) : res.data
+    )
+    pending.catch(() => cache.delete(key))
+    cache.set(key, pending)
+  }
+  return cache.get(key)
+}
+
+// `src` is either an inline data: URL (legacy chunks) or a blob API path
+export function BlobImage({ src, alt = '', ...props }) {
+  const inline = !src || src.startsWith('data:')
+  const [url, setUrl] = useState(inline ? src : null)
+
+  useEffect(() => {
+    if (inline) {
+      setUrl(src)
+      return
+    }
+    let alive = true
+    fetchBlob(src, 'blob').then(u => { if (alive) setUrl(u) }).catch(() => {})
+    return () => { alive = false }
+  }, [src, inline])
+
+  if (!url) return null
+  return <img src={url} alt={alt} {...props} />
+}
+
+// Pass `html` for inline tables or `src` to fetch the table from the blob store
+export function BlobHtml({ html, src, ...props }) {
+  const [content, setContent] = useState(html ?? null)
+
+  useEffect(() => {
+    if (html != null || !src) {
+      setContent(html ?? null)
+      return
+    }
+    let alive = true
+    fetchBlob(src, 'text').then(t => { if (alive) setContent(t) }).catch(() => {})
+    return () => { alive = false }
+  }, [html, src])
+
+  if (content == null) return null
+  return <div {...props} dangerouslySetInnerHTML={{ __html: content }} />
+}
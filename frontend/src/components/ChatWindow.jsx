@@ -5,6 +5,9 @@ import api from '../api/axios'
 import { SemanticResults } from './SemanticResults'
 import { SourcesDropdown } from './SourcesDropdown'
 
+// Must match SOURCES_SEPARATOR in backend/routes/conversations.py
+const SOURCES_SEPARATOR = '\u001e'
+
 function TabularResult({ tabular }) {
   const t = tabular
   const isScalar = t.scalar
@@ -177,7 +180,6 @@ export function ChatWindow({ projectId, chatId, title, subtitle = 'Project Chat'
       alert("Please upload documents before chatting.")
       return
     }
-    const isGreeting = ['hi','hello','hey','hlo'].includes(text.toLowerCase().trim())
 
     const userMsgId = Date.now()
     setMessages((prev) => [...prev, { id: userMsgId, role: 'user', content: text }])
@@ -218,13 +220,25 @@ export function ChatWindow({ projectId, chatId, title, subtitle = 'Project Chat'
               m.id === assistantMsgId ? { ...m, content: '⏳ Computing result...' } : m
             ))
           } else {
+            const answer = rawBuffer.split(SOURCES_SEPARATOR)[0]
             setMessages((prev) => prev.map((m) =>
-              m.id === assistantMsgId ? { ...m, content: m.content + chunk } : m
+              m.id === assistantMsgId ? { ...m, content: answer } : m
             ))
           }
         }
       }
 
+      // The answer is trailed by the sources it was grounded on
+      const sepIdx = rawBuffer.indexOf(SOURCES_SEPARATOR)
+      if (sepIdx >= 0) {
+        try {
+          const sources = JSON.parse(rawBuffer.slice(sepIdx + 1))
+          setMessages((prev) => prev.map((m) =>
+            m.id === assistantMsgId ? { ...m, semantic: sources } : m
+          ))
+        } catch (_) {}
+      }
+
       // Parse tabular payload if present
       if (rawBuffer.startsWith('__TABULAR__')) {
         try {
@@ -249,19 +263,6 @@ export function ChatWindow({ projectId, chatId, title, subtitle = 'Project Chat'
     } finally {
       setLoading(false)
       setMessages((prev) => prev.map(m => m.id === assistantMsgId ? { ...m, isStreaming: false } : m))
-      try {
-        if (!isGreeting) {
-          const res = await api.post(`/projects/${projectId}/search`, { query: text })
-          setMessages((prev) => prev.map(m => {
-            if (m.id !== assistantMsgId) return m
-            // Don't overwrite tabular semantic data
-            if (m.semantic?.tabular) return m
-            return { ...m, semantic: res.data }
-          }))
-        }
-      } catch (err) {
-        console.error('semantic search error', err)
-      }
     }
   }
 
@@ -320,7 +321,9 @@ export function ChatWindow({ projectId, chatId, title, subtitle = 'Project Chat'
                 score: r.score ?? null,
                 text: r.text || '',
                 images: Array.isArray(r.images_base64) ? r.images_base64.map(b => `data:image/png;base64,${b}`) : [],
-                tables: r.tables_html || []
+                tables: r.tables_html || [],
+                image_urls: r.image_urls || [],
+                table_urls: r.table_urls || []
               }))
               return (
                 <div style={{ marginLeft: '44px', marginTop: '-12px', marginBottom: '16px' }}>
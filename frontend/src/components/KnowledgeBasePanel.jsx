@@ -82,6 +82,17 @@ export function KnowledgeBasePanel({ projectId, documents, setDocuments, collaps
     }
   }
 
+  const deleteDoc = async (e, doc) => {
+    e.stopPropagation()
+    if (!window.confirm(`Delete "${doc.name || doc.filename}" from this project?`)) return
+    try {
+      await api.delete(`/projects/${projectId}/documents/${doc.id}`)
+      setDocuments(prev => prev.filter(d => d.id !== doc.id))
+    } catch (err) {
+      console.error('Delete failed:', err)
+    }
+  }
+
   const handleDocClick = (doc) => {
     if (doc.id?.toString().startsWith('temp-')) return;
     setSelectedDoc(doc);
@@ -182,6 +193,13 @@ export function KnowledgeBasePanel({ projectId, documents, setDocuments, collaps
                       title="Retry processing"
                     >↺</button>
                   )}
+                  {i.status?.toLowerCase() !== 'processing' && !i.id?.toString().startsWith('temp-') && (
+                    <button
+                      className="deleteDocBtn"
+                      onClick={(e) => deleteDoc(e, i)}
+                      title="Delete document"
+                    >×</button>
+                  )}
                 </div>
               </div>
             ))}
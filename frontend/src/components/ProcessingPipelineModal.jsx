@@ -1,6 +1,8 @@
 import React, { useState, useEffect, useRef, useCallback } from 'react';
 import api from '../api/axios';
 
+const TABULAR_PAGE_SIZE = 100;
+
 export function ProcessingPipelineModal({ open, onClose, document, projectId }) {
   const [activeTab, setActiveTab] = useState('queued');
   const [metrics, setMetrics] = useState(null);
@@ -11,6 +13,7 @@ export function ProcessingPipelineModal({ open, onClose, document, projectId })
   const [tabularData, setTabularData] = useState(null);
   const [tabularSearch, setTabularSearch] = useState('');
   const [tabularSort, setTabularSort] = useState({ key: null, dir: 'asc' });
+  const [tabularPage, setTabularPage] = useState(0);
   const dialogRef = useRef(null);
 
   const isTabular = metrics?.partitioning?.rows !== undefined;
@@ -48,13 +51,22 @@ export function ProcessingPipelineModal({ open, onClose, document, projectId })
     }
   }, [isTabular, activeTab]);
 
+  // Filtering, sorting and paging run on the server; only the visible page is fetched
   const fetchTabularData = useCallback(async () => {
     if (!document?.id) return;
     try {
-      const res = await api.get(`/projects/${projectId}/documents/${document.id}/tabular-data`);
+      const res = await api.get(`/projects/${projectId}/documents/${document.id}/tabular-data`, {
+        params: {
+          offset: tabularPage * TABULAR_PAGE_SIZE,
+          limit: TABULAR_PAGE_SIZE,
+          q: tabularSearch || undefined,
+          sort: tabularSort.key || undefined,
+          desc: tabularSort.dir === 'desc',
+        },
+      });
       setTabularData(res.data);
     } catch (_) {}
-  }, [document, projectId]);
+  }, [document, projectId, tabularPage, tabularSearch, tabularSort]);
 
   const fetchChunks = useCallback(async () => {
     if (!document?.id) return;
@@ -87,12 +99,59 @@ export function ProcessingPipelineModal({ open, onClose, document, projectId })
     }
   }, [document, projectId]);
 
+  // Progress is pushed over server-sent events; polling is only the fallback
+  // for when the stream cannot be opened or drops before the job ends.
+  useEffect(() => {
+    if (!open || !document?.id) return;
+    const controller = new AbortController();
+    let pollInterval = null;
+    const startPolling = () => {
+      if (!pollInterval && !controller.signal.aborted) pollInterval = setInterval(fetchMetrics, 2000);
+    };
+
+    const stream = async () => {
+      const token = localStorage.getItem('token');
+      const res = await fetch(`${api.defaults.baseURL}/projects/${projectId}/documents/${document.id}/metrics/stream`, {
+        headers: token ? { 'X-Session-Id': token } : {},
+        signal: controller.signal,
+      });
+      if (!res.ok || !res.body) throw new Error('Metrics stream unavailable');
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let sep;
+        while ((sep = buffer.indexOf('\n\n')) >= 0) {
+          const block = buffer.slice(0, sep);
+          buffer = buffer.slice(sep + 2);
+          const event = (block.match(/^event: (.*)$/m) || [])[1];
+          const data = (block.match(/^data: (.*)$/m) || [])[1];
+          if (!event || !data) continue;
+          const payload = JSON.parse(data);
+          setMetrics(prev => (event === 'done' ? payload : { ...prev, ...payload }));
+          if (event === 'done') return true;
+        }
+      }
+      return false;
+    };
+
+    stream()
+      .then(finished => { if (!finished) startPolling(); })
+      .catch(() => startPolling());
+
+    return () => {
+      controller.abort();
+      if (pollInterval) clearInterval(pollInterval);
+    };
+  }, [open, document, projectId, fetchMetrics]);
+
   useEffect(() => {
     if (open) {
       setTimeout(() => dialogRef.current?.classList.add('modalOpen'), 10);
-      setTimeout(() => { fetchMetrics(); }, 0);
-      const interval = setInterval(fetchMetrics, 2000);
-      
+
       // Fetch chunks periodically if we are on the 'view' tab or if processing is advanced
       const chunksInterval = setInterval(() => {
         if (activeTab === 'view' || metrics?.chunking?.status === 'completed') {
@@ -101,7 +160,6 @@ export function ProcessingPipelineModal({ open, onClose, document, projectId })
       }, 3000);
 
       return () => {
-        clearInterval(interval);
         clearInterval(chunksInterval);
       };
     } else {
@@ -113,15 +171,17 @@ export function ProcessingPipelineModal({ open, onClose, document, projectId })
         setTabularData(null);
         setTabularSearch('');
         setTabularSort({ key: null, dir: 'asc' });
+        setTabularPage(0);
       }, 0);
     }
   }, [open, activeTab, metrics?.chunking?.status, fetchChunks, fetchMetrics]);
 
   useEffect(() => {
-    if (open && activeTab === 'view_data' && !tabularData) {
-      fetchTabularData();
-    }
-  }, [open, activeTab, tabularData, fetchTabularData]);
+    if (!open || activeTab !== 'view_data') return;
+    // Debounce typing in the search box
+    const timer = setTimeout(fetchTabularData, 250);
+    return () => clearTimeout(timer);
+  }, [open, activeTab, fetchTabularData]);
 
   if (!open) return null;
 
@@ -209,6 +269,18 @@ export function ProcessingPipelineModal({ open, onClose, document, projectId })
                         <span className="elementValue">{partData.characters?.toLocaleString()}</span>
                       </div>
                     </div>
+                    {partData.real_time_factor != null && (
+                      <div className="elementsRow">
+                        <div className="elementBox">
+                          <span className="elementLabel">Real-time factor ({partData.whisper_model})</span>
+                          <span className="elementValue">{partData.real_time_factor}x</span>
+                        </div>
+                        <div className="elementBox">
+                          <span className="elementLabel">Model load</span>
+                          <span className="elementValue">{partData.model_load_seconds ? `${partData.model_load_seconds}s` : 'warm'}</span>
+                        </div>
+                      </div>
+                    )}
                   </div>
                 ) : isImage ? (
                   <div className="elementsGrid">
@@ -262,7 +334,25 @@ export function ProcessingPipelineModal({ open, onClose, document, projectId })
                         <span className="elementLabel">Other elements</span>
                         <span className="elementValue">{partData.other_elements || 0}</span>
                       </div>
+                      {partData.pages != null && (
+                        <div className="elementBox">
+                          <span className="elementLabel">Pages ({partData.partition_workers} worker{partData.partition_workers === 1 ? '' : 's'})</span>
+                          <span className="elementValue">{partData.pages} in {partData.partition_seconds}s</span>
+                        </div>
+                      )}
                     </div>
+                    {partData.hi_res_pages != null && (
+                      <div className="elementsRow">
+                        <div className="elementBox">
+                          <span className="elementLabel">Fast (text layer)</span>
+                          <span className="elementValue">{partData.fast_pages} pages</span>
+                        </div>
+                        <div className="elementBox">
+                          <span className="elementLabel">Hi-res (tables, images, scans)</span>
+                          <span className="elementValue">{partData.hi_res_pages} pages</span>
+                        </div>
+                      </div>
+                    )}
                   </div>
                 )}
                 <div className="pipelineStepStatusBadge success">
@@ -406,6 +496,14 @@ export function ProcessingPipelineModal({ open, onClose, document, projectId })
                       {v.collection_count_before ?? '—'} → {v.collection_count_after ?? '—'}
                     </span>
                   </div>
+                  {v.chunks_per_second != null && (
+                    <div className="chunkSizeInfo">
+                      <span>Throughput</span>
+                      <span>
+                        {v.chunks_per_second} chunks/s • {v.embedding_batches} batch{v.embedding_batches === 1 ? '' : 'es'} of {v.embedding_batch_size} • {v.embedding_concurrency} in flight
+                      </span>
+                    </div>
+                  )}
                   <div className="chunkSummary">
                     {v.duration_ms ? `${Math.round(v.duration_ms)} ms` : ''} indexed • started {v.started_at || '—'} • ended {v.ended_at || '—'}
                   </div>
@@ -501,23 +599,14 @@ export function ProcessingPipelineModal({ open, onClose, document, projectId })
           );
         }
         const cols = tabularData.columns || [];
-        const allRows = tabularData.records || [];
-
-        const filteredRows = tabularSearch
-          ? allRows.filter(row => cols.some(c => String(row[c] ?? '').toLowerCase().includes(tabularSearch.toLowerCase())))
-          : allRows;
-
-        const sortedRows = tabularSort.key
-          ? [...filteredRows].sort((a, b) => {
-              const av = a[tabularSort.key], bv = b[tabularSort.key];
-              if (av < bv) return tabularSort.dir === 'asc' ? -1 : 1;
-              if (av > bv) return tabularSort.dir === 'asc' ? 1 : -1;
-              return 0;
-            })
-          : filteredRows;
+        const rows = tabularData.records || [];
+        const totalRows = tabularData.shape?.[0] ?? rows.length;
+        const matchedRows = tabularData.total_rows ?? rows.length;
+        const pageCount = Math.max(1, Math.ceil(matchedRows / TABULAR_PAGE_SIZE));
 
         const handleSort = (col) => {
           setTabularSort(prev => ({ key: col, dir: prev.key === col && prev.dir === 'asc' ? 'desc' : 'asc' }));
+          setTabularPage(0);
         };
 
         return (
@@ -528,11 +617,18 @@ export function ProcessingPipelineModal({ open, onClose, document, projectId })
                 className="tabularSearchInput"
                 placeholder="Search..."
                 value={tabularSearch}
-                onChange={e => setTabularSearch(e.target.value)}
+                onChange={e => { setTabularSearch(e.target.value); setTabularPage(0); }}
               />
               <span style={{ fontSize: '11px', opacity: 0.5 }}>
-                {sortedRows.length} / {allRows.length} rows · {cols.length} cols
+                {matchedRows} / {totalRows} rows · {cols.length} cols
               </span>
+              {pageCount > 1 && (
+                <span className="tabularPager">
+                  <button disabled={tabularPage === 0} onClick={() => setTabularPage(p => p - 1)}>‹</button>
+                  <span style={{ fontSize: '11px', opacity: 0.7 }}>{tabularPage + 1} / {pageCount}</span>
+                  <button disabled={tabularPage + 1 >= pageCount} onClick={() => setTabularPage(p => p + 1)}>›</button>
+                </span>
+              )}
             </div>
             <div className="viewDataTableWrap">
               <table className="tabularTable">
@@ -549,7 +645,7 @@ export function ProcessingPipelineModal({ open, onClose, document, projectId })
                   </tr>
                 </thead>
                 <tbody>
-                  {sortedRows.map((row, ri) => (
+                  {rows.map((row, ri) => (
                     <tr key={ri} className={ri % 2 === 0 ? 'tabularRowEven' : 'tabularRowOdd'}>
                       {cols.map(c => (
                         <td key={c} className="tabularTd" title={String(row[c] ?? '')}>
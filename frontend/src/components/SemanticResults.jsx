@@ -1,4 +1,5 @@
 import React, { useMemo, useState } from 'react'
+import { BlobImage, BlobHtml } from './BlobContent'
 
 export function SemanticResults({ data }) {
   const documents = data?.documents || []
@@ -36,16 +37,21 @@ export function SemanticResults({ data }) {
                 {r.page ? <span className="semanticPage">Page {r.page}</span> : null}
               </div>
               <div className="semanticText">{r.text}</div>
-              {Array.isArray(r.images_base64) && r.images_base64.length > 0 && (
-                <div className="semanticMediaGrid">
-                  {r.images_base64.slice(0, 3).map((img, i) => (
-                    <img key={i} alt="extracted" src={`data:image/png;base64,${img}`} />
-                  ))}
-                </div>
-              )}
-              {Array.isArray(r.tables_html) && r.tables_html.length > 0 && (
-                <div className="semanticTable" dangerouslySetInnerHTML={{ __html: r.tables_html[0] }} />
-              )}
+              {(() => {
+                const images = (r.images_base64 || []).map(b64 => `data:image/png;base64,${b64}`).concat(r.image_urls || [])
+                return images.length > 0 && (
+                  <div className="semanticMediaGrid">
+                    {images.slice(0, 3).map((img, i) => (
+                      <BlobImage key={i} alt="extracted" src={img} />
+                    ))}
+                  </div>
+                )
+              })()}
+              {Array.isArray(r.tables_html) && r.tables_html.length > 0 ? (
+                <BlobHtml className="semanticTable" html={r.tables_html[0]} />
+              ) : Array.isArray(r.table_urls) && r.table_urls.length > 0 ? (
+                <BlobHtml className="semanticTable" src={r.table_urls[0]} />
+              ) : null}
             </div>
             <div className="chunkBadge">{r.chunk_id != null ? r.chunk_id + 1 : idx + 1}</div>
           </div>
@@ -1,4 +1,5 @@
 import React, { useMemo, useRef, useState, useEffect } from 'react'
+import { BlobImage, BlobHtml } from './BlobContent'
 
 export function SourcesDropdown({ sources = [] }) {
   // Dropdown open state
@@ -19,8 +20,12 @@ export function SourcesDropdown({ sources = [] }) {
       score: s.score ?? null,
       timestamp: s.timestamp ?? null,
       text: s.text || '',
-      images: Array.isArray(s.images) ? s.images : Array.isArray(s.images_base64) ? s.images_base64.map(b64 => `data:image/png;base64,${b64}`) : [],
-      tables: Array.isArray(s.tables) ? s.tables : Array.isArray(s.tables_html) ? s.tables_html : [],
+      images: (Array.isArray(s.images) ? s.images : Array.isArray(s.images_base64) ? s.images_base64.map(b64 => `data:image/png;base64,${b64}`) : [])
+        .concat(Array.isArray(s.image_urls) ? s.image_urls : []),
+      // Tables are either inline HTML (legacy chunks) or blob-store URLs fetched on demand
+      tables: (Array.isArray(s.tables) ? s.tables : Array.isArray(s.tables_html) ? s.tables_html : [])
+        .map(html => ({ html }))
+        .concat((Array.isArray(s.table_urls) ? s.table_urls : []).map(src => ({ src }))),
     }))
   }, [sources])
 
@@ -145,8 +150,8 @@ export function SourcesDropdown({ sources = [] }) {
               {s.tables && s.tables.length > 0 && (
                 <div className="srcTables">
                   <div className="srcChunkTitle">Tables</div>
-                  {s.tables.map((html, i) => (
-                    <div key={i} className="srcTableWrap" dangerouslySetInnerHTML={{ __html: html }} />
+                  {s.tables.map((t, i) => (
+                    <BlobHtml key={i} className="srcTableWrap" html={t.html} src={t.src} />
                   ))}
                 </div>
               )}
@@ -164,7 +169,7 @@ export function SourcesDropdown({ sources = [] }) {
                 onClick={() => openItem(i)}
               >
                 {item.type === 'image' ? (
-                  <img src={item.data} alt="thumbnail" />
+                  <BlobImage src={item.data} alt="thumbnail" />
                 ) : (
                   <div className="tableThumbnail">
                     <div className="tableIcon">📊</div>
@@ -181,7 +186,7 @@ export function SourcesDropdown({ sources = [] }) {
         <div className="imgModalOverlay" onClick={closeItem}>
           <div className={`imgModal ${selectedItem.type === 'table' ? 'tableModal' : ''}`} onClick={(e) => e.stopPropagation()}>
             {selectedItem.type === 'image' ? (
-              <img
+              <BlobImage
                 src={selectedItem.data}
                 alt="preview"
                 style={{ transform: `scale(${zoom})` }}
@@ -190,7 +195,7 @@ export function SourcesDropdown({ sources = [] }) {
               <div className="modalTableContainer">
                 <div className="modalTableScroll">
                    <div className="modalTableSource">📊 Source: {selectedItem.source}</div>
-                   <div className="modalTableContent" dangerouslySetInnerHTML={{ __html: selectedItem.data }} />
+                   <BlobHtml className="modalTableContent" html={selectedItem.data.html} src={selectedItem.data.src} />
                 </div>
               </div>
             )}